@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the core kernels of Renormalizer.
+
+Each benchmark case is run on a set of parameters (model, model size and bond dimension).
+The wall time (minimum over repeats) and the peak memory traced by ``tracemalloc``
+are recorded to a JSON file, and optionally compared against a baseline JSON file.
+
+Usage::
+
+    # run all the small cases and save the results
+    python run_benchmark.py -o baseline.json
+    # after upgrading, compare against the baseline. Exit code 1 if slower than 1.5x
+    python run_benchmark.py -o new.json -b baseline.json -t 1.5
+    # only run the cases with "optimize_mps" in the name on the large models
+    python run_benchmark.py -s large -k optimize_mps
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from renormalizer import Model, Mps, Mpo, Op, Quantity, optimize_mps
+from renormalizer.model import basis as ba, h_qc
+from renormalizer.mps.lib import Environ
+from renormalizer.mps.svd_qn import svd_qn
+from renormalizer.mps.symbolic_mpo import construct_symbolic_mpo, _terms_to_table
+from renormalizer.tn import BasisTree, TTNS, TTNO, optimize_ttns
+from renormalizer.utils import EvolveConfig, EvolveMethod, log
+
+
+logger = logging.getLogger("renormalizer")
+
+
+SIZES = {
+    # (name of the model, number of sites or orbitals, bond dimension)
+    "small": [("holstein", 4, 10), ("holstein", 8, 20), ("qc", 4, 20)],
+    "large": [("holstein", 16, 40), ("holstein", 32, 80), ("qc", 8, 100)],
+}
+
+
+def holstein_chain(nmols, nlevels=8):
+    # a Holstein chain with nearest-neighbour electronic coupling
+    omega = Quantity(1400, "cm^{-1}").as_au()
+    elocal = Quantity(2, "eV").as_au()
+    j = Quantity(500, "cm^{-1}").as_au()
+    g = 1
+    basis = []
+    ham_terms = []
+    for imol in range(nmols):
+        e_dof, v_dof = f"e_{imol}", f"v_{imol}"
+        basis.append(ba.BasisSimpleElectron(e_dof))
+        basis.append(ba.BasisSHO(v_dof, omega, nlevels))
+        ham_terms.append(Op(r"a^\dagger a", e_dof, elocal))
+        ham_terms.append(Op("p^2", v_dof, 0.5))
+        ham_terms.append(Op("x^2", v_dof, 0.5 * omega ** 2))
+        ham_terms.append(Op(r"a^\dagger a x", [e_dof, e_dof, v_dof], -g * omega * np.sqrt(2 * omega)))
+        if imol != nmols - 1:
+            ham_terms.append(Op(r"a^\dagger a", [e_dof, f"e_{imol+1}"], j))
+            ham_terms.append(Op(r"a^\dagger a", [f"e_{imol+1}", e_dof], j))
+    return Model(basis, ham_terms), 1
+
+
+def qc_model(spatial_norbs, seed=2023):
+    # ab initio Hamiltonian with random integrals
+    rng = np.random.default_rng(seed)
+    h = rng.uniform(-1, 1, (spatial_norbs,) * 2)
+    h = h + h.T
+    eri = rng.uniform(-1, 1, (spatial_norbs,) * 4)
+    # 8-fold symmetry
+    eri = eri + eri.transpose(1, 0, 2, 3)
+    eri = eri + eri.transpose(0, 1, 3, 2)
+    eri = eri + eri.transpose(2, 3, 0, 1)
+    h1e, h2e = h_qc.int_to_h(h, eri)
+    basis, ham_terms = h_qc.qc_model(h1e, h2e)
+    nelec = spatial_norbs // 2
+    return Model(basis, ham_terms), [nelec, nelec]
+
+
+def get_model(name, size):
+    if name == "holstein":
+        return holstein_chain(size)
+    assert name == "qc"
+    return qc_model(size)
+
+
+# registered benchmark cases. The function takes (model, qntot, m) as the input,
+# do the setup and return the function to be timed, or ``None`` if the case is not applicable.
+CASES = {}
+
+
+def case(func):
+    CASES[func.__name__] = func
+    return func
+
+
+@case
+def symbolic_mpo(model, qntot, m):
+    def run():
+        table, primary_ops, factor = _terms_to_table(model, model.ham_terms, 0)
+        construct_symbolic_mpo(table, primary_ops, factor)
+    return run
+
+
+@case
+def environ(model, qntot, m):
+    mpo = Mpo(model)
+    mps = Mps.random(model, qntot, m, percent=1.0)
+    return lambda: Environ(mps, mpo)
+
+
+@case
+def optimize_mps_sweep(model, qntot, m):
+    mpo = Mpo(model)
+    mps = Mps.random(model, qntot, m, percent=1.0)
+    mps.optimize_config.procedure = [[m, 0.4], [m, 0]]
+    mps.optimize_config.method = "2site"
+    return lambda: optimize_mps(mps.copy(), mpo)
+
+
+def _evolve_case(model, qntot, m, method):
+    mpo = Mpo(model)
+    mps = Mps.random(model, qntot, m, percent=1.0)
+    mps.evolve_config = EvolveConfig(method)
+    mps = mps.expand_bond_dimension(mpo, include_ex=False) if method == EvolveMethod.tdvp_ps else mps
+    return lambda: mps.evolve(mpo, 10)
+
+
+@case
+def tdvp_ps_step(model, qntot, m):
+    return _evolve_case(model, qntot, m, EvolveMethod.tdvp_ps)
+
+
+@case
+def tdvp_ps2_step(model, qntot, m):
+    return _evolve_case(model, qntot, m, EvolveMethod.tdvp_ps2)
+
+
+def _local_op(basis):
+    # the symbol and the number of DoFs of a local operator on the basis
+    if isinstance(basis, ba.BasisSHO):
+        return "x", 1
+    if isinstance(basis, ba.BasisHalfSpin):
+        return "Z", 1
+    return r"a^\dagger a", 2
+
+
+@case
+def expectations(model, qntot, m):
+    mps = Mps.random(model, qntot, m, percent=1.0)
+    # one-site operators on every site and two-site operators on every pair of neighbouring sites
+    ops = []
+    for b in model.basis:
+        symbol, n = _local_op(b)
+        ops.append(Op(symbol, [b.dof] * n))
+    for b1, b2 in zip(model.basis[:-1], model.basis[1:]):
+        (symbol1, n1), (symbol2, n2) = _local_op(b1), _local_op(b2)
+        ops.append(Op(f"{symbol1} {symbol2}", [b1.dof] * n1 + [b2.dof] * n2))
+    mpos = [Mpo(model, op) for op in ops]
+    return lambda: mps.expectations(mpos)
+
+
+@case
+def svd_qn_2site(model, qntot, m):
+    mps = Mps.random(model, qntot, m, percent=1.0)
+    # the two-site coefficient in the middle of the chain
+    idx = len(mps) // 2
+    mps.move_qnidx(idx)
+    coef = np.tensordot(mps[idx].array, mps[idx+1].array, axes=1)
+    qnbigl, qnbigr, _ = mps._get_big_qn([idx, idx+1])
+    qntot = mps.qntot
+    return lambda: svd_qn(coef, qnbigl, qnbigr, qntot, system="L", full_matrices=False)
+
+
+# the TTN cases are skipped for the models with multiple quantum numbers,
+# which are not supported by the MCTDH virtual nodes
+def _ttn_case(model, qntot, m):
+    tree = BasisTree.binary_mctdh(model.basis)
+    ttns = TTNS.random(tree, qntot, m)
+    ttno = TTNO(tree, model.ham_terms)
+    return ttns, ttno
+
+
+@case
+def optimize_ttns_sweep(model, qntot, m):
+    if model.qn_size != 1:
+        return None
+    ttns, ttno = _ttn_case(model, qntot, m)
+    # one sweep
+    procedure = [[m, 0]]
+    return lambda: optimize_ttns(ttns.copy(), ttno, procedure)
+
+
+@case
+def ttns_tdvp_ps_step(model, qntot, m):
+    if model.qn_size != 1:
+        return None
+    ttns, ttno = _ttn_case(model, qntot, m)
+    ttns.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps)
+    return lambda: ttns.evolve(ttno, 10)
+
+
+def run_case(name, model_name, size, m, repeat):
+    model, qntot = get_model(model_name, size)
+    func = CASES[name](model, qntot, m)
+    if func is None:
+        return None
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    # tracing slows down the execution considerably, so the memory is measured in a separate run
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"time": min(times), "times": times, "peak_memory": peak}
+
+
+def compare(results, baseline, tolerance, keys=None):
+    # return the list of regressions.
+    # `keys` are the cases in the scope of this run, default to all cases in the baseline.
+    # The cases in the baseline but missing from the results (failed or no longer supported)
+    # are regressions
+    regressions = []
+    if keys is None:
+        keys = baseline.keys()
+    for key in keys:
+        if key in baseline and key not in results:
+            regressions.append(key)
+            print(f"{key:60s} missing from the results <-- REGRESSION")
+    for key, res in results.items():
+        if key not in baseline:
+            continue
+        ratio = res["time"] / baseline[key]["time"]
+        mem_ratio = res["peak_memory"] / max(baseline[key]["peak_memory"], 1)
+        flag = ""
+        if tolerance < ratio or tolerance < mem_ratio:
+            regressions.append(key)
+            flag = " <-- REGRESSION"
+        print(f"{key:60s} time {ratio:6.2f}x  memory {mem_ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the core kernels of Renormalizer")
+    parser.add_argument("-s", "--size", choices=list(SIZES.keys()), default="small")
+    parser.add_argument("-k", "--filter", default=None, help="only run cases whose names contain the string")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    parser.add_argument("-b", "--baseline", default=None, help="baseline JSON file to compare against")
+    parser.add_argument("-t", "--tolerance", type=float, default=1.5,
+                        help="maximum allowed ratio of the time or memory to the baseline")
+    args = parser.parse_args(argv)
+
+    log.set_stream_level(logging.ERROR)
+
+    results = {}
+    # all cases in the scope of this run and the failed ones
+    keys = []
+    failed = []
+    for name in CASES:
+        if args.filter is not None and args.filter not in name:
+            continue
+        for model_name, size, m in SIZES[args.size]:
+            key = f"{name}[{model_name}-{size}-M{m}]"
+            keys.append(key)
+            try:
+                res = run_case(name, model_name, size, m, args.repeat)
+            except Exception:
+                logger.exception(f"Benchmark {key} failed")
+                failed.append(key)
+                continue
+            if res is None:
+                continue
+            results[key] = res
+            print(f"{key:60s} {results[key]['time']:10.4f} s {results[key]['peak_memory'] / 2**20:10.2f} MiB")
+
+    output = {
+        "meta": {
+            "date": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "size": args.size,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as fout:
+        json.dump(output, fout, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)["results"]
+        regressions = compare(results, baseline, args.tolerance, keys)
+        if regressions:
+            print(f"{len(regressions)} regressions found")
+            return 1
+    if failed:
+        print(f"{len(failed)} cases failed: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 # Author: Tong Jiang <tongjiang1000@gmail.com>
 # correction vector base
+import os
+import pickle
+import tempfile
 import numpy as np
 from multiprocessing import Pool
 import multiprocessing
@@ -14,35 +17,140 @@ from typing import List
 
 logger = logging.getLogger(__name__)
 
-def batch_run(freq_reg, cores, obj, filename=None):
+def _dump_shared_state(obj, directory):
+    """
+    Dump the object into ``directory``. The arrays (MPOs, ground state or thermal state, etc.)
+    are pickled out-of-band into a single binary file, so that they can be memory-mapped by
+    the worker processes instead of being copied into each worker.
+    """
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+    offsets = []
+    offset = 0
+    with open(os.path.join(directory, "buffers.bin"), "wb") as fout:
+        for buffer in buffers:
+            raw = buffer.raw()
+            # align the arrays
+            padding = -offset % 64
+            fout.write(b"\0" * padding)
+            offset += padding
+            fout.write(raw)
+            offsets.append((offset, offset + raw.nbytes))
+            offset += raw.nbytes
+    with open(os.path.join(directory, "obj.pickle"), "wb") as fout:
+        pickle.dump((data, offsets), fout)
+
+
+def _load_shared_state(directory):
+    with open(os.path.join(directory, "obj.pickle"), "rb") as fin:
+        data, offsets = pickle.load(fin)
+    if offsets:
+        # copy-on-write. The pages are shared by the workers until modified
+        mm = np.memmap(os.path.join(directory, "buffers.bin"), dtype=np.uint8, mode="c")
+        buffers = [mm[start:end] for start, end in offsets]
+    else:
+        buffers = []
+    return pickle.loads(data, buffers=buffers)
+
+
+# the CV object in the worker process. Loaded once per worker
+_worker_obj = None
+# the initial guess of the correction vector if not warm started
+_worker_init_cv_mps = None
+
+
+def _init_worker(directory, warm_start):
+    global _worker_obj, _worker_init_cv_mps
+    _worker_obj = _load_shared_state(directory)
+    if not warm_start:
+        _worker_init_cv_mps = _worker_obj.cv_mps.copy()
+
+
+def _solve_block(args):
+    # solve a block of neighbouring frequencies in a worker process
+    iblock, freqs, warm_start = args
+    res = []
+    for omega in freqs:
+        # if `warm_start`, the converged correction vector of the previous frequency
+        # is used as the initial guess
+        if not warm_start:
+            _worker_obj.cv_mps = _worker_init_cv_mps.copy()
+        res.append(_worker_obj.cv_solve(omega))
+    return iblock, res
+
+
+class _ResultWriter:
+    # write the results incrementally to a preallocated ``.npy`` file
+    def __init__(self, filename, n):
+        # the same as `np.save`, the ``.npy`` suffix is appended if missing
+        if filename is not None:
+            filename = os.fspath(filename)
+            if not filename.endswith(".npy"):
+                filename += ".npy"
+        self.filename = filename
+        self.n = n
+        self.array = None
+
+    def write(self, idx, res):
+        if self.filename is None:
+            return
+        if self.array is None:
+            res_array = np.asarray(res)
+            self.array = np.lib.format.open_memmap(self.filename, mode="w+",
+                dtype=np.result_type(res_array.dtype, np.float64), shape=(self.n, ) + res_array.shape)
+            self.array[:] = np.nan
+        self.array[idx] = res
+        self.array.flush()
+
+
+def batch_run(freq_reg, cores, obj, filename=None, warm_start=True, block_size=None):
     """
     batch run of cv calculation
     freq_reg: list object, frequecny windown
     cores: number of cores to be used in multiprocessing calculation
     obj: SpectraZtCV or SpectraFtCV
+    filename: the ``.npy`` file to save the spectra. As in ``np.save``, the ``.npy`` suffix
+        is appended if missing. The results are written
+        incrementally and the unfinished frequencies are ``nan``.
+    warm_start: use the correction vector of the previous frequency as the initial guess
+    block_size: number of neighbouring frequencies solved successively by a worker.
+        The blocks are dynamically scheduled to the workers.
+        Default: ``len(freq_reg) // (4 * cores)``
     """
     logger.info(f"{len(freq_reg)} total frequency points to do")
-    spectra = []
+    spectra = [None] * len(freq_reg)
+    writer = _ResultWriter(filename, len(freq_reg))
     obj.batch_run = True
 
     if cores > 1:
         # multiprocessing
+        if block_size is None:
+            block_size = max(1, len(freq_reg) // (4 * cores))
+        blocks = [freq_reg[i:i+block_size] for i in range(0, len(freq_reg), block_size)]
         if importlib.util.find_spec("cupy"):
             multiprocessing.set_start_method('forkserver', force=True)
-        pool = Pool(processes=cores)
-        logger.info(f"{cores} multiprocess parallelization activated")
-        for i_spec in pool.imap(obj.cv_solve, freq_reg):
-            spectra.append(i_spec)
-            if filename is not None:
-                np.save(f"{filename}", spectra)
-        pool.close()
-        pool.join()
+        with tempfile.TemporaryDirectory(prefix="reno_cv_") as directory:
+            # the shared state is loaded once per worker rather than pickled for each frequency
+            _dump_shared_state(obj, directory)
+            pool = Pool(processes=cores, initializer=_init_worker, initargs=(directory, warm_start))
+            logger.info(f"{cores} multiprocess parallelization activated. {len(blocks)} blocks of frequencies")
+            tasks = [(iblock, block, warm_start) for iblock, block in enumerate(blocks)]
+            for iblock, block_res in pool.imap_unordered(_solve_block, tasks):
+                for i, i_spec in enumerate(block_res):
+                    idx = iblock * block_size + i
+                    spectra[idx] = i_spec
+                    writer.write(idx, i_spec)
+            pool.close()
+            pool.join()
     elif cores == 1:
         # single process
-        for omega in freq_reg:
-            spectra.append(obj.cv_solve(omega))
-            if filename is not None:
-                np.save(f"{filename}", spectra)
+        if not warm_start:
+            init_cv_mps_bk = obj.cv_mps.copy()
+        for idx, omega in enumerate(freq_reg):
+            if not warm_start:
+                obj.cv_mps = init_cv_mps_bk.copy()
+            spectra[idx] = obj.cv_solve(omega)
+            writer.write(idx, spectra[idx])
     else:
         assert False
 
@@ -158,6 +266,7 @@ class SpectraCv(object):
                 logger.debug(f"omega:{omega}, isweep:{isweep}, isite:{isite}, response result:{micro_iteration_result[-1]}")
             
             self.cv_mps.to_right = not self.cv_mps.to_right
+            self.sweep_finished(lr_group)
 
             self.macro_iteration_result.append(max(micro_iteration_result))
             if (idx > 0) and procedure == 0:
@@ -202,3 +311,7 @@ class SpectraCv(object):
 
     def update_LR(self, lrgroup, isite):
         raise NotImplementedError
+
+    def sweep_finished(self, lr_group):
+        # called after each complete sweep, when the environments are consistent with cv_mps
+        pass
@@ -9,9 +9,9 @@ from renormalizer.mps import Mpo
 from renormalizer.cv import batch_run
 from renormalizer.cv.zerot import SpectraZtCV
 from renormalizer.cv.finitet import SpectraFtCV
-from renormalizer.tests.parameter import holstein_model, holstein_model4
+from renormalizer.tests.parameter import holstein_model, holstein_model4, custom_model
 from renormalizer.cv.tests import cur_dir
-from renormalizer.utils import Quantity
+from renormalizer.utils import Quantity, constant
 
 
 
@@ -46,3 +46,43 @@ def test_ft_abs(model):
                           10, 5.e-3, T, h_mpo, rtol=1e-3)
     result = batch_run(test_freq, 1, spectra)
     assert np.allclose(result, standard_value, rtol=1.e-2)
+
+
+def test_batch_run_blocks(tmpdir):
+    freq_reg = np.arange(0.08, 0.0804, 1.e-4).tolist()
+    spectra = SpectraZtCV(holstein_model, "abs", 10, 5.e-5, rtol=1e-3)
+    fname = os.path.join(tmpdir, "spectra.npy")
+    result1 = batch_run(freq_reg, 2, spectra, filename=fname, block_size=2)
+    assert np.allclose(np.load(fname), result1)
+    result2 = batch_run(freq_reg, 1, spectra, filename=os.path.join(tmpdir, "spectra2"), warm_start=False)
+    assert np.allclose(result1, result2, rtol=1.e-2)
+    # the suffix is appended as `np.save`
+    assert np.allclose(np.load(os.path.join(tmpdir, "spectra2.npy")), result2)
+
+
+@pytest.mark.parametrize("method", ("1site", "2site"))
+def test_zt_abs_exact(method):
+    # the augmented MPO and the reused environments agree with
+    # the exact ((H - e0 - omega)^2 + eta^2)^{-1} for several frequencies
+    np.random.seed(2023)
+    j_matrix = np.array([[0.0, -0.1], [-0.1, 0.0]]) / constant.au2ev
+    model = custom_model(j_matrix, n_phys_dim=[2, 2], nmols=2)
+    eta = 5.e-3
+    spectra = SpectraZtCV(model, "abs", 10, eta, method=method, rtol=1e-6,
+                          procedure_gs=[[10, 0.4], [20, 0], [20, 0], [20, 0]])
+    b = spectra.b_mps.todense().ravel()
+
+    def exact(h_mpo, omega):
+        h = h_mpo.todense()
+        a = h - (spectra.e0 + omega) * np.eye(len(h))
+        a = a @ a + eta ** 2 * np.eye(len(h))
+        return (b.conj() @ np.linalg.solve(a, b)).real / (np.pi * eta)
+
+    freq_reg = [0.07, 0.075, 0.08, 0.085]
+    result = batch_run(freq_reg, 1, spectra)
+    assert np.allclose(result, [exact(spectra.h_mpo, omega) for omega in freq_reg], rtol=1e-6)
+
+    # the MPO is replaced
+    spectra.h_mpo = spectra.h_mpo.scale(1.01)
+    result = batch_run(freq_reg[:1], 1, spectra)
+    assert np.allclose(result, exact(spectra.h_mpo, freq_reg[0]), rtol=1e-6)
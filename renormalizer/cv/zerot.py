@@ -75,7 +75,13 @@ class SpectraZtCV(SpectraCv):
             rtol=rtol, b_mps=b_mps, e0=e0, cv_mps=cv_mps,
         )
 
+        # the site tensors of H_0 \oplus I. See ``oper_prepare``
         self.a_oper = None
+        # the MPO from which ``a_oper`` is constructed
+        self._a_oper_h_mpo = None
+        self.shift = None
+        # (a_oper, cv_mps, b_mps, direction of the next sweep, environments) after the last complete sweep
+        self._lr_cache = None
 
     def init_b_mps(self):
         # get the right hand site vector b, Ax=b
@@ -122,11 +128,33 @@ class SpectraZtCV(SpectraCv):
         return cv_mps
 
     def oper_prepare(self, omega):
-        # set up a_oper = (H_0 - e0 - omega)
-        identity = Mpo.identity(self.model).scale(-self.e0 - omega)
-        self.a_oper = self.h_mpo.add(identity)
+        # a_oper = (H_0 - e0 - omega) = H_0 + shift * I.
+        # The MPO of H_0 and I is stored as a block-diagonal MPO H_0 \oplus I, with the blocks
+        # summed at the boundaries. The coefficient ``shift`` only enters when the left environment
+        # is used in ``optimize_cv``, by weighting the I block of the MPO bond.
+        # So the environments are independent of omega and are reused across frequencies.
+        self.shift = -self.e0 - omega
+        if self.a_oper is None or self._a_oper_h_mpo is not self.h_mpo:
+            # ``h_mpo`` is replaced
+            self._a_oper_h_mpo = self.h_mpo
+            self.a_oper = []
+            for mo in self.h_mpo:
+                mo = asnumpy(mo.array)
+                d = mo.shape[1]
+                a_mo = np.zeros((mo.shape[0] + 1, d, d, mo.shape[-1] + 1), dtype=mo.dtype)
+                a_mo[:-1, :, :, :-1] = mo
+                a_mo[-1, :, :, -1] = np.eye(d)
+                self.a_oper.append(a_mo)
+
+    def _weight_left(self, first_L):
+        # weight the blocks of H_0 and I on the two MPO bonds of the left environment
+        weight = xp.ones(first_L.shape[1], dtype=first_L.dtype)
+        weight[-1] = self.shift
+        return first_L * weight.reshape(1, -1, 1, 1) * weight.reshape(1, 1, -1, 1)
     
     def optimize_cv(self, lr_group, isite, percent=0.0):
+        # cv_mps is going to be modified
+        self._lr_cache = None
         # depending on the spectratype, to restrict the exction
         first_LR = lr_group[0]
         second_LR = lr_group[1]
@@ -154,6 +182,7 @@ class SpectraZtCV(SpectraCv):
             first_R = asxp(first_LR[isite])
             second_L = asxp(second_LR[isite - 2])
             second_R = asxp(second_LR[isite])
+        first_L = self._weight_left(first_L)
 
         # this part just be similar with ground state calculation
         qnbigl, qnbigr, qnmat = self.cv_mps._get_big_qn(cidx)
@@ -305,15 +334,26 @@ class SpectraZtCV(SpectraCv):
     # just as in mps.lib
     # I may go back to have a try once I add the finite temeprature code
     def initialize_LR(self):
+        # The environments are consistent with cv_mps after a complete sweep.
+        # If cv_mps is not replaced since then, for example when the correction vector
+        # of the previous frequency is used as the initial guess, the environments are reused.
+        if self._lr_cache is not None:
+            a_oper, cv_mps, b_mps, to_right, lr_group = self._lr_cache
+            if a_oper is self.a_oper and cv_mps is self.cv_mps and b_mps is self.b_mps \
+                    and to_right == self.cv_mps.to_right:
+                logger.debug("Reuse the environments of the last sweep")
+                return lr_group
         # initialize the Lpart and Rpart
         first_LR = []
-        first_LR.append(np.ones((1, 1, 1, 1)))
+        # the blocks of H_0 and I are summed at the boundaries
+        dl, dr = self.a_oper[0].shape[0], self.a_oper[-1].shape[-1]
+        first_LR.append(np.ones((1, dl, dl, 1)))
         second_LR = []
         second_LR.append(np.ones((1, 1)))
         for isite in range(1, len(self.cv_mps)):
             first_LR.append(None)
             second_LR.append(None)
-        first_LR.append(np.ones((1, 1, 1, 1)))
+        first_LR.append(np.ones((1, dr, dr, 1)))
         second_LR.append(np.ones((1, 1)))
         if self.cv_mps.to_right:
             path1 = [([0, 1], "abcd, efa->bcdef"),
@@ -415,3 +455,6 @@ class SpectraZtCV(SpectraCv):
                     self.cv_mps[isite - 2]))
 
         return [first_LR, second_LR]
+
+    def sweep_finished(self, lr_group):
+        self._lr_cache = (self.a_oper, self.cv_mps, self.b_mps, self.cv_mps.to_right, lr_group)
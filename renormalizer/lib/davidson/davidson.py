@@ -23,6 +23,7 @@ Extension to scipy.linalg module
 import sys
 import warnings
 import tempfile
+import itertools
 
 import numpy
 np = numpy
@@ -74,7 +75,7 @@ def davidson(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
              lindep=DAVIDSON_LINDEP, max_memory=MAX_MEMORY,
              dot=numpy.dot, callback=None,
              nroots=1, lessio=False, pick=None, verbose=logger.WARN,
-             follow_state=FOLLOW_STATE):
+             follow_state=FOLLOW_STATE, scratch_dir=None):
     r'''Davidson diagonalization method to solve  a c = e c.  Ref
     [1] E.R. Davidson, J. Comput. Phys. 17 (1), 87-94 (1975).
     [2] http://people.inf.ethz.ch/arbenz/ewp/Lnotes/chapter11.pdf
@@ -109,7 +110,8 @@ def davidson(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
             smallest eigenvalue of the metric of the trial vectors is lower
             than this threshold.
         max_memory : int or float
-            Allowed memory in MB.
+            Allowed memory in MB.  If the trial vectors do not fit in,
+            the vectors beyond the budget are spilled to ``scratch_dir``.
         dot : function(x, y) => scalar
             Inner product
         callback : function(envs_dict) => None
@@ -132,6 +134,9 @@ def davidson(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
             If the solution dramatically changes in two iterations, clean the
             subspace and restart the iteration with the old solution.  It can
             help to improve numerical stability.  Default is False.
+        scratch_dir : str
+            The directory of the temporary file for the spilled trial vectors.
+            Default is the system temporary directory.
 
     Returns:
         e : float or list of floats
@@ -144,7 +149,7 @@ def davidson(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
     e, x = davidson1(lambda xs: [aop(x) for x in xs],
                      x0, precond, tol, max_cycle, max_space, lindep,
                      max_memory, dot, callback, nroots, lessio, pick, verbose,
-                     follow_state)[1:]
+                     follow_state, scratch_dir=scratch_dir)[1:]
     if nroots == 1:
         return e[0], x[0]
     else:
@@ -156,7 +161,7 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
               dot=numpy.dot, callback=None,
               nroots=1, lessio=False, pick=None, verbose=logger.WARN,
               follow_state=FOLLOW_STATE, tol_residual=None,
-              fill_heff=_fill_heff_hermitian):
+              fill_heff=_fill_heff_hermitian, scratch_dir=None):
     r'''Davidson diagonalization method to solve  a c = e c.  Ref
     [1] E.R. Davidson, J. Comput. Phys. 17 (1), 87-94 (1975).
     [2] http://people.inf.ethz.ch/arbenz/ewp/Lnotes/chapter11.pdf
@@ -190,7 +195,8 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
             smallest eigenvalue of the metric of the trial vectors is lower
             than this threshold.
         max_memory : int or float
-            Allowed memory in MB.
+            Allowed memory in MB.  If the trial vectors do not fit in,
+            the vectors beyond the budget are spilled to ``scratch_dir``.
         dot : function(x, y) => scalar
             Inner product
         callback : function(envs_dict) => None
@@ -213,6 +219,9 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
             If the solution dramatically changes in two iterations, clean the
             subspace and restart the iteration with the old solution.  It can
             help to improve numerical stability.  Default is False.
+        scratch_dir : str
+            The directory of the temporary file for the spilled trial vectors.
+            Default is the system temporary directory.
 
     Returns:
         conv : bool
@@ -247,6 +256,12 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
     lessio = lessio and not _incore
     log.debug1('max_cycle %d  max_space %d  max_memory %d  incore %s',
                max_cycle, max_space, max_memory, _incore)
+    if not _incore:
+        # the number of vectors in xs (and in ax) that are kept in memory
+        incore_size = max(int(max_memory*1e6/x0[0].nbytes) - nroots*3, 0) // 2
+        log.debug1('%d trial vectors kept in memory', incore_size)
+        xs = _Xlist(incore_size, scratch_dir)
+        ax = _Xlist(incore_size, scratch_dir)
     dtype = None
     heff = None
     fresh_start = True
@@ -262,8 +277,9 @@ def davidson1(aop, x0, precond, tol=1e-12, max_cycle=50, max_space=12,
                 xs = []
                 ax = []
             else:
-                xs = _Xlist()
-                ax = _Xlist()
+                # the memory buffers are reused
+                xs.reset()
+                ax.reset()
             space = 0
 # Orthogonalize xt space because the basis of subspace xs must be orthogonal
 # but the eigenvectors x0 might not be strictly orthogonal
@@ -524,9 +540,9 @@ class H5TmpFile(h5py.File):
     deleted when it is closed or the object is released (unless filename is
     specified).
     '''
-    def __init__(self, filename=None, mode='a', *args, **kwargs):
+    def __init__(self, filename=None, mode='a', *args, dir=None, **kwargs):
         if filename is None:
-            tmpfile = tempfile.NamedTemporaryFile(dir=".")
+            tmpfile = tempfile.NamedTemporaryFile(dir=dir)
             filename = tmpfile.name
         h5py.File.__init__(self, filename, mode, *args, **kwargs)
 #FIXME: Does GC flush/close the HDF5 file when releasing the resource?
@@ -543,39 +559,72 @@ class H5TmpFile(h5py.File):
 
 
 class _Xlist(list):
-    def __init__(self):
-        self.scr_h5 = H5TmpFile()
+    '''The trial vectors for the out-of-core Davidson.
+    Up to ``incore_size`` vectors are kept in a preallocated buffer, which
+    is reused when the subspace is restarted.  The other vectors are spilled
+    to a temporary HDF5 file in ``scratch_dir`` created only when needed.
+    '''
+    def __init__(self, incore_size=0, scratch_dir=None):
+        self.incore_size = incore_size
+        self.scratch_dir = scratch_dir
+        self.buffer = None
+        self.shape = None
+        self.scr_h5 = None
         self.index = []
 
+    def _in_buffer(self, key):
+        return key < self.incore_size
+
     def __getitem__(self, n):
         key = self.index[n]
+        if self._in_buffer(key):
+            return self.buffer[key].reshape(self.shape)
         return self.scr_h5[str(key)]
 
     def append(self, x):
-        length = len(self.index)
-        key = length + 1
-        index_set = set(self.index)
-        if key in index_set:
-            key = set(range(length)).difference(index_set).pop()
+        x = numpy.asarray(x)
+        used = set(self.index)
+        if self.incore_size and not used and (self.buffer is None
+                or self.buffer.dtype != x.dtype or self.buffer.shape[1] != x.size):
+            self.buffer = numpy.empty((self.incore_size, x.size), dtype=x.dtype)
+            self.shape = x.shape
+        key = None
+        if (self.buffer is not None and x.shape == self.shape
+                and numpy.can_cast(x.dtype, self.buffer.dtype)):
+            key = next((k for k in range(self.incore_size) if k not in used), None)
+        if key is None:
+            key = next(k for k in itertools.count(self.incore_size) if k not in used)
+            if self.scr_h5 is None:
+                self.scr_h5 = H5TmpFile(dir=self.scratch_dir)
+            self.scr_h5[str(key)] = x
+        else:
+            self.buffer[key] = x.ravel()
         self.index.append(key)
 
-        self.scr_h5[str(key)] = x
-        self.scr_h5.flush()
-
     def extend(self, x):
         for xi in x:
             self.append(xi)
 
     def __setitem__(self, n, x):
         key = self.index[n]
-        self.scr_h5[str(key)][:] = x
-        self.scr_h5.flush()
+        if self._in_buffer(key):
+            self.buffer[key] = numpy.ravel(x)
+        else:
+            self.scr_h5[str(key)][:] = x
 
     def __len__(self):
         return len(self.index)
 
     def pop(self, index):
         key = self.index.pop(index)
-        del (self.scr_h5[str(key)])
+        if not self._in_buffer(key):
+            del (self.scr_h5[str(key)])
+
+    def reset(self):
+        # remove all vectors. The buffer is kept
+        self.index = []
+        if self.scr_h5 is not None:
+            self.scr_h5.close()
+            self.scr_h5 = None
 
 del (SAFE_EIGH_LINDEP, DAVIDSON_LINDEP, DSOLVE_LINDEP, MAX_MEMORY)
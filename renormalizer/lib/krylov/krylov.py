@@ -12,8 +12,9 @@ from renormalizer.mps.backend import xp
 logger = logging.getLogger(__name__)
 
 
-def _expm_krylov(alpha, beta, V, v_norm, dt):
-    # diagonalize Hessenberg matrix (tridiagonal matrix for hermitian matrix A)
+def _expm_krylov_coef(alpha, beta, v_norm, dt):
+    # the coefficients of the Krylov vectors: v_norm * expm(dt * T) e_1,
+    # where T is the Hessenberg matrix (tridiagonal matrix for hermitian matrix A)
     try:
         w_hess, u_hess = eigh_tridiagonal(alpha, beta)
     except np.linalg.LinAlgError:
@@ -21,18 +22,54 @@ def _expm_krylov(alpha, beta, V, v_norm, dt):
         h = np.diag(alpha) + np.diag(beta, k=-1) + np.diag(beta, k=1)
         w_hess, u_hess = np.linalg.eigh(h)
 
-    return V @ xp.asarray(u_hess @ (v_norm * np.exp(dt*w_hess) * u_hess[0]))
+    return u_hess @ (v_norm * np.exp(dt*w_hess) * u_hess[0])
+
+
+def _expm_krylov(alpha, beta, V, v_norm, dt):
+    return V @ xp.asarray(_expm_krylov_coef(alpha, beta, v_norm, dt))
 
 
-def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50):
+def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50, tol=1e-8, size_hint=None):
     """
     Compute Krylov subspace approximation of the matrix exponential
     applied to input vector: `expm(dt*A)*v`.
     A is a hermitian matrix.
+
+    The convergence is checked by the a posteriori error estimate
+    ``beta_j * |[expm(dt*T_j) e_1]_j|``, which only involves the small tridiagonal matrix.
+    The Krylov basis grows dynamically.
+
     Reference:
         M. Hochbruck and C. Lubich
         On Krylov subspace approximations to the matrix exponential operator
         SIAM J. Numer. Anal. 34, 1911 (1997)
+
+        Y. Saad
+        Analysis of some Krylov subspace approximations to the matrix exponential operator
+        SIAM J. Numer. Anal. 29, 209 (1992)
+
+    Parameters
+    ----------
+    Afunc : callable
+        The function that applies A to a vector.
+    dt : complex or float
+        The time step.
+    vstart : xp.ndarray
+        The input vector.
+    block_size : int
+        The initial number of the preallocated Krylov vectors if ``size_hint`` is not provided.
+    tol : float
+        The tolerance of the estimated error relative to the norm of ``vstart``.
+    size_hint : int
+        The expected size of the Krylov subspace, such as the size of the last call
+        for a similar problem. Used to preallocate the Krylov vectors.
+
+    Returns
+    -------
+    res : xp.ndarray
+        `expm(dt*A)*v`
+    size : int
+        The size of the Krylov subspace.
     """
     if not np.iscomplex(dt):
         dt = dt.real
@@ -43,29 +80,26 @@ def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50):
     assert nrmv > 0
     vstart = vstart / nrmv
 
-    alpha = np.zeros(block_size)
-    beta  = np.zeros(block_size - 1)
+    if size_hint is None:
+        size = block_size
+    else:
+        # slightly larger in case more vectors are required this time
+        size = size_hint + 2
+    size = max(min(size, len(vstart)), 1)
+    alpha = np.zeros(size)
+    beta  = np.zeros(size)
 
-    V = xp.empty((block_size, len(vstart)), dtype=vstart.dtype)
+    V = xp.empty((size, len(vstart)), dtype=vstart.dtype)
     V[0] = vstart
-    res = None
-
 
     for j in range(len(vstart)):
-        
+
         w = Afunc(V[j])
         alpha[j] = xp.vdot(w, V[j]).real
 
         if j == len(vstart)-1:
             #logger.debug("the krylov subspace is equal to the full space")
             return _expm_krylov(alpha[:j+1], beta[:j], V[:j+1, :].T, nrmv, dt), j+1
-        
-        if len(V) == j+1:
-            V, old_V = xp.empty((len(V) + block_size, len(vstart)), dtype=vstart.dtype), V
-            V[:len(old_V)] = old_V
-            del old_V
-            alpha = np.concatenate([alpha, np.zeros(block_size)])
-            beta = np.concatenate([beta, np.zeros(block_size)])
 
         w -= alpha[j]*V[j] + (beta[j-1]*V[j-1] if j > 0 else 0)
         beta[j] = xp.linalg.norm(w)
@@ -73,12 +107,110 @@ def expm_krylov(Afunc, dt, vstart: xp.ndarray, block_size=50):
             # logger.warning(f'beta[{j}] ~= 0 encountered during Lanczos iteration.')
             return _expm_krylov(alpha[:j+1], beta[:j], V[:j+1, :].T, nrmv, dt), j+1
 
-        if 3 < j and j % 2 == 0:
-            new_res = _expm_krylov(alpha[:j+1], beta[:j], V[:j+1].T, nrmv, dt)
-            if res is not None and xp.allclose(res, new_res):
-                return new_res, j+1
-            else:
-                res = new_res
+        if 2 < j:
+            coef = _expm_krylov_coef(alpha[:j+1], beta[:j], nrmv, dt)
+            if beta[j] * abs(coef[-1]) < tol * nrmv:
+                return V[:j+1].T @ xp.asarray(coef), j+1
+
+        if len(V) == j+1:
+            # double the size of the Krylov basis
+            new_size = min(2 * len(V), len(vstart))
+            V, old_V = xp.empty((new_size, len(vstart)), dtype=vstart.dtype), V
+            V[:len(old_V)] = old_V
+            del old_V
+            alpha = np.concatenate([alpha, np.zeros(new_size - len(alpha))])
+            beta = np.concatenate([beta, np.zeros(new_size - len(beta))])
+
         V[j + 1] = w / beta[j]
 
 
+def expm_krylov_batch(Afunc, dt, vstart: xp.ndarray, block_size=50, tol=1e-8):
+    """
+    Batched version of :func:`expm_krylov` for a batch of hermitian matrices
+    ``A_k`` and vectors ``v_k``. The Lanczos iterations of the batch are carried out
+    together, so that ``Afunc`` is called on all the vectors at once.
+    The iteration of each vector stops when it is converged.
+
+    Parameters
+    ----------
+    Afunc : callable
+        The function that applies ``A_k`` to the ``k``-th row of the input.
+    dt : complex or float
+        The time step.
+    vstart : xp.ndarray
+        The input vectors with shape ``(nbatch, n)``.
+    block_size : int
+        The initial number of the preallocated Krylov vectors.
+    tol : float
+        The tolerance of the estimated error relative to the norm of ``vstart``.
+
+    Returns
+    -------
+    res : xp.ndarray
+        `expm(dt*A_k)*v_k` with shape ``(nbatch, n)``.
+    sizes : np.ndarray
+        The size of the Krylov subspace of each vector.
+    """
+    if not np.iscomplex(dt):
+        dt = dt.real
+
+    vstart = xp.asarray(vstart)
+    nbatch, n = vstart.shape
+    nrmv = xp.linalg.norm(vstart, axis=1)
+    assert xp.all(0 < nrmv)
+    nrmv = np.asarray(nrmv.tolist())
+
+    size = max(min(block_size, n), 1)
+    alpha = np.zeros((size, nbatch))
+    beta = np.zeros((size, nbatch))
+    V = xp.empty((size, nbatch, n), dtype=vstart.dtype)
+    V[0] = vstart / xp.asarray(nrmv)[:, None]
+
+    res = xp.empty_like(vstart, dtype=np.result_type(vstart.dtype, dt))
+    sizes = np.zeros(nbatch, dtype=int)
+    active = np.ones(nbatch, dtype=bool)
+
+    def finish(k, m):
+        coef = _expm_krylov_coef(alpha[:m, k], beta[:m-1, k], nrmv[k], dt)
+        res[k] = xp.asarray(coef) @ V[:m, k]
+        sizes[k] = m
+        active[k] = False
+
+    for j in range(n):
+        w = Afunc(V[j])
+        alpha[j] = xp.einsum("kn, kn -> k", w, V[j].conj()).real.tolist()
+
+        if j == n - 1:
+            for k in np.nonzero(active)[0]:
+                finish(k, j+1)
+            break
+
+        w -= xp.asarray(alpha[j])[:, None] * V[j]
+        if 0 < j:
+            w -= xp.asarray(beta[j-1])[:, None] * V[j-1]
+        beta[j] = xp.linalg.norm(w, axis=1).tolist()
+
+        for k in np.nonzero(active)[0]:
+            if beta[j, k] < 100*n*np.finfo(float).eps:
+                finish(k, j+1)
+            elif 2 < j:
+                coef = _expm_krylov_coef(alpha[:j+1, k], beta[:j, k], nrmv[k], dt)
+                if beta[j, k] * abs(coef[-1]) < tol * nrmv[k]:
+                    finish(k, j+1)
+        if not active.any():
+            break
+
+        if len(V) == j+1:
+            # double the size of the Krylov basis
+            new_size = min(2 * len(V), n)
+            V, old_V = xp.empty((new_size, nbatch, n), dtype=vstart.dtype), V
+            V[:len(old_V)] = old_V
+            del old_V
+            alpha = np.concatenate([alpha, np.zeros((new_size - len(alpha), nbatch))])
+            beta = np.concatenate([beta, np.zeros((new_size - len(beta), nbatch))])
+
+        # avoid dividing by zero for the finished vectors, which are not used any more
+        norm = np.where(beta[j] < 100*n*np.finfo(float).eps, 1, beta[j])
+        V[j + 1] = w / xp.asarray(norm)[:, None]
+
+    return res, sizes
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from renormalizer.lib import davidson1
+from renormalizer.lib.davidson import davidson as davidson_module
+
+
+@pytest.mark.parametrize("max_memory, spill", (
+    # all trial vectors in memory
+    (64000, False),
+    # a part of the trial vectors in memory and the rest spilled to the disk
+    (0.1, True),
+    # all trial vectors on the disk
+    (1e-6, True),
+))
+def test_davidson_memory(max_memory, spill, tmp_path, monkeypatch):
+    # record the directories of the scratch files
+    scratch_dirs = []
+    class H5TmpFile(davidson_module.H5TmpFile):
+        def __init__(self, *args, dir=None, **kwargs):
+            scratch_dirs.append(dir)
+            super().__init__(*args, dir=dir, **kwargs)
+    monkeypatch.setattr(davidson_module, "H5TmpFile", H5TmpFile)
+
+    n = 1000
+    rng = np.random.default_rng(2023)
+    a = rng.random((n, n)) * 0.1
+    a = a + a.T + np.diag(np.arange(n))
+    hdiag = np.diag(a)
+    precond = lambda x, e, *args: x / (hdiag - e + 1e-4)
+    x0 = np.zeros((2, n))
+    x0[0, 0] = x0[1, 1] = 1
+
+    conv, e, c = davidson1(lambda xs: list(np.array(xs) @ a), list(x0), precond,
+                           nroots=2, max_space=8, max_cycle=200, tol=1e-12,
+                           max_memory=max_memory, scratch_dir=str(tmp_path))
+    assert all(conv)
+    np.testing.assert_allclose(e, np.linalg.eigvalsh(a)[:2])
+    assert (len(scratch_dirs) != 0) == spill
+    assert all(d == str(tmp_path) for d in scratch_dirs)
@@ -2,7 +2,7 @@
 
 
 from renormalizer.mps.backend import xp
-from renormalizer.lib import expm_krylov
+from renormalizer.lib import expm_krylov, expm_krylov_batch
 from renormalizer.mps.matrix import asxp
 import pytest
 import numpy as np
@@ -18,8 +18,8 @@ from scipy.linalg import expm, eigh
     800
 ))
 @pytest.mark.parametrize("imag", (True, False))
-@pytest.mark.parametrize("block_size", (3, 30))
-def test_expm(N, imag, block_size):
+@pytest.mark.parametrize("block_size, size_hint", ((3, None), (30, None), (50, 5)))
+def test_expm(N, imag, block_size, size_hint):
     a1 = np.random.rand(N, N) / N
     if imag:
         a1 = a1 + np.random.rand(N, N) / N / 1j
@@ -35,5 +35,26 @@ def test_expm(N, imag, block_size):
 
     w, x = eigh(a1)
     res1 = x @ np.diag(np.exp(w)) @ x.conj().T @ v
-    res2, _ = expm_krylov(lambda x: a2.dot(x), 1, xp.array(v), block_size)
+    res2, _ = expm_krylov(lambda x: a2.dot(x), 1, xp.array(v), block_size, size_hint=size_hint)
     assert xp.allclose(res1, res2)
+
+
+@pytest.mark.parametrize("N", (1, 4, 200))
+@pytest.mark.parametrize("block_size", (3, 50))
+def test_expm_batch(N, block_size):
+    nbatch = 3
+    a1 = np.random.rand(nbatch, N, N) / N + np.random.rand(nbatch, N, N) / N / 1j
+    a1 += a1.transpose(0, 2, 1).conj()
+    # different norms and time step
+    v = np.random.rand(nbatch, N) + np.random.rand(nbatch, N) / 1j
+    v *= np.arange(1, nbatch+1)[:, None]
+
+    a2 = xp.array(a1)
+    res2, sizes = expm_krylov_batch(
+        lambda x: xp.einsum("kij, kj -> ki", a2, x), -0.5j, xp.array(v), block_size
+    )
+    for k in range(nbatch):
+        w, x = eigh(a1[k])
+        res1 = x @ np.diag(np.exp(-0.5j * w)) @ x.conj().T @ v[k]
+        assert xp.allclose(res1, res2[k])
+        assert sizes[k] == expm_krylov(lambda y: a2[k].dot(y), -0.5j, xp.array(v[k]), block_size)[1]
@@ -5,70 +5,148 @@ import itertools
 import logging
 
 import numpy as np
+import scipy.sparse
 
 from renormalizer.model.op import Op
 from renormalizer.model.basis import BasisHalfSpin
 
 logger = logging.getLogger(__name__)
 
-def read_fcidump(fname, norb):
+def read_fcidump(fname, norb, sparse=False, chunk_size=1000000):
     """
     from fcidump format electron integral to h_pq g_pqrs in arXiv:2006.02056 eq 18
     norb: number of spatial orbitals
+    sparse: return ``aseri`` in the sparse format. See :func:`int_to_h`.
+    chunk_size: number of lines parsed at a time.
     return sh spin-orbital 1-e integral
            aseri: 2-e integral after considering symmetry
            nuc: nuclear repulsion energy
     """
     eri = np.zeros((norb, norb, norb, norb))
     h = np.zeros((norb,norb))
+    nuc = 0
 
     with open(fname, "r") as f:
-        a = f.readlines()
-        for line, info in enumerate(a):
-            if line < 4:
-                continue
-            s  = info.split()
-            integral, p, q, r, s = float(s[0]),int(s[1]),int(s[2]),int(s[3]),int(s[4])
-            if r != 0:
-                eri[p-1,q-1,r-1,s-1] = integral
-                eri[q-1,p-1,r-1,s-1] = integral
-                eri[p-1,q-1,s-1,r-1] = integral
-                eri[q-1,p-1,s-1,r-1] = integral
-            elif p != 0:
-                h[p-1,q-1] = integral
-                h[q-1,p-1] = integral
-            else:
-                nuc = integral
+        # skip the namelist header
+        for line in f:
+            if line.strip() in ["&END", "/"]:
+                break
+        while True:
+            data = np.loadtxt(f, max_rows=chunk_size, ndmin=2)
+            if len(data) == 0:
+                break
+            integral = data[:, 0]
+            p, q, r, s = data[:, 1:].astype(int).T - 1
+            mask = r != -1
+            i, p1, q1, r1, s1 = integral[mask], p[mask], q[mask], r[mask], s[mask]
+            eri[p1, q1, r1, s1] = i
+            eri[q1, p1, r1, s1] = i
+            eri[p1, q1, s1, r1] = i
+            eri[q1, p1, s1, r1] = i
+            # the orbital energies (q == 0) are not used
+            mask = (r == -1) & (p != -1) & (q != -1)
+            i, p1, q1 = integral[mask], p[mask], q[mask]
+            h[p1, q1] = i
+            h[q1, p1] = i
+            mask = p == -1
+            if mask.any():
+                nuc = integral[mask][-1]
+            if len(data) < chunk_size:
+                break
 
-    sh, aseri = int_to_h(h, eri)
+    sh, aseri = int_to_h(h, eri, sparse=sparse)
 
     logger.info(f"nuclear repulsion: {nuc}")
 
     return sh, aseri, nuc
 
 
-def int_to_h(h, eri):
-    nsorb = len(h) * 2
-    seri = np.zeros((nsorb, nsorb, nsorb, nsorb))
-    sh = np.zeros((nsorb, nsorb))
-    for p, q, r, s in itertools.product(range(nsorb), repeat=4):
-        # a_p^\dagger a_q^\dagger a_r a_s
-        if p % 2 == s % 2 and q % 2 == r % 2:
-            seri[p, q, r, s] = eri[p // 2, s // 2, q // 2, r // 2]
+def int_to_h(h, eri, sparse=False):
+    r"""
+    Spatial orbital integrals to spin orbital integrals. The spin orbitals are ordered as
+    :math:`1\alpha, 1\beta, 2\alpha, 2\beta, \cdots`.
+
+    Parameters
+    ----------
+    h : np.ndarray
+        The 1-e integrals.
+    eri : np.ndarray
+        The 2-e integrals in the chemists' notation.
+    sparse : bool
+        If ``True``, ``aseri`` is returned as a :class:`scipy.sparse.coo_matrix`
+        with shape ``(nsorb**2, nsorb**2)``, in which the element at
+        ``(p * nsorb + q, r * nsorb + s)`` is ``aseri[p, q, r, s]``.
+        The dense ``aseri`` requires ``nsorb**4`` memory.
+
+    Returns
+    -------
+    sh : np.ndarray
+        The spin orbital 1-e integrals.
+    aseri : np.ndarray or scipy.sparse.coo_matrix
+        The spin orbital 2-e integrals of :math:`a_p^\dagger a_q^\dagger a_r a_s` with
+        :math:`p < q` and :math:`r < s`, anti-symmetrized.
+    """
+    norb = len(h)
+    nsorb = norb * 2
+    sh = np.kron(h, np.eye(2))
+
+    # a_p^\dagger a_q^\dagger a_r a_s
+    # seri[p, q, r, s] = eri[p // 2, s // 2, q // 2, r // 2] if p and s, q and r have the same spin
+    g = eri.transpose(0, 2, 3, 1)
 
-    for q, s in itertools.product(range(nsorb), repeat=2):
-        if q % 2 == s % 2:
-            sh[q, s] = h[q // 2, s // 2]
+    if sparse:
+        return sh, _aseri_coo(g, nsorb)
 
-    aseri = np.zeros((nsorb, nsorb, nsorb, nsorb))
-    for q, s in itertools.product(range(nsorb), repeat=2):
-        for p, r in itertools.product(range(q), range(s)):
-            # aseri[p,q,r,s] = seri[p,q,r,s] - seri[q,p,r,s]
-            aseri[p, q, r, s] = seri[p, q, r, s] - seri[p, q, s, r]
+    seri = np.zeros((norb, 2, norb, 2, norb, 2, norb, 2))
+    for sigma, tau in itertools.product(range(2), repeat=2):
+        seri[:, sigma, :, tau, :, tau, :, sigma] = g
+    seri = seri.reshape((nsorb,) * 4)
+
+    # aseri[p,q,r,s] = seri[p,q,r,s] - seri[p,q,s,r] for p < q and r < s
+    aseri = seri - seri.transpose(0, 1, 3, 2)
+    upper = np.triu(np.ones((nsorb, nsorb), dtype=bool), k=1)
+    aseri *= upper[:, :, None, None] & upper[None, None, :, :]
 
     return sh, aseri
 
 
+def _aseri_coo(g, nsorb):
+    # the sparse version of `int_to_h`
+    P, Q, R, S = np.nonzero(g)
+    v = g[P, Q, R, S]
+    rows, cols, data = [], [], []
+    for sigma, tau in itertools.product(range(2), repeat=2):
+        p, q, r, s = 2 * P + sigma, 2 * Q + tau, 2 * R + tau, 2 * S + sigma
+        # seri[p,q,r,s] contributes to aseri[p,q,r,s] with +1 and aseri[p,q,s,r] with -1
+        for r1, s1, sign in [(r, s, 1), (s, r, -1)]:
+            mask = (p < q) & (r1 < s1)
+            rows.append(p[mask] * nsorb + q[mask])
+            cols.append(r1[mask] * nsorb + s1[mask])
+            data.append(sign * v[mask])
+    aseri = scipy.sparse.coo_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(nsorb**2, nsorb**2)
+    )
+    # sum the duplicates and remove zeros as in the dense version
+    aseri = aseri.tocsr()
+    aseri.eliminate_zeros()
+    return aseri.tocoo()
+
+
+def _eri_entries(h2e, norbs):
+    # the indices (p, q, r, s) and values of the nonzero 2-e integrals in C order,
+    # for both the dense and the sparse format of `int_to_h`
+    if scipy.sparse.issparse(h2e):
+        h2e = h2e.tocsr()
+        h2e.sort_indices()
+        h2e = h2e.tocoo()
+        nonzero = h2e.data != 0
+        row, col, values = h2e.row[nonzero], h2e.col[nonzero], h2e.data[nonzero]
+        pairs2 = np.stack([row // norbs, row % norbs, col // norbs, col % norbs], axis=1)
+        return pairs2, values
+    pairs2 = np.argwhere(h2e!=0)
+    return pairs2, h2e[tuple(pairs2.T)]
+
+
 def generate_ladder_operator(norbs):
     # construct electronic creation/annihilation operators by Jordan-Wigner transformation
     a_ops = []
@@ -128,7 +206,7 @@ def qc_model(h1e, h2e, stacked=False, conserve_qn=True):
     """
     Ab initio electronic Hamiltonian in spin-orbitals
     h1e: sh above
-    h2e: aseri above
+    h2e: aseri above, dense or sparse
     return model: "e_0", "e_1"... is according to the orbital index in sh and
     aseri
     """
@@ -146,12 +224,15 @@ def qc_model(h1e, h2e, stacked=False, conserve_qn=True):
     norbs = h1e.shape[0]
     logger.info(f"spin norbs: {norbs}")
     assert np.all(np.array(h1e.shape) == norbs)
-    assert np.all(np.array(h2e.shape) == norbs)
+    if scipy.sparse.issparse(h2e):
+        assert np.all(np.array(h2e.shape) == norbs**2)
+    else:
+        assert np.all(np.array(h2e.shape) == norbs)
 
     ham_terms = []
     process_op = partial(simplify_op, norbs=norbs, conserve_qn=conserve_qn)
     pairs1 = np.argwhere(h1e!=0)
-    pairs2 = np.argwhere(h2e!=0)
+    pairs2, values2 = _eri_entries(h2e, norbs)
     a_ops, a_dag_ops = generate_ladder_operator(norbs)
     if stacked is False:
         # 1-e terms
@@ -160,9 +241,9 @@ def qc_model(h1e, h2e, stacked=False, conserve_qn=True):
             ham_terms.append(op * h1e[p, q])
 
         # 2-e terms.
-        for p, q, r, s in pairs2:
+        for (p, q, r, s), value in zip(pairs2, values2):
             op = process_op(Op.product([a_dag_ops[p], a_dag_ops[q], a_ops[r], a_ops[s]]))
-            ham_terms.append(op * h2e[p, q, r, s])
+            ham_terms.append(op * value)
     else:
         p_1e = np.unique(pairs1[:, 0])
         p_2e = np.unique(pairs2[:, 0])
@@ -171,16 +252,25 @@ def qc_model(h1e, h2e, stacked=False, conserve_qn=True):
             local_ham_terms = []
             q_values = pairs1[pairs1[:, 0] == p][:, 1]
             qrs_values = pairs2[pairs2[:, 0] == p][:, 1:]
+            eri_values = values2[pairs2[:, 0] == p]
             if q_values.size > 0:
                 for q in q_values:
                     op = process_op(a_dag_ops[p] * a_ops[q])
                     local_ham_terms.append(op * h1e[p, q])
             if qrs_values.size > 0:
-                for q, r, s in qrs_values:
+                for (q, r, s), value in zip(qrs_values, eri_values):
                     op = process_op(Op.product([a_dag_ops[p], a_dag_ops[q], a_ops[r], a_ops[s]]))
-                    local_ham_terms.append(op * h2e[p, q, r, s])
+                    local_ham_terms.append(op * value)
             ham_terms.append(local_ham_terms)
 
+    return qc_basis(norbs, conserve_qn), ham_terms
+
+
+def qc_basis(norbs, conserve_qn=True):
+    """
+    The basis of :func:`qc_model` for ``norbs`` spin orbitals.
+    The even and odd spin orbitals are the alpha and beta spin orbitals respectively.
+    """
     basis = []
     for iorb in range(norbs):
         if conserve_qn:
@@ -192,5 +282,5 @@ def qc_model(h1e, h2e, stacked=False, conserve_qn=True):
             sigmaqn = [0, 0]
         b = BasisHalfSpin(iorb, sigmaqn=sigmaqn)
         basis.append(b)
-    return basis, ham_terms
+    return basis
 
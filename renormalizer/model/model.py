@@ -9,7 +9,7 @@ import numpy as np
 
 from renormalizer.model.basis import BasisSet, BasisSimpleElectron, BasisMultiElectronVac, BasisHalfSpin, BasisSHO
 from renormalizer.model.mol import Mol, Phonon
-from renormalizer.model.op import Op
+from renormalizer.model.op import Op, OpTerms
 from renormalizer.utils import Quantity, cached_property
 
 
@@ -25,7 +25,7 @@ class Model:
     basis : :class:`list` of :class:`~renormalizer.model.basis.BasisSet`
         Local basis for each site of the MPS. The order determines the
         DoF order in the MPS.
-    ham_terms : :class:`list` of :class:`~renormalizer.model.Op`
+    ham_terms : :class:`list` of :class:`~renormalizer.model.Op` or :class:`~renormalizer.model.OpTerms`
         Terms of the system Hamiltonian in sum-of-product form.
         Identities can be omitted in the operators.
         All terms must be included, without assuming Hermitian or something else.
@@ -81,17 +81,27 @@ class Model:
         Errors will be raised if the type of operator is not :class:`Op`
         or the operator contains DoF not defined in ``self.basis``.
         Operators with factor = 0 are discarded.
+        :class:`~renormalizer.model.OpTerms` is checked with array operations.
 
         Parameters
         ----------
-        terms : :class:`list` of :class:`~renormalizer.model.Op`
+        terms : :class:`list` of :class:`~renormalizer.model.Op` or :class:`~renormalizer.model.OpTerms`
             The terms to check.
 
         Returns
         -------
-        new_terms: :class:`list` of :class:`Op`
+        new_terms: :class:`list` of :class:`Op` or :class:`~renormalizer.model.OpTerms`
             Operator list with 0-factor terms discarded.
         """
+        if isinstance(terms, OpTerms):
+            dofs = set(self.dofs)
+            # the DoFs not used by any term are allowed
+            for i in np.unique(terms.dof_ids):
+                if terms.dofs[i] not in dofs:
+                    raise ValueError(f"The terms contain DoF {terms.dofs[i]} not in the basis.")
+            if np.all(terms.factors != 0):
+                return terms
+            return terms[terms.factors != 0]
         # terms to return
         new_terms = []
         dofs = set(self.dofs)
@@ -512,3 +512,201 @@ class OpSum(list):
 
     # prevents NumPy universal function call
     __array_ufunc__ = None
+
+
+class OpTerms:
+    r"""
+    A compact columnar container of many operator terms, such as a Hamiltonian with millions of terms.
+    The terms are stored in NumPy arrays rather than :class:`Op` objects.
+    The simple symbols of all terms are concatenated, and ``offsets`` marks
+    the start of each term, similar to the CSR format of sparse matrices.
+
+    Indexing with an integer returns an :class:`Op` view of the term, and iteration
+    yields :class:`Op` for every term, so the container could be used in place of
+    a list of :class:`Op`. Indexing with a slice, an integer array or a boolean mask
+    returns a new :class:`OpTerms`.
+
+    Parameters
+    ----------
+    symbols : :class:`list` of :class:`str`
+        The unique simple symbols, such as ``"a^\dagger"`` and ``"Z"``.
+    dofs : :class:`list` of hashable objects
+        The unique DoF names.
+    offsets : np.ndarray
+        The start of each term in ``symbol_ids``, with length ``nterms + 1``.
+    symbol_ids : np.ndarray
+        The index of each simple symbol in ``symbols``.
+    dof_ids : np.ndarray
+        The index of the DoF of each simple symbol in ``dofs``.
+    factors : np.ndarray
+        The factor of each term.
+    qn : np.ndarray
+        The quantum number of each simple symbol with shape ``(len(symbol_ids), qn_size)``.
+        If ``None``, the default quantum numbers of :class:`Op` are used.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from renormalizer.model import OpTerms
+    >>> terms = OpTerms([r"a^\dagger", "a"], [0, 1], [0, 2, 4], [0, 1, 0, 1], [0, 1, 1, 0], np.array([0.5, 0.5]))
+    >>> len(terms)
+    2
+    >>> terms[1]
+    Op('a^\\dagger a', [1, 0], 0.5, [[1], [-1]])
+    >>> list(terms) == [Op(r"a^\dagger a", [0, 1], 0.5), Op(r"a^\dagger a", [1, 0], 0.5)]
+    True
+    """
+
+    @classmethod
+    def from_ops(cls, ops: List[Op]) -> "OpTerms":
+        """
+        Construct from a list of :class:`Op`.
+        """
+        symbols, dofs = {}, {}
+        offsets = [0]
+        symbol_ids, dof_ids, factors, qn = [], [], [], []
+        for op in ops:
+            for symbol, dof, op_qn in zip(op.split_symbol, op.dofs, op.qn_list):
+                symbol_ids.append(symbols.setdefault(symbol, len(symbols)))
+                dof_ids.append(dofs.setdefault(dof, len(dofs)))
+                qn.append(op_qn)
+            offsets.append(len(symbol_ids))
+            factors.append(op.factor)
+        if len(qn) == 0:
+            qn = np.zeros((0, 1), dtype=int)
+        return cls(list(symbols), list(dofs), offsets, symbol_ids, dof_ids, np.array(factors), np.array(qn))
+
+    def __init__(self, symbols: List[str], dofs: List, offsets, symbol_ids, dof_ids, factors, qn=None):
+        self.symbols: List[str] = list(symbols)
+        self.dofs: List = list(dofs)
+        self.offsets: np.ndarray = np.asarray(offsets, dtype=np.int64)
+        self.symbol_ids: np.ndarray = np.asarray(symbol_ids, dtype=np.int32)
+        self.dof_ids: np.ndarray = np.asarray(dof_ids, dtype=np.int32)
+        factors = np.asarray(factors)
+        self.factors: np.ndarray = factors.astype(np.result_type(factors, np.float64))
+        if qn is None:
+            # see `Op.__init__`
+            default_qn = [1 if s == r"a^\dagger" else -1 if s == "a" else 0 for s in self.symbols]
+            qn = np.array(default_qn, dtype=int)[self.symbol_ids]
+        qn = np.asarray(qn, dtype=int)
+        self.qn: np.ndarray = qn.reshape(len(self.symbol_ids), -1)
+
+        if len(self.offsets) != len(self.factors) + 1 or self.offsets[0] != 0 \
+                or self.offsets[-1] != len(self.symbol_ids) or np.any(np.diff(self.offsets) <= 0):
+            raise ValueError("Invalid offsets of the terms")
+        if len(self.dof_ids) != len(self.symbol_ids):
+            raise ValueError("The sizes of symbol_ids and dof_ids do not match")
+        if len(self.symbol_ids) != 0:
+            if not (0 <= self.symbol_ids.min() and self.symbol_ids.max() < len(self.symbols)):
+                raise ValueError("symbol_ids out of range")
+            if not (0 <= self.dof_ids.min() and self.dof_ids.max() < len(self.dofs)):
+                raise ValueError("dof_ids out of range")
+
+    @property
+    def qn_size(self) -> int:
+        return self.qn.shape[1]
+
+    def __len__(self):
+        return len(self.factors)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            start, end = self.offsets[item], self.offsets[item+1]
+            symbol = " ".join(self.symbols[i] for i in self.symbol_ids[start:end])
+            dofs = [self.dofs[i] for i in self.dof_ids[start:end]]
+            return Op(symbol, dofs, self.factors[item], list(self.qn[start:end]))
+        if isinstance(item, slice):
+            item = np.arange(len(self))[item]
+        return self.take(item)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def take(self, indices) -> "OpTerms":
+        """
+        Select terms by an integer array or a boolean mask.
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.nonzero(indices)[0]
+        lengths = np.diff(self.offsets)[indices]
+        new_offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # the position of the selected simple symbols
+        entries = np.repeat(self.offsets[indices] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        return self.__class__(self.symbols, self.dofs, new_offsets, self.symbol_ids[entries],
+                              self.dof_ids[entries], self.factors[indices], self.qn[entries])
+
+    def to_opsum(self) -> "OpSum":
+        return OpSum(self)
+
+    def split_elementary(self, dof_to_siteidx):
+        """
+        Vectorised version of :meth:`Op.split_elementary` for all terms.
+
+        Parameters
+        ----------
+        dof_to_siteidx : dict
+            Mapping from DoF name to MPS site index.
+
+        Returns
+        -------
+        term_idx : np.ndarray
+            The term index of each elementary operator.
+        site_idx : np.ndarray
+            The site index of each elementary operator. For each term, small site index first.
+        elem_idx : np.ndarray
+            The index of each elementary operator in ``elem_ops``.
+        elem_ops : :class:`list` of :class:`Op`
+            The unique elementary operators in the order of the first appearance.
+            Factors are set to 1.
+        """
+        dof_site = np.array([dof_to_siteidx.get(dof, -1) for dof in self.dofs], dtype=np.int64)
+        site = dof_site[self.dof_ids]
+        if np.any(site == -1):
+            unknown = {self.dofs[i] for i in self.dof_ids[site == -1]}
+            raise ValueError(f"Unknown DoF name {unknown} in the terms.")
+        nterms, nentries = len(self), len(self.symbol_ids)
+        term = np.repeat(np.arange(nterms), np.diff(self.offsets))
+
+        # group by (term, site). The order on each site is not changed as `lexsort` is stable
+        order = np.lexsort((site, term))
+        term, site = term[order], site[order]
+        new_group = np.ones(nentries, dtype=bool)
+        new_group[1:] = (term[1:] != term[:-1]) | (site[1:] != site[:-1])
+        group_id = np.cumsum(new_group) - 1
+        group_start = np.nonzero(new_group)[0]
+        pos = np.arange(nentries) - group_start[group_id]
+
+        # each elementary operator is a row of (symbol id, dof id, qn) padded by -1.
+        # The symbol id of the padding is -1 so it is not ambiguous
+        width = 2 + self.qn_size
+        rows = np.full((len(group_start), pos.max() + 1, width), -1, dtype=np.int64)
+        rows[group_id, pos, 0] = self.symbol_ids[order]
+        rows[group_id, pos, 1] = self.dof_ids[order]
+        rows[group_id, pos, 2:] = self.qn[order]
+        rows = rows.reshape(len(group_start), -1)
+        # `np.unique` with `axis=0` is slow for many rows. `lexsort` over the few columns is stable,
+        # so the first row in each group of the same rows is the first appearance
+        row_order = np.lexsort(rows.T[::-1])
+        sorted_rows = rows[row_order]
+        new_row = np.ones(len(rows), dtype=bool)
+        new_row[1:] = np.any(sorted_rows[1:] != sorted_rows[:-1], axis=1)
+        first_idx = row_order[new_row]
+        inverse = np.empty(len(rows), dtype=np.int64)
+        inverse[row_order] = np.cumsum(new_row) - 1
+        unique_order = np.argsort(first_idx)
+        rank = np.empty_like(unique_order)
+        rank[unique_order] = np.arange(len(unique_order))
+        elem_idx = rank[inverse]
+
+        elem_ops = []
+        for row in rows[first_idx[unique_order]].reshape(len(unique_order), -1, width):
+            row = row[row[:, 0] != -1]
+            symbol = " ".join(self.symbols[i] for i in row[:, 0])
+            dofs = [self.dofs[i] for i in row[:, 1]]
+            elem_ops.append(Op(symbol, dofs, qn=list(row[:, 2:])))
+
+        return term[group_start], site[group_start], elem_idx, elem_ops
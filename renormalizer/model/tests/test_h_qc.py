@@ -0,0 +1,62 @@
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from renormalizer.model import h_qc
+from renormalizer.mps.tests import cur_dir
+
+
+def int_to_h_reference(h, eri):
+    # the straightforward loops over the spin orbitals
+    nsorb = len(h) * 2
+    seri = np.zeros((nsorb, nsorb, nsorb, nsorb))
+    sh = np.zeros((nsorb, nsorb))
+    for p, q, r, s in itertools.product(range(nsorb), repeat=4):
+        if p % 2 == s % 2 and q % 2 == r % 2:
+            seri[p, q, r, s] = eri[p // 2, s // 2, q // 2, r // 2]
+    for q, s in itertools.product(range(nsorb), repeat=2):
+        if q % 2 == s % 2:
+            sh[q, s] = h[q // 2, s // 2]
+    aseri = np.zeros((nsorb, nsorb, nsorb, nsorb))
+    for q, s in itertools.product(range(nsorb), repeat=2):
+        for p, r in itertools.product(range(q), range(s)):
+            aseri[p, q, r, s] = seri[p, q, r, s] - seri[p, q, s, r]
+    return sh, aseri
+
+
+def test_int_to_h():
+    norb = 3
+    rng = np.random.default_rng(0)
+    h = rng.random((norb, norb))
+    h = h + h.T
+    eri = rng.random((norb,) * 4)
+    # some zeros
+    eri[eri < 0.2] = 0
+    sh_ref, aseri_ref = int_to_h_reference(h, eri)
+    sh, aseri = h_qc.int_to_h(h, eri)
+    assert np.allclose(sh, sh_ref)
+    assert np.allclose(aseri, aseri_ref)
+    sh, aseri = h_qc.int_to_h(h, eri, sparse=True)
+    assert np.allclose(sh, sh_ref)
+    assert np.allclose(aseri.toarray().reshape(aseri_ref.shape), aseri_ref)
+    assert aseri.nnz == np.count_nonzero(aseri_ref)
+
+
+@pytest.mark.parametrize("stacked", (False, True))
+def test_sparse_qc_model(stacked):
+    fname = os.path.join(cur_dir, "H6.txt")
+    sh, aseri, nuc = h_qc.read_fcidump(fname, 6)
+    # parsed in small chunks
+    sh2, aseri2, nuc2 = h_qc.read_fcidump(fname, 6, sparse=True, chunk_size=50)
+    assert np.allclose(sh, sh2)
+    assert np.allclose(aseri, aseri2.toarray().reshape(aseri.shape))
+    assert nuc == nuc2
+    # the same terms in the same order
+    _, ham_terms = h_qc.qc_model(sh, aseri, stacked=stacked)
+    _, ham_terms2 = h_qc.qc_model(sh2, aseri2, stacked=stacked)
+    if stacked:
+        ham_terms = list(itertools.chain(*ham_terms))
+        ham_terms2 = list(itertools.chain(*ham_terms2))
+    assert ham_terms == ham_terms2
@@ -2,6 +2,7 @@ from renormalizer.mps.backend import backend
 from renormalizer.mps.mpo import Mpo, StackedMpo
 from renormalizer.mps.mps import Mps, BraKetPair
 from renormalizer.mps.mpdm import MpDm
+from renormalizer.mps.ensemble import MpsEnsemble
 from renormalizer.mps.thermalprop import ThermalProp, load_thermal_state
 from renormalizer.mps.gs import optimize_mps, DmrgFCISolver
 from renormalizer.mps.tda import TDA
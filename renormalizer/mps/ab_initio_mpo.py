@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+r"""
+Direct construction of the ab initio electronic Hamiltonian MPO from the integrals
+
+.. math::
+
+    \hat H = \sum_{pq} h_{pq} a^\dagger_p a_q + \sum_{pqrs} g_{pqrs} a^\dagger_p a^\dagger_q a_r a_s
+
+in the spin-orbital basis of :func:`renormalizer.model.h_qc.qc_model`, without enumerating the
+terms as :class:`~renormalizer.model.Op` and the bipartite graph algorithm of the general MPO construction.
+
+The MPO follows the complementary operator scheme. Each term is sorted by the site index
+and at each bond it is split into the left part :math:`L` and the right part :math:`R`.
+The bond states are
+
+- identity on the left (no operator on the left);
+- the complete left Hamiltonian (no operator on the right);
+- normal operators labelled by the ladder operators on the left
+  (``a_p``, ``a^\dagger_p``, ``a^\dagger_p a^\dagger_q``, ``a^\dagger_p a_q`` ...),
+  whose coefficients are contracted on the right;
+- complementary operators labelled by the ladder operators on the right,
+  whose coefficients are contracted on the left.
+
+For each way to split the terms, the kind with fewer possible labels is used.
+For example, the terms with 2 ladder operators on each side use the normal operators
+on the left half of the chain and the complementary operators on the right half,
+so the bond dimension is :math:`O(K^2)` for :math:`K` spin orbitals.
+
+The Jordan-Wigner strings are handled by the parity operator of the left block
+:math:`P_L = \prod_{l \in L} Z_l`: a product of fermionic operators :math:`F_L F_R` equals
+:math:`F_L P_L^{n_R} \otimes \tilde F_R`, where :math:`n_R` is the number of ladder operators in :math:`F_R`
+and :math:`\tilde F_R` is :math:`F_R` with the strings in the right block.
+So on every site the local operator is multiplied by :math:`Z` if
+an odd number of ladder operators are on the left of the next bond.
+
+The bond states of the different kinds could be linearly dependent. For example, the left Hamiltonian
+of the first site is proportional to the normal operator :math:`a^\dagger_0 a_0`.
+The linearly dependent states are finally removed by pivoted QR of the site tensors
+in each quantum number block, from the left and then from the right. The bond dimensions are then
+the minimal ones of an exact MPO, which are not larger than those of the general construction.
+"""
+
+import logging
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+
+from renormalizer.model.basis import BasisHalfSpin
+from renormalizer.model.h_qc import _eri_entries
+
+logger = logging.getLogger(__name__)
+
+# the kinds of the bond states
+_IDENTITY, _HAMILTONIAN, _NORMAL, _COMPLEMENTARY = range(4)
+# local operators on a site. `a_p` is mapped to "+" and `a^\dagger_p` is mapped to "-"
+_LOCAL_SYMBOLS = ["I", "+", "-", "- +"]
+# ladder operator types
+_ANNIHILATION, _CREATION = 0, 1
+
+
+def construct_ab_initio_mpo(basis, h1e, h2e, const=0):
+    r"""
+    Construct the ab initio electronic Hamiltonian MPO from the integrals.
+
+    Parameters
+    ----------
+    basis : :class:`list` of :class:`~renormalizer.model.basis.BasisHalfSpin`
+        The basis from :func:`~renormalizer.model.h_qc.qc_model`.
+        The spin orbital ``i`` should be on the ``i`` th site.
+    h1e : np.ndarray
+        The 1-e integrals :math:`h_{pq}` in spin orbitals with shape ``(K, K)``.
+    h2e : np.ndarray or scipy.sparse.spmatrix
+        The 2-e integrals :math:`g_{pqrs}` in spin orbitals, with shape ``(K, K, K, K)``
+        or as a sparse ``(pq, rs)`` matrix. See :func:`~renormalizer.model.h_qc.int_to_h`.
+    const : float
+        The constant added to the Hamiltonian.
+
+    Returns
+    -------
+    mo_list : :class:`list` of np.ndarray
+        The site tensors with the index convention ``(l, in, out, r)``.
+    mpoqn : :class:`list` of np.ndarray
+        The quantum number of each bond.
+    qntot : np.ndarray
+        The total quantum number of the MPO.
+    qnidx : int
+        The index of the quantum number.
+    """
+    nsite = len(basis)
+    for isite, b in enumerate(basis):
+        if not isinstance(b, BasisHalfSpin) or b.dof != isite:
+            raise ValueError(f"The spin orbital {isite} should be on the {isite} th site. Got {b}")
+    if h1e.shape != (nsite, nsite):
+        raise ValueError(f"Incompatible shape of h1e {h1e.shape} and the number of sites {nsite}")
+
+    sites, types, coefs = _normal_ordered_terms(h1e, h2e, nsite)
+    dtype = np.result_type(coefs, const, np.float64)
+    if len(coefs) == 0:
+        raise ValueError("Terms all have factor 0.")
+    logger.debug(f"Number of the normal ordered terms: {len(coefs)}")
+
+    qn_size = len(np.atleast_1d(basis[0].sigmaqn[0]))
+    # the quantum number of the ladder operators on each site.
+    # The last site is the sentinel for padding
+    op_qn = np.zeros((nsite + 1, 2, qn_size), dtype=int)
+    for isite, b in enumerate(basis):
+        sigmaqn = np.array(b.sigmaqn).reshape(2, qn_size)
+        op_qn[isite, _CREATION] = sigmaqn[1] - sigmaqn[0]
+        op_qn[isite, _ANNIHILATION] = sigmaqn[0] - sigmaqn[1]
+    term_qn = op_qn[sites, types]
+
+    z_mat = basis[0].op_mat("Z")
+    local_mats = []
+    for symbol in _LOCAL_SYMBOLS:
+        mat = basis[0].op_mat(symbol)
+        local_mats.extend([mat, mat @ z_mat])
+
+    nterms = len(coefs)
+    nops = np.count_nonzero(sites < nsite, axis=1)
+    # encoded ladder operators. 0 for padding
+    op_codes = np.where(sites < nsite, sites * 2 + types + 1, 0)
+    base = 2 * nsite + 1
+
+    # the left boundary
+    prev_keys = np.zeros(nterms, dtype=np.int64)
+    prev_unique = np.zeros(1, dtype=np.int64)
+    n_left_prev = np.zeros(nterms, dtype=int)
+
+    mo_list = []
+    mpoqn = [np.zeros((1, qn_size), dtype=int)]
+    for isite in range(nsite):
+        n_left = n_left_prev + np.count_nonzero(sites == isite, axis=1)
+        keys, kinds = _bond_keys(op_codes, n_left, nops, prev_keys // base ** 4 == _COMPLEMENTARY, base)
+        if isite == nsite - 1:
+            assert np.all(kinds == _HAMILTONIAN)
+        unique_keys, first_idx = np.unique(keys, return_index=True)
+        if const != 0:
+            unique_keys, first_idx = _add_key(unique_keys, first_idx, _HAMILTONIAN * base ** 4)
+        parity = np.where(first_idx == -1, 0, n_left[first_idx] % 2)
+
+        # the quantum number of the left operators
+        qn = np.zeros((len(unique_keys), qn_size), dtype=int)
+        exist = first_idx != -1
+        idx = first_idx[exist]
+        left_mask = np.arange(4) < n_left[idx, None]
+        left_qn = np.einsum("tj, tjq -> tq", left_mask.astype(int), term_qn[idx])
+        right_qn = np.einsum("tj, tjq -> tq", (~left_mask).astype(int), term_qn[idx])
+        is_complementary = (kinds[idx] == _COMPLEMENTARY)[:, None]
+        qn[exist] = np.where(is_complementary, -right_qn, left_qn)
+        mpoqn.append(qn)
+
+        rows, cols, local, weights = [], [], [], []
+        # the terms that do not change the bond state on this site
+        _, idx_prev, idx_next = np.intersect1d(prev_unique, unique_keys, assume_unique=True, return_indices=True)
+        rows.append(idx_prev)
+        cols.append(idx_next)
+        local.append(parity[idx_next])
+        weights.append(np.ones(len(idx_prev)))
+
+        active = np.nonzero(prev_keys != keys)[0]
+        row = np.searchsorted(prev_unique, prev_keys[active])
+        col = np.searchsorted(unique_keys, keys[active])
+        on_site = sites[active] == isite
+        has_annihilation = np.any(on_site & (types[active] == _ANNIHILATION), axis=1)
+        has_creation = np.any(on_site & (types[active] == _CREATION), axis=1)
+        code = (has_annihilation + 2 * has_creation) * 2 + n_left[active] % 2
+        prev_kinds = prev_keys[active] // base ** 4
+        # the coefficient is multiplied when the left part is changed to the complementary operator
+        with_coef = np.isin(prev_kinds, [_IDENTITY, _NORMAL]) \
+            & np.isin(kinds[active], [_HAMILTONIAN, _COMPLEMENTARY])
+
+        # the transitions without coefficient are shared by many terms
+        transitions = np.unique(np.stack([row, col, code])[:, ~with_coef], axis=1)
+        rows.append(transitions[0])
+        cols.append(transitions[1])
+        local.append(transitions[2])
+        weights.append(np.ones(transitions.shape[1]))
+        rows.append(row[with_coef])
+        cols.append(col[with_coef])
+        local.append(code[with_coef])
+        weights.append(coefs[active][with_coef])
+        if isite == 0 and const != 0:
+            rows.append([0])
+            cols.append([np.searchsorted(unique_keys, _HAMILTONIAN * base ** 4)])
+            local.append([0])
+            weights.append([const])
+
+        rows, cols, local, weights = [np.concatenate(x) for x in [rows, cols, local, weights]]
+        shape = (len(prev_unique), len(unique_keys))
+        mo = np.zeros(shape + local_mats[0].shape, dtype=dtype)
+        for icode, mat in enumerate(local_mats):
+            mask = local == icode
+            if not mask.any():
+                continue
+            coef_mat = scipy.sparse.coo_matrix((weights[mask], (rows[mask], cols[mask])), shape=shape)
+            mo += coef_mat.toarray()[:, :, None, None] * mat
+        mo_list.append(mo.transpose(0, 2, 3, 1).copy())
+
+        prev_keys, prev_unique, n_left_prev = keys, unique_keys, n_left
+
+    _remove_redundant_states(mo_list, mpoqn)
+
+    qntot = mpoqn[-1][0]
+    mpoqn[-1] = np.zeros((1, qn_size), dtype=int)
+    qnidx = len(mo_list) - 1
+    return mo_list, mpoqn, qntot, qnidx
+
+
+def _remove_redundant_states(mo_list, mpoqn, rtol=1e-10):
+    # Remove the linearly dependent bond states in place, such as the left Hamiltonian
+    # of the first site which is proportional to the normal operator `a^\dagger_0 a_0`.
+    # The site tensors are decomposed by pivoted QR from the left and then from the right,
+    # which leaves the minimal bond dimensions of an exact MPO.
+    # The states with different quantum numbers are independent, so each quantum number
+    # block is decomposed separately to keep the quantum numbers of the bond.
+    for isite in range(len(mo_list) - 1):
+        mo = mo_list[isite]
+        q, r_blocks, mpoqn[isite + 1] = _blocked_qr(mo.reshape(-1, mo.shape[-1]), mpoqn[isite + 1], rtol)
+        mo_list[isite] = q.reshape(mo.shape[:-1] + (-1,))
+        mo_next = mo_list[isite + 1]
+        mo_list[isite + 1] = np.concatenate([np.tensordot(r, mo_next[cols], axes=1) for cols, r in r_blocks])
+    for isite in range(len(mo_list) - 1, 0, -1):
+        mo = mo_list[isite]
+        q, r_blocks, mpoqn[isite] = _blocked_qr(mo.reshape(mo.shape[0], -1).T, mpoqn[isite], rtol)
+        mo_list[isite] = q.T.reshape((-1,) + mo.shape[1:])
+        mo_prev = mo_list[isite - 1]
+        mo_list[isite - 1] = np.concatenate(
+            [np.tensordot(mo_prev[..., cols], r.T, axes=1) for cols, r in r_blocks], axis=-1
+        )
+
+
+def _blocked_qr(mat, qn, rtol):
+    # mat = q @ r with pivoted QR in each quantum number block of the columns,
+    # truncated by the rank relative to the largest diagonal element of r.
+    # Returns q, the blocks of r as the column indices and the matrix of each block,
+    # and the quantum numbers of the new columns
+    _, block_idx = np.unique(qn, axis=0, return_inverse=True)
+    block_idx = block_idx.reshape(-1)
+    blocks = []
+    for iblock in range(block_idx.max() + 1):
+        cols = np.nonzero(block_idx == iblock)[0]
+        # the rows of different blocks do not overlap
+        rows = np.nonzero(np.any(mat[:, cols] != 0, axis=1))[0]
+        q, r, p = scipy.linalg.qr(mat[np.ix_(rows, cols)], mode="economic", pivoting=True)
+        blocks.append((rows, cols, q, r, p))
+    r_max = max(np.abs(r[0, 0]) for _, _, _, r, _ in blocks if r.size)
+    q_list, r_blocks, qn_list = [], [], []
+    for rows, cols, q, r, p in blocks:
+        rank = np.count_nonzero(np.abs(np.diag(r)) > r_max * rtol)
+        q_block = np.zeros((mat.shape[0], rank), dtype=q.dtype)
+        q_block[rows] = q[:, :rank]
+        q_list.append(q_block)
+        r_blocks.append((cols, r[:rank, np.argsort(p)]))
+        qn_list.append(np.repeat(qn[cols[:1]], rank, axis=0))
+    return np.concatenate(q_list, axis=1), r_blocks, np.concatenate(qn_list)
+
+
+def _normal_ordered_terms(h1e, h2e, nsite):
+    # Sort the ladder operators of each term by site index.
+    # Returns the sites and types of the ladder operators padded to 4 and the coefficients.
+    # The padding site is `nsite`.
+    pairs1 = np.argwhere(h1e != 0)
+    values1 = h1e[tuple(pairs1.T)]
+    pairs2, values2 = _eri_entries(h2e, nsite)
+    padding = np.full((len(pairs1), 2), nsite)
+    sites = np.concatenate([np.hstack([pairs1, padding]), pairs2]).astype(int)
+    types = np.zeros_like(sites)
+    types[:len(pairs1), 0] = _CREATION
+    types[len(pairs1):, :2] = _CREATION
+    coefs = np.concatenate([values1, values2])
+
+    # the sign of the permutation. The ladder operators on different sites anti-commute
+    # and the order of the operators on the same site is not changed by the stable sort
+    inversion = np.zeros(len(sites), dtype=int)
+    for i in range(4):
+        for j in range(i+1, 4):
+            inversion += sites[:, i] > sites[:, j]
+    order = np.argsort(sites, axis=1, kind="stable")
+    sites = np.take_along_axis(sites, order, axis=1)
+    types = np.take_along_axis(types, order, axis=1)
+    coefs = coefs * (-1) ** inversion
+
+    # `a_p a_p` and `a^\dagger_p a^\dagger_p` are zero.
+    # 3 operators on the same site always contain one of them
+    zero = np.any((sites[:, 1:] == sites[:, :-1]) & (types[:, 1:] == types[:, :-1]) & (sites[:, 1:] != nsite), axis=1)
+    nonzero = ~zero & (coefs != 0)
+    return sites[nonzero], types[nonzero], coefs[nonzero]
+
+
+def _bond_keys(op_codes, n_left, nops, was_complementary, base):
+    # the bond state of each term as an integer key and the kind of the state.
+    # The normal operators are labelled by the ladder operators on the left
+    # and the complementary operators by the ladder operators on the right.
+    # For each way to split the terms, the kind with fewer labels is used.
+    # The terms that have been complementary operators are not changed back to normal operators
+    slots = np.arange(4)
+    normal_labels = np.where(slots < n_left[:, None], op_codes, 0)
+    # shift the ladder operators on the right to the start, so the label does not depend on `n_left`.
+    # The padding is 0
+    shifted = np.minimum(slots + n_left[:, None], 3)
+    complementary_labels = np.where(slots + n_left[:, None] < 4, np.take_along_axis(op_codes, shifted, axis=1), 0)
+    normal_keys = _encode(_NORMAL, normal_labels, base)
+    complementary_keys = _encode(_COMPLEMENTARY, complementary_labels, base)
+
+    kinds = np.full(len(n_left), _NORMAL)
+    kinds[was_complementary] = _COMPLEMENTARY
+    # the labels could be shared by different ways to split, so the number of new labels is compared
+    chosen = np.unique(complementary_keys[was_complementary])
+    for n in np.unique(nops)[::-1]:
+        for m in range(1, n):
+            mask = (nops == n) & (n_left == m) & ~was_complementary
+            new_normal = np.setdiff1d(normal_keys[mask], chosen)
+            new_complementary = np.setdiff1d(complementary_keys[mask], chosen)
+            if len(new_complementary) < len(new_normal):
+                kinds[mask] = _COMPLEMENTARY
+                chosen = np.union1d(chosen, new_complementary)
+            else:
+                chosen = np.union1d(chosen, new_normal)
+    kinds[n_left == 0] = _IDENTITY
+    kinds[n_left == nops] = _HAMILTONIAN
+    keys = np.where(kinds == _NORMAL, normal_keys, complementary_keys)
+    keys[kinds == _IDENTITY] = _IDENTITY * base ** 4
+    keys[kinds == _HAMILTONIAN] = _HAMILTONIAN * base ** 4
+    return keys, kinds
+
+
+def _encode(kind, labels, base):
+    # encode the kind and the 4 slots of the labels into one integer
+    return kind * base ** 4 + labels @ base ** np.arange(3, -1, -1)
+
+
+def _add_key(unique_keys, first_idx, key):
+    # add a key without any term in the sorted unique keys
+    if key in unique_keys:
+        return unique_keys, first_idx
+    pos = np.searchsorted(unique_keys, key)
+    return np.insert(unique_keys, pos, key), np.insert(first_idx, pos, -1)
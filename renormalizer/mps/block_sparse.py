@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+r"""
+Block-sparse tensors with U(1) quantum number symmetry.
+
+Each leg of a :class:`BlockSparseTensor` carries a quantum number array of shape ``(dim, qn_size)``
+(the same format as ``MatrixProduct.qn`` and ``Basis.sigmaqn``) and a sign (``+1`` or ``-1``)
+indicating the flow direction of the quantum number.
+Only the blocks satisfying :math:`\sum_i s_i q_i = q_{\rm tot}` are stored, so
+the symmetry-forbidden zeros of the dense tensor never enter the contractions.
+
+For matrix products the quantum number of every bond is taken in the "L-system" representation
+(see :func:`mp_bond_qn`), with the legs of an MPS site being ``(+1, +1, -1)`` and those of an MPO site
+being ``(+1, +1, -1, -1)``.
+"""
+
+import itertools
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def _leg_sectors(qn: np.ndarray) -> Dict[Tuple, np.ndarray]:
+    # map from the quantum number of a sector to the indices of the sector
+    qn = np.asarray(qn)
+    sectors, inverse = np.unique(qn, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    res = {}
+    for i, sector in enumerate(sectors):
+        res[tuple(sector.tolist())] = np.where(inverse == i)[0]
+    return res
+
+
+class BlockSparseTensor:
+    r""" U(1) block-sparse tensor.
+
+    Parameters
+    ----------
+    qns : list of np.ndarray
+        The quantum numbers of each leg. Each array has shape ``(dim, qn_size)``.
+    signs : list of int
+        The flow direction of the quantum number of each leg. Either ``1`` or ``-1``.
+    qntot : np.ndarray
+        The total quantum number of the tensor.
+    blocks : dict
+        The nonzero blocks. The key is a tuple whose elements are the quantum numbers (as tuples)
+        of the sectors on each leg. Missing blocks are regarded as zero.
+    dtype : np.dtype
+        Data type of the blocks.
+    """
+
+    def __init__(self, qns: List[np.ndarray], signs, qntot, blocks: Dict[Tuple, np.ndarray], dtype):
+        assert len(qns) == len(signs)
+        self.qns: List[np.ndarray] = [np.asarray(qn) for qn in qns]
+        self.signs: np.ndarray = np.array(signs, dtype=int)
+        self.qntot: np.ndarray = np.array(qntot, dtype=int).ravel()
+        self.blocks: Dict[Tuple, np.ndarray] = blocks
+        self.dtype = np.dtype(dtype)
+        self._sectors = [None] * len(qns)
+
+    @classmethod
+    def from_dense(cls, array: np.ndarray, qns: List[np.ndarray], signs, qntot, check: bool = True,
+                   atol: float = 1e-10) -> "BlockSparseTensor":
+        """
+        Construct the block-sparse tensor from a dense array.
+        If ``check`` is ``True`` and the dense array has non-negligible elements that
+        violate the quantum number conservation, ``ValueError`` is raised.
+        """
+        array = np.asarray(array)
+        assert array.ndim == len(qns)
+        for qn, dim in zip(qns, array.shape):
+            if len(qn) != dim:
+                raise ValueError(f"Quantum number and array dimension mismatch: {len(qn)} vs {dim}")
+        new = cls(qns, signs, qntot, {}, array.dtype)
+        if check:
+            kept = np.zeros(array.shape, dtype=bool)
+        for key in new.allowed_keys():
+            idx = np.ix_(*[new.sectors(i)[q] for i, q in enumerate(key)])
+            new.blocks[key] = array[idx]
+            if check:
+                kept[idx] = True
+        if check and atol < np.abs(array[~kept]).max(initial=0):
+            raise ValueError("The array does not conserve the quantum number")
+        return new
+
+    @property
+    def ndim(self) -> int:
+        return len(self.qns)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(len(qn) for qn in self.qns)
+
+    @property
+    def size(self) -> int:
+        # number of stored elements
+        return sum(b.size for b in self.blocks.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self.blocks.values())
+
+    def sectors(self, i: int) -> Dict[Tuple, np.ndarray]:
+        if self._sectors[i] is None:
+            self._sectors[i] = _leg_sectors(self.qns[i])
+        return self._sectors[i]
+
+    def allowed_keys(self) -> List[Tuple]:
+        """
+        All block keys that conserve the quantum number, no matter whether the block is stored.
+        """
+        keys = []
+        qntot = self.qntot
+        last_sectors = self.sectors(self.ndim - 1)
+        for key in itertools.product(*[self.sectors(i).keys() for i in range(self.ndim - 1)]):
+            q = qntot.copy()
+            for sign, sector in zip(self.signs, key):
+                q -= sign * np.array(sector)
+            q_last = tuple((self.signs[-1] * q).tolist())
+            if q_last in last_sectors:
+                keys.append(key + (q_last,))
+        return keys
+
+    def block_shape(self, key) -> Tuple[int, ...]:
+        return tuple(len(self.sectors(i)[q]) for i, q in enumerate(key))
+
+    def to_dense(self) -> np.ndarray:
+        array = np.zeros(self.shape, dtype=self.dtype)
+        for key, block in self.blocks.items():
+            idx = [self.sectors(i)[q] for i, q in enumerate(key)]
+            array[np.ix_(*idx)] = block
+        return array
+
+    todense = to_dense
+
+    def _new_like(self, blocks, qns=None, signs=None, qntot=None, dtype=None) -> "BlockSparseTensor":
+        new = self.__class__(
+            self.qns if qns is None else qns,
+            self.signs if signs is None else signs,
+            self.qntot if qntot is None else qntot,
+            blocks,
+            self.dtype if dtype is None else dtype,
+        )
+        if qns is None:
+            new._sectors = self._sectors
+        return new
+
+    def copy(self) -> "BlockSparseTensor":
+        return self._new_like({k: b.copy() for k, b in self.blocks.items()})
+
+    def conj(self) -> "BlockSparseTensor":
+        """
+        Complex conjugate. The flow direction of all legs is reversed.
+        """
+        return self._new_like({k: b.conj() for k, b in self.blocks.items()}, signs=-self.signs, qntot=-self.qntot)
+
+    def reverse_flow(self) -> "BlockSparseTensor":
+        """
+        Reverse the flow direction of all legs without conjugating the data.
+        """
+        return self._new_like(self.blocks, signs=-self.signs, qntot=-self.qntot)
+
+    def transpose(self, *axes) -> "BlockSparseTensor":
+        if len(axes) == 1 and not isinstance(axes[0], int):
+            axes = axes[0]
+        axes = list(axes)
+        assert sorted(axes) == list(range(self.ndim))
+        blocks = {tuple(k[i] for i in axes): b.transpose(axes) for k, b in self.blocks.items()}
+        new = self._new_like(blocks, qns=[self.qns[i] for i in axes], signs=self.signs[axes])
+        new._sectors = [self._sectors[i] for i in axes]
+        return new
+
+    def norm(self) -> float:
+        return float(np.sqrt(sum(np.linalg.norm(b) ** 2 for b in self.blocks.values())))
+
+    def __mul__(self, other):
+        if not np.isscalar(other):
+            return NotImplemented
+        blocks = {k: b * other for k, b in self.blocks.items()}
+        return self._new_like(blocks, dtype=np.result_type(self.dtype, other))
+
+    __rmul__ = __mul__
+
+    def __add__(self, other: "BlockSparseTensor"):
+        if not isinstance(other, BlockSparseTensor):
+            return NotImplemented
+        assert np.all(self.signs == other.signs) and np.all(self.qntot == other.qntot)
+        blocks = {k: b.copy() for k, b in self.blocks.items()}
+        for k, b in other.blocks.items():
+            if k in blocks:
+                blocks[k] = blocks[k] + b
+            else:
+                blocks[k] = b.copy()
+        return self._new_like(blocks, dtype=np.result_type(self.dtype, other.dtype))
+
+    def ravel(self, like: "BlockSparseTensor" = None) -> np.ndarray:
+        """
+        Flatten the stored elements into a 1d vector. The block layout is determined by ``like``.
+        Blocks stored in ``like`` but not in ``self`` are padded with zeros.
+        """
+        if like is None:
+            like = self
+        res = []
+        for key in sorted(like.blocks.keys()):
+            block = self.blocks.get(key)
+            if block is None:
+                block = np.zeros(like.blocks[key].shape, dtype=self.dtype)
+            res.append(block.ravel())
+        if len(res) == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(res)
+
+    def unravel(self, vector: np.ndarray) -> "BlockSparseTensor":
+        """
+        The inverse of :meth:`ravel`. Returns a new tensor with the same block layout with ``self``.
+        """
+        assert vector.ndim == 1 and len(vector) == self.size
+        blocks = {}
+        offset = 0
+        for key in sorted(self.blocks.keys()):
+            shape = self.blocks[key].shape
+            size = int(np.prod(shape))
+            blocks[key] = vector[offset:offset + size].reshape(shape)
+            offset += size
+        return self._new_like(blocks, dtype=vector.dtype)
+
+    def fused_matrix(self, nleft: int, qn_left, lset: np.ndarray, rset: np.ndarray) -> np.ndarray:
+        r"""
+        Assemble the dense matrix of one symmetry sector after fusing the first
+        ``nleft`` legs into the row index and the rest of the legs into the column index.
+
+        Parameters
+        ----------
+        nleft : int
+            Number of legs fused to the row index.
+        qn_left : tuple
+            The fused quantum number of the row index :math:`\sum_{i < {\rm nleft}} s_i q_i`.
+        lset : np.ndarray
+            The sorted flattened (C-order) row indices of the sector.
+        rset : np.ndarray
+            The sorted flattened (C-order) column indices of the sector.
+        """
+        qn_left = np.asarray(qn_left)
+        lshape = self.shape[:nleft]
+        rshape = self.shape[nleft:]
+        mat = np.zeros((len(lset), len(rset)), dtype=self.dtype)
+        for key, block in self.blocks.items():
+            q = sum(sign * np.array(sector) for sign, sector in zip(self.signs[:nleft], key[:nleft]))
+            if not np.all(q == qn_left):
+                continue
+            idx = [self.sectors(i)[sector] for i, sector in enumerate(key)]
+            lflat = np.ravel_multi_index(np.ix_(*idx[:nleft]), lshape).ravel()
+            rflat = np.ravel_multi_index(np.ix_(*idx[nleft:]), rshape).ravel()
+            lpos = np.searchsorted(lset, lflat)
+            rpos = np.searchsorted(rset, rflat)
+            mat[np.ix_(lpos, rpos)] = block.reshape(len(lflat), len(rflat))
+        return mat
+
+    def __repr__(self):
+        return f"<BlockSparseTensor at 0x{id(self):x} {self.shape} {self.dtype} {len(self.blocks)} blocks>"
+
+
+def tensordot(a: BlockSparseTensor, b: BlockSparseTensor, axes) -> BlockSparseTensor:
+    """
+    Contract two block-sparse tensors. The semantics of ``axes`` is the same with
+    ``np.tensordot`` except that an integer is not supported.
+    The contracted legs should have the same quantum numbers and opposite signs.
+    """
+    axes_a, axes_b = [list(ax) for ax in axes]
+    assert len(axes_a) == len(axes_b)
+    for ia, ib in zip(axes_a, axes_b):
+        if a.signs[ia] != -b.signs[ib]:
+            raise ValueError(f"Contracting legs with the same sign: {ia} and {ib}")
+        if not np.array_equal(a.qns[ia], b.qns[ib]):
+            raise ValueError(f"Contracting legs with different quantum numbers: {ia} and {ib}")
+    free_a = [i for i in range(a.ndim) if i not in axes_a]
+    free_b = [i for i in range(b.ndim) if i not in axes_b]
+
+    # the blocks are reshaped to matrices only once to reduce the overhead of ``np.tensordot``
+    b_groups: Dict[Tuple, List] = {}
+    for key, block in b.blocks.items():
+        free_shape = tuple(block.shape[i] for i in free_b)
+        matrix = block.transpose(axes_b + free_b).reshape(-1, int(np.prod(free_shape)))
+        b_groups.setdefault(tuple(key[i] for i in axes_b), []).append((key, matrix, free_shape))
+
+    blocks = {}
+    for key_a, block_a in a.blocks.items():
+        group = b_groups.get(tuple(key_a[i] for i in axes_a))
+        if group is None:
+            continue
+        free_shape_a = tuple(block_a.shape[i] for i in free_a)
+        matrix_a = block_a.transpose(free_a + axes_a).reshape(int(np.prod(free_shape_a)), -1)
+        for key_b, matrix_b, free_shape_b in group:
+            key = tuple(key_a[i] for i in free_a) + tuple(key_b[i] for i in free_b)
+            res = (matrix_a @ matrix_b).reshape(free_shape_a + free_shape_b)
+            if key in blocks:
+                blocks[key] += res
+            else:
+                blocks[key] = res
+
+    new = BlockSparseTensor(
+        [a.qns[i] for i in free_a] + [b.qns[i] for i in free_b],
+        [a.signs[i] for i in free_a] + [b.signs[i] for i in free_b],
+        a.qntot + b.qntot,
+        blocks,
+        np.result_type(a.dtype, b.dtype),
+    )
+    new._sectors = [a._sectors[i] for i in free_a] + [b._sectors[i] for i in free_b]
+    return new
+
+
+def diagonal_lr(environ: BlockSparseTensor) -> np.ndarray:
+    """
+    The diagonal part ``x[b, a] = environ[a, b, a]`` of an L/R environment in dense format.
+    Used for the preconditioner of the iterative eigensolvers.
+    """
+    assert environ.ndim == 3
+    assert np.array_equal(environ.qns[0], environ.qns[2])
+    res = np.zeros((environ.shape[1], environ.shape[0]), dtype=environ.dtype)
+    for key, block in environ.blocks.items():
+        if key[0] != key[2]:
+            continue
+        idx_a = environ.sectors(0)[key[0]]
+        idx_b = environ.sectors(1)[key[1]]
+        res[np.ix_(idx_b, idx_a)] = np.einsum("aba -> ba", block)
+    return res
+
+
+def mp_bond_qn(mp, idx: int) -> np.ndarray:
+    """
+    Quantum number of the ``idx`` th bond of a matrix product in the L-system representation.
+    ``MatrixProduct.qn`` is in the R-system representation for bonds on the right of ``qnidx``.
+    """
+    qn = np.asarray(mp.qn[idx])
+    if idx <= mp.qnidx:
+        return qn
+    return np.asarray(mp.qntot) - qn
+
+
+def mp_site_to_block_sparse(mp, idx: int, array=None) -> BlockSparseTensor:
+    """
+    Convert the ``idx`` th site of an MPS or MPO to block-sparse format.
+    If ``array`` is provided, it is used as the site tensor instead of ``mp[idx]``.
+    """
+    if array is None:
+        array = mp[idx]
+    array = getattr(array, "array", array)
+    sigmaqn = mp.model.basis[idx].sigmaqn
+    qnl = mp_bond_qn(mp, idx)
+    qnr = mp_bond_qn(mp, idx + 1)
+    if mp.is_mps:
+        qns = [qnl, sigmaqn, qnr]
+        signs = [1, 1, -1]
+    elif mp.is_mpo:
+        qns = [qnl, sigmaqn, sigmaqn, qnr]
+        signs = [1, 1, -1, -1]
+    else:
+        raise NotImplementedError("Block-sparse format for MPDM is not implemented")
+    return BlockSparseTensor.from_dense(array, qns, signs, np.zeros(mp.model.qn_size, dtype=int))
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from typing import List
+
+import numpy as np
+import scipy.stats
+
+from renormalizer.lib import expm_krylov_batch
+from renormalizer.mps import svd_qn
+from renormalizer.mps.backend import xp
+from renormalizer.mps.matrix import asnumpy, asxp
+from renormalizer.mps.mpo import Mpo
+from renormalizer.mps.mps import Mps
+from renormalizer.utils import EvolveMethod
+
+logger = logging.getLogger(__name__)
+
+
+class MpsEnsemble:
+    r"""
+    An ensemble of MPSs with identical bond dimensions that are evolved together
+    under the same MPO, such as the trajectories with different disorder realizations
+    or initial excitation sites.
+
+    In the time evolution, the site tensors and the environments of the MPSs are stacked
+    with a leading batch index. The local effective Hamiltonians of all MPSs are applied
+    in one batched contraction per site, and the Lanczos iterations are also carried out together.
+    The quantum numbers are handled for each MPS separately.
+
+    Only the one-site TDVP-PS method with the Krylov propagator and fixed time step is supported.
+
+    Parameters
+    ----------
+    mps_list : list of :class:`Mps`
+        The MPSs. The shapes of the local tensors must be the same
+        and the MPSs must be canonicalised in the same direction.
+        The evolve config of the first MPS is used.
+    """
+
+    def __init__(self, mps_list: List[Mps]):
+        if len(mps_list) == 0:
+            raise ValueError("The ensemble is empty")
+        ref = mps_list[0]
+        for mps in mps_list[1:]:
+            if len(mps) != len(ref):
+                raise ValueError("The numbers of sites of the MPSs are different")
+            if any(mps[i].shape != ref[i].shape for i in range(len(ref))):
+                raise ValueError("The bond dimensions of the MPSs are different")
+            if mps.to_right != ref.to_right or mps.qnidx != ref.qnidx:
+                raise ValueError("The MPSs are not canonicalised in the same direction")
+        self.mps_list = mps_list
+
+    @property
+    def evolve_config(self):
+        return self.mps_list[0].evolve_config
+
+    def __len__(self):
+        return len(self.mps_list)
+
+    def __getitem__(self, item):
+        return self.mps_list[item]
+
+    def __iter__(self):
+        return iter(self.mps_list)
+
+    def evolve(self, mpo: Mpo, evolve_dt, normalize=True) -> "MpsEnsemble":
+        config = self.evolve_config
+        if config.method != EvolveMethod.tdvp_ps:
+            raise NotImplementedError(f"Ensemble evolution with {config.method} is not supported")
+        if config.ivp_solver != "krylov":
+            raise NotImplementedError(f"Ensemble evolution with {config.ivp_solver} is not supported")
+        if config.adaptive:
+            raise NotImplementedError("Ensemble evolution with adaptive time step is not supported")
+        new_ensemble = self._evolve_tdvp_ps(mpo, evolve_dt)
+        if normalize:
+            for mps in new_ensemble:
+                if np.iscomplex(evolve_dt):
+                    mps.normalize("mps_and_coeff")
+                else:
+                    mps.normalize("mps_only")
+        return new_ensemble
+
+    def _evolve_tdvp_ps(self, mpo, evolve_dt) -> "MpsEnsemble":
+        # the batched version of `Mps._evolve_tdvp_ps` with the Krylov propagator
+        if np.iscomplex(evolve_dt):
+            mps_list = [mps.copy() for mps in self.mps_list]
+        else:
+            mps_list = [mps.to_complex() for mps in self.mps_list]
+        ref = mps_list[0]
+        nsite = len(ref)
+        nbatch = len(mps_list)
+
+        # the stacked site tensors
+        ms = [xp.stack([asxp(mps[imps].array) for mps in mps_list]) for imps in range(nsite)]
+        # cast once to avoid the conversion in every contraction
+        mo = [asxp(mpo[imps].array).astype(ms[imps].dtype) for imps in range(nsite)]
+
+        # the stacked environments
+        sentinel = xp.ones((nbatch, 1, 1, 1))
+        l_env = {-1: sentinel}
+        r_env = {nsite: sentinel}
+        for imps in range(nsite):
+            l_env[imps] = _contract_one_site(l_env[imps-1], ms[imps], mo[imps], "L")
+        for imps in reversed(range(nsite)):
+            r_env[imps] = _contract_one_site(r_env[imps+1], ms[imps], mo[imps], "R")
+
+        # statistics for debug output
+        local_steps = []
+        # sweep for 2 rounds
+        for i in range(2):
+            for imps in ref.iter_idx_list(full=True):
+                system = "L" if ref.to_right else "R"
+                shape = ms[imps].shape
+                hop = _hop_expr(l_env[imps-1], r_env[imps+1], mo[imps], shape)
+                ms_t, j = expm_krylov_batch(
+                    lambda y: hop(y.reshape(shape)).reshape(nbatch, -1),
+                    -1j * evolve_dt / 2, ms[imps].reshape(nbatch, -1)
+                )
+                local_steps.extend(j)
+                ms_t = ms_t.reshape(shape)
+
+                if (not ref.to_right and imps == 0) or (ref.to_right and imps == nsite - 1):
+                    ms[imps] = ms_t
+                    continue
+
+                u_list, vt_list = [], []
+                for k, mps in enumerate(mps_list):
+                    qnbigl, qnbigr, _ = mps._get_big_qn([imps])
+                    u, qnlset, v, qnrset = svd_qn.svd_qn(
+                        asnumpy(ms_t[k]),
+                        qnbigl,
+                        qnbigr,
+                        mps.qntot,
+                        QR=True,
+                        system=system,
+                        full_matrices=False,
+                    )
+                    u_list.append(u)
+                    vt_list.append(v.T)
+                    if not ref.to_right:
+                        mps.qn[imps] = qnrset
+                        mps.qnidx = imps - 1
+                    else:
+                        mps.qn[imps + 1] = qnlset
+                        mps.qnidx = imps + 1
+                u = _stack(u_list)
+                vt = _stack(vt_list)
+
+                if not ref.to_right:
+                    ms[imps] = vt.reshape((nbatch, -1) + shape[2:])
+                    r_env[imps] = _contract_one_site(r_env[imps+1], ms[imps], mo[imps], "R")
+                    # reverse update u site
+                    hop_u = _hop_expr(l_env[imps-1], r_env[imps], None, u.shape)
+                    u_t, j = expm_krylov_batch(
+                        lambda y: hop_u(y.reshape(u.shape)).reshape(nbatch, -1),
+                        1j * evolve_dt / 2, u.reshape(nbatch, -1)
+                    )
+                    local_steps.extend(j)
+                    ms[imps-1] = xp.einsum("kabc, kcd -> kabd", ms[imps-1], u_t.reshape(u.shape))
+                else:
+                    ms[imps] = u.reshape(shape[:-1] + (-1,))
+                    l_env[imps] = _contract_one_site(l_env[imps-1], ms[imps], mo[imps], "L")
+                    # reverse update svt site
+                    hop_vt = _hop_expr(l_env[imps], r_env[imps+1], None, vt.shape)
+                    vt_t, j = expm_krylov_batch(
+                        lambda y: hop_vt(y.reshape(vt.shape)).reshape(nbatch, -1),
+                        1j * evolve_dt / 2, vt.reshape(nbatch, -1)
+                    )
+                    local_steps.extend(j)
+                    ms[imps+1] = xp.einsum("kab, kbcd -> kacd", vt_t.reshape(vt.shape), ms[imps+1])
+
+            for mps in mps_list:
+                mps._switch_direction()
+
+        for k, mps in enumerate(mps_list):
+            for imps in range(nsite):
+                mps[imps] = ms[imps][k]
+
+        steps_stat = scipy.stats.describe(local_steps)
+        logger.debug(f"Ensemble TDVP-PS Krylov space: {steps_stat}")
+        return self.__class__(mps_list)
+
+
+def _stack(arrays):
+    if any(a.shape != arrays[0].shape for a in arrays):
+        raise ValueError("The bond dimensions of the MPSs in the ensemble diverged")
+    return xp.stack([asxp(a) for a in arrays])
+
+
+# The contractions below share the batch index k among the tensors, which ``opt_einsum``
+# carries out with ``einsum`` without BLAS. So they are written as batched ``matmul``
+# with the environments and one ``tensordot`` with the shared MPO.
+# The index convention is the same with `renormalizer.mps.hop_expr.hop_expr`:
+#   S-a   l-S
+#     d
+#   O-b-O-f-O
+#     e
+#   S-c   n-S
+
+
+def _contract_one_site(environ, ms, mo, domain):
+    # the batched version of `renormalizer.mps.lib.contract_one_site` for MPS
+    nbatch = len(ms)
+    a, d, l = ms.shape[1:]
+    if domain == "L":
+        # kabc, kcen -> kaben
+        res = xp.matmul(environ.reshape(nbatch, -1, a), ms.reshape(nbatch, a, -1))
+        # kaben, bdef -> kandf
+        res = xp.tensordot(res.reshape(environ.shape[:3] + (d, l)), mo, axes=([2, 3], [0, 2]))
+        # kandf, kadl -> knfl
+        res = res.transpose(0, 2, 4, 1, 3).reshape(nbatch, -1, a * d)
+        res = xp.matmul(res, ms.conj().reshape(nbatch, a * d, l))
+        return res.reshape(nbatch, l, mo.shape[-1], l).transpose(0, 3, 2, 1)
+    else:
+        # kcen, klfn -> kcelf
+        res = xp.matmul(ms.reshape(nbatch, -1, l), environ.transpose(0, 3, 1, 2).reshape(nbatch, l, -1))
+        # kcelf, bdef -> kclbd
+        res = xp.tensordot(res.reshape(nbatch, a, d, l, mo.shape[-1]), mo, axes=([2, 4], [2, 3]))
+        # kadl, kclbd -> kacb
+        res = res.transpose(0, 4, 2, 1, 3).reshape(nbatch, d * l, -1)
+        res = xp.matmul(ms.conj().reshape(nbatch, a, d * l), res)
+        return res.reshape(nbatch, a, a, mo.shape[0]).transpose(0, 1, 3, 2)
+
+
+def _hop_expr(ltensor, rtensor, mo, shape):
+    # the batched version of `renormalizer.mps.hop_expr.hop_expr` without ancilla.
+    # The environments are different for each MPS and the MPO is shared
+    nbatch = shape[0]
+    a, b = ltensor.shape[1:3]
+    l, f = rtensor.shape[1:3]
+    if mo is None:
+        # kabc, klbn, kcn -> kal
+        r = rtensor.transpose(0, 2, 3, 1).reshape(nbatch, -1, l)
+
+        def hop(c):
+            res = xp.matmul(ltensor.reshape(nbatch, a * b, -1), c)
+            return xp.matmul(res.reshape(nbatch, a, -1), r)
+    else:
+        d = mo.shape[1]
+        r = rtensor.transpose(0, 2, 3, 1).reshape(nbatch, -1, l)
+
+        def hop(c):
+            # kabc, kcen -> kaben
+            res = xp.matmul(ltensor.reshape(nbatch, a * b, -1), c.reshape(nbatch, c.shape[1], -1))
+            # kaben, bdef -> kandf
+            res = xp.tensordot(res.reshape(nbatch, a, b, c.shape[2], -1), mo, axes=([2, 3], [0, 2]))
+            # kandf, klfn -> kadl
+            res = res.transpose(0, 1, 3, 4, 2).reshape(nbatch, a * d, -1)
+            return xp.matmul(res, r).reshape(nbatch, a, d, l)
+    return hop
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Storage backends of the environment tensors in :class:`renormalizer.mps.lib.Environ`.
+
+The environment tensors are keyed by ``(domain, siteidx)``. For large bond dimensions
+the environments of all sites may not fit into the memory, in which case they can be
+stored in memory-mapped ``.npy`` files or in an HDF5 file.
+Because during a sweep the environments are read site by site, the disk backends
+prefetch the environment of the next site in a background thread.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStorage(dict):
+    """
+    Store the environments in the memory. Same as the plain ``dict`` used previously.
+    """
+
+    def prefetch(self, key):
+        pass
+
+    def discard_prefetch(self):
+        pass
+
+    def close(self):
+        self.clear()
+
+
+class DiskStorage:
+    """
+    Base class of the disk storage backends. Subclasses implement
+    ``_save``, ``_load`` and ``_delete``.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to put the files. If ``None``, the system temporary directory is used.
+    prefetch : bool
+        Whether to enable asynchronous prefetch.
+    """
+
+    def __init__(self, directory=None, prefetch=True):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="reno_environ_", dir=directory)
+        self._keys = set()
+        # serialize file access of the main thread and the prefetch thread
+        self._lock = threading.RLock()
+        self._futures = {}
+        if prefetch:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            self._executor = None
+
+    def _save(self, key, array):
+        raise NotImplementedError
+
+    def _load(self, key):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _discard_prefetch(self, key):
+        future = self._futures.pop(key, None)
+        if future is not None:
+            if not future.cancel():
+                # wait for the file access to finish before the file is modified
+                future.exception()
+
+    def __setitem__(self, key, array):
+        self._discard_prefetch(key)
+        with self._lock:
+            self._save(key, np.asarray(array))
+            self._keys.add(key)
+
+    def __getitem__(self, key):
+        future = self._futures.pop(key, None)
+        if future is not None:
+            return future.result()
+        if key not in self._keys:
+            raise KeyError(key)
+        with self._lock:
+            return self._load(key)
+
+    def __delitem__(self, key):
+        self._discard_prefetch(key)
+        if key not in self._keys:
+            raise KeyError(key)
+        with self._lock:
+            self._delete(key)
+            self._keys.remove(key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def _load_materialized(self, key):
+        with self._lock:
+            return np.array(self._load(key))
+
+    def prefetch(self, key):
+        """
+        Load the tensor of ``key`` in the background. The next ``self[key]`` returns the
+        prefetched tensor. Nothing is done if the key does not exist.
+        At most one tensor is prefetched at a time and the previous prefetch that is not read
+        is discarded, so that no more than one extra tensor is kept in the memory.
+        """
+        if self._executor is None or key not in self._keys or key in self._futures:
+            return
+        self.discard_prefetch()
+        self._futures[key] = self._executor.submit(self._load_materialized, key)
+
+    def discard_prefetch(self):
+        """
+        Discard all prefetched tensors that are not read.
+        """
+        for key in list(self._futures.keys()):
+            self._discard_prefetch(key)
+
+    def _shutdown_executor(self):
+        if self._executor is None:
+            return
+        # `cancel_futures` of `Executor.shutdown` requires Python 3.9
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def close(self):
+        self._shutdown_executor()
+        self._futures.clear()
+        self._keys.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class NpyStorage(DiskStorage):
+    """
+    Store each environment in a ``.npy`` file, which is memory-mapped when read.
+    """
+
+    def _fname(self, key):
+        domain, siteidx = key
+        return os.path.join(self.directory, f"{domain}_{siteidx}.npy")
+
+    def _save(self, key, array):
+        fname = self._fname(key)
+        # the previous file might be memory-mapped by an array that is still alive.
+        # Truncating the file in-place would invalidate the mapping. `os.replace` keeps the
+        # old content alive until the mapping is released.
+        tmp_fname = fname + ".tmp.npy"
+        np.save(tmp_fname, array)
+        os.replace(tmp_fname, fname)
+
+    def _load(self, key):
+        return np.load(self._fname(key), mmap_mode="r")
+
+    def _delete(self, key):
+        os.remove(self._fname(key))
+
+
+class H5Storage(DiskStorage):
+    """
+    Store the environments as datasets in a single HDF5 file.
+    """
+
+    def __init__(self, directory=None, prefetch=True):
+        import h5py
+        super().__init__(directory, prefetch)
+        self.fname = os.path.join(self.directory, "environ.h5")
+        self._h5 = h5py.File(self.fname, "w")
+
+    @staticmethod
+    def _dataset_name(key):
+        domain, siteidx = key
+        return f"{domain}_{siteidx}"
+
+    def _save(self, key, array):
+        name = self._dataset_name(key)
+        if name in self._h5:
+            del self._h5[name]
+        self._h5.create_dataset(name, data=array)
+
+    def _load(self, key):
+        return self._h5[self._dataset_name(key)][()]
+
+    def _delete(self, key):
+        del self._h5[self._dataset_name(key)]
+
+    def close(self):
+        # the prefetch thread may be reading the file
+        self._shutdown_executor()
+        if self._h5 is not None:
+            self._h5.close()
+            self._h5 = None
+        super().close()
+
+
+storage_classes = {
+    "memory": MemoryStorage,
+    "npy": NpyStorage,
+    "hdf5": H5Storage,
+}
+
+
+def get_storage(storage="memory", directory=None):
+    """
+    Construct the environment storage.
+
+    Parameters
+    ----------
+    storage : str
+        ``"memory"``, ``"npy"`` or ``"hdf5"``.
+    directory : str
+        The directory for the disk backends.
+    """
+    if storage not in storage_classes:
+        raise ValueError(f"Unknown environment storage: {storage}. Valid options: {list(storage_classes.keys())}")
+    if storage == "memory":
+        return MemoryStorage()
+    return storage_classes[storage](directory)
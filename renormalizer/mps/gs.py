@@ -15,17 +15,20 @@ import logging
 import numpy as np
 import scipy
 
-from renormalizer.lib import davidson
-from renormalizer.model.h_qc import qc_model, int_to_h, generate_ladder_operator, simplify_op
+from renormalizer.lib import davidson1
+from renormalizer.model.h_qc import qc_basis, int_to_h, generate_ladder_operator, simplify_op
 from renormalizer.model import Model, Op
 from renormalizer.mps.backend import xp, OE_BACKEND, primme, IMPORT_PRIMME_EXCEPTION
 from renormalizer.mps.matrix import multi_tensor_contract, tensordot, asnumpy, asxp
-from renormalizer.mps.hop_expr import  hop_expr
+from renormalizer.mps.hop_expr import  hop_expr, hop_expr_block_sparse
+from renormalizer.mps import block_sparse as bs
 from renormalizer.mps.svd_qn import get_qn_mask
 from renormalizer.mps import Mpo, Mps, StackedMpo
 from renormalizer.mps.lib import Environ, cvec2cmat
+from renormalizer.mps.memory_budget import update_memory_bonddim
 from renormalizer.mps.oe_contract_wrap import oe_contract
 from renormalizer.utils import Quantity, CompressConfig, CompressCriteria
+from renormalizer.utils.profiler import profile_phase, profile_count, profile_flops, profile_bytes
 
 
 logger = logging.getLogger(__name__)
@@ -102,18 +105,27 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
 
     compress_config_bk = mps.compress_config
 
+    block_sparse = mps.optimize_config.block_sparse
+    if block_sparse and (omega is not None or isinstance(mpo, StackedMpo)):
+        raise NotImplementedError("Block-sparse optimization with omega or StackedMpo is not implemented")
+
+    storage_kwargs = dict(
+        storage=mps.optimize_config.environ_storage,
+        storage_dir=mps.optimize_config.environ_dir
+    )
+
     # construct the environment matrix
     if omega is not None:
         if isinstance(mpo, StackedMpo):
             raise NotImplementedError("StackedMPO + omega is not implemented yet")
         identity = Mpo.identity(mpo.model)
         mpo = mpo.add(identity.scale(-omega))
-        environ = Environ(mps, [mpo, mpo], env)
+        environ = Environ(mps, [mpo, mpo], env, **storage_kwargs)
     else:
         if isinstance(mpo, StackedMpo):
-            environ = [Environ(mps, item, env) for item in mpo.mpos]
+            environ = [Environ(mps, item, env, **storage_kwargs) for item in mpo.mpos]
         else:
-            environ = Environ(mps, mpo, env)
+            environ = Environ(mps, mpo, env, block_sparse=block_sparse, **storage_kwargs)
 
     macro_iteration_result = []
     # Idx of the active site with lowest energy for each sweep
@@ -123,16 +135,27 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
     for isweep, (compress_config, percent) in enumerate(mps.optimize_config.procedure):
         logger.debug(f"isweep: {isweep}")
 
+        last_compress_config = mps.compress_config
         if isinstance(compress_config, CompressConfig):
             mps.compress_config = compress_config
         elif isinstance(compress_config, int):
             mps.compress_config = CompressConfig(criteria=CompressCriteria.fixed,
-                    max_bonddim = compress_config)
+                    max_bonddim = compress_config, memory_limit=compress_config_bk.memory_limit)
         else:
             assert False
+        if mps.compress_config is not last_compress_config and mps.compress_config.memory_limit != np.inf:
+            # the singular values of the last sweep distribute the memory budget of this sweep
+            mps.compress_config.spectra = last_compress_config.spectra.copy()
         logger.debug(f"compress config in current loop: {compress_config}, percent: {percent}")
 
         logger.debug(f"{mps}")
+        if not isinstance(mpo, StackedMpo):
+            # the Davidson solver holds 2 * max_space trial vectors and their products with H,
+            # and 3 * nroots vectors for the residuals. See `renormalizer.lib.davidson1`
+            nroots = mps.optimize_config.nroots
+            nvectors = 2 * (12 + (nroots - 1) * 3) + 3 * nroots
+            nsite = 2 if mps.optimize_config.method == "2site" else 1
+            update_memory_bonddim(mps, mpo, nsite, nvectors)
 
         micro_iteration_result, res_mps, mpo = single_sweep(mps, mpo, environ, omega, percent, opt_e_idx)
 
@@ -155,6 +178,9 @@ def optimize_mps(mps: Mps, mpo: Union[Mpo, StackedMpo], omega: float = None) ->
         logger.warning("DMRG did not converge! Please increase the procedure!")
         logger.info(f"The lowest two energies: {sorted(macro_iteration_result)[:2]}.")
 
+    for environ_item in (environ if isinstance(environ, list) else [environ]):
+        environ_item.close()
+
     assert res_mps is not None
     # remove the redundant basis near the edge
     # and restore the original compress_config of the input mps
@@ -182,6 +208,9 @@ def single_sweep(
 
     method = mps.optimize_config.method
     nroots = mps.optimize_config.nroots
+    block_sparse = mps.optimize_config.block_sparse
+    if block_sparse and mps.compress_config.ofs is not None:
+        raise NotImplementedError("Block-sparse optimization with OFS is not implemented")
 
     # in state-averaged calculation, contains C of each state for better initial guess
     averaged_ms = []
@@ -232,8 +261,9 @@ def single_sweep(
             rtensor = environ.GetLR("R", ridx, mps, operator, itensor=None, method=rmethod)
 
         # get the quantum number pattern
-        qnbigl, qnbigr, qnmat = mps._get_big_qn(cidx)
-        qn_mask = get_qn_mask(qnmat, mps.qntot)
+        with profile_phase("qn_mask", site=cidx):
+            qnbigl, qnbigr, qnmat = mps._get_big_qn(cidx)
+            qn_mask = get_qn_mask(qnmat, mps.qntot)
         cshape = qn_mask.shape
 
         # center mo
@@ -243,8 +273,14 @@ def single_sweep(
             cmo = [asxp(mpo[idx]) for idx in cidx]
 
         use_direct_eigh = np.prod(cshape) < 1000 or mps.optimize_config.algo == "direct"
+        if block_sparse:
+            cmo_bs = [bs.mp_site_to_block_sparse(mpo, idx) for idx in cidx]
+            bs_layout = _block_sparse_layout(qn_mask, ltensor, rtensor, cmo_bs)
         if use_direct_eigh:
-            e, c = eigh_direct(mps, qn_mask, ltensor, rtensor, cmo, omega)
+            if block_sparse:
+                ltensor, rtensor = asxp(ltensor.to_dense()), asxp(rtensor.to_dense())
+            with profile_phase("eigensolver", site=cidx):
+                e, c = eigh_direct(mps, qn_mask, ltensor, rtensor, cmo, omega)
         else:
             # the iterative approach
             # generate initial guess
@@ -274,7 +310,12 @@ def single_sweep(
             cguess.extend(
                 [np.random.rand(guess_dim) - 0.5 for i in range(len(cguess), nroots)]
             )
-            e, c = eigh_iterative(mps, qn_mask, ltensor, rtensor, cmo, omega, cguess)
+            if block_sparse:
+                with profile_phase("eigensolver", site=cidx):
+                    e, c = eigh_iterative(mps, qn_mask, ltensor, rtensor, cmo_bs, omega, cguess, bs_layout)
+            else:
+                with profile_phase("eigensolver", site=cidx):
+                    e, c = eigh_iterative(mps, qn_mask, ltensor, rtensor, cmo, omega, cguess)
 
         # if multi roots, both davidson and primme return np.ndarray
         if nroots > 1:
@@ -282,7 +323,11 @@ def single_sweep(
         logger.debug(f"energy: {e}")
         micro_iteration_result.append((e, cidx))
 
-        cstruct = cvec2cmat(c, qn_mask, nroots=nroots)
+        if block_sparse and nroots == 1:
+            template, order = bs_layout
+            cstruct = template.unravel(c[order])
+        else:
+            cstruct = cvec2cmat(c, qn_mask, nroots=nroots)
 
         # store the "optimal" mps (usually in the middle of each sweep)
         if cidx == last_opt_e_idx:
@@ -296,7 +341,8 @@ def single_sweep(
                         cstruct[iroot], cidx, qnbigl, qnbigr, percent
                     )
 
-        averaged_ms = mps._update_mps(cstruct, cidx, qnbigl, qnbigr, percent)
+        with profile_phase("svd", site=cidx):
+            averaged_ms = mps._update_mps(cstruct, cidx, qnbigl, qnbigr, percent)
         if mps.compress_config.ofs is not None:
             mpo.try_swap_site(mps.model, mps.compress_config.ofs_swap_jw)
 
@@ -395,6 +441,9 @@ def eigh_direct(
     else:
         ham = get_ham_direct(mps, qn_mask, ltensor, rtensor, cmo, omega)
     inverse = mps.optimize_config.inverse
+    # the dense diagonalization is about 9 n^3 FLOPs with the eigenvectors
+    profile_flops(9 * len(ham) ** 3)
+    profile_bytes(ham, ham)
     w, v = scipy.linalg.eigh(asnumpy(ham) * inverse)
 
     nroots = mps.optimize_config.nroots
@@ -420,7 +469,24 @@ def get_ham_iterative(
     inverse = mps.optimize_config.inverse
 
     # diagonal elements of H for preconditioning
-    if omega is None:
+    if isinstance(ltensor, bs.BlockSparseTensor):
+        assert omega is None
+        tmp_ltensor = asxp(bs.diagonal_lr(ltensor))
+        tmp_rtensor = asxp(bs.diagonal_lr(rtensor))
+        cmo_diag = [asxp(np.einsum("abbc -> abc", mo.to_dense())) for mo in cmo]
+        if method == "1site":
+            path = [([0, 1], "ba, bcg -> acg"), ([1, 0], "acg, gf -> acf")]
+            hdiag = multi_tensor_contract(path, tmp_ltensor, cmo_diag[0], tmp_rtensor)
+        else:
+            path = [
+                ([0, 1], "ba, bce -> ace"),
+                ([0, 1], "edg, gf -> edf"),
+                ([0, 1], "ace, edf -> acdf"),
+            ]
+            hdiag = multi_tensor_contract(
+                path, tmp_ltensor, cmo_diag[0], cmo_diag[1], tmp_rtensor
+            )
+    elif omega is None:
         tmp_ltensor = xp.einsum("aba -> ba", ltensor)
         tmp_cmo0 = xp.einsum("abbc -> abc", cmo[0])
         tmp_rtensor = xp.einsum("aba -> ba", rtensor)
@@ -473,10 +539,26 @@ def get_ham_iterative(
 
     # contraction expression
     cshape = qn_mask.shape
-    expr = hop_expr(ltensor, rtensor, cmo, cshape, omega is not None)
+    if isinstance(ltensor, bs.BlockSparseTensor):
+        expr = hop_expr_block_sparse(ltensor, rtensor, cmo)
+    else:
+        expr = hop_expr(ltensor, rtensor, cmo, cshape, omega is not None)
     return hdiag, expr
 
 
+def _block_sparse_layout(qn_mask, ltensor, rtensor, cmo):
+    # the block-sparse template of the active site coefficient and the
+    # position of each element of the template in the `qn_mask` flattened vector
+    qns = [ltensor.qns[2]] + [mo.qns[2] for mo in cmo] + [rtensor.qns[2]]
+    signs = [1] * (len(cmo) + 1) + [-1]
+    index = np.full(qn_mask.shape, -1)
+    index[qn_mask] = np.arange(np.sum(qn_mask))
+    template = bs.BlockSparseTensor.from_dense(index, qns, signs, np.zeros_like(ltensor.qntot), check=False)
+    order = template.ravel()
+    assert np.all(0 <= order) and len(order) == np.sum(qn_mask)
+    return template, order
+
+
 def func_sum(funcs):
     def new_func(*args, **kwargs):
         return sum([func(*args, **kwargs) for func in funcs])
@@ -491,6 +573,7 @@ def eigh_iterative(
     cmo: List[xp.ndarray],
     omega: float,
     cguess: List[np.ndarray],
+    bs_layout=None,
 ):
     # iterative algorithm
     inverse = mps.optimize_config.inverse
@@ -504,28 +587,39 @@ def eigh_iterative(
         hdiag, expr = get_ham_iterative(mps, qn_mask, ltensor, rtensor, cmo, omega)
 
     count = 0
+    qn_mask_xp = asxp(qn_mask)
 
-    def hop(x):
+    def hop_batch(xs):
+        # apply H to the vectors (rows of `xs`) all at once
         nonlocal count
-        count += 1
-        clist = []
+        count += len(xs)
+        profile_count("hop_vectors", len(xs))
+        if bs_layout is not None:
+            # block-sparse structure. No dense array is involved
+            template, order = bs_layout
+            res = []
+            for c in xs:
+                cout = expr(template.unravel(c[order])) * inverse
+                cout_vec = np.empty(len(order), dtype=cout.dtype)
+                cout_vec[order] = cout.ravel(like=template)
+                res.append(cout_vec)
+            res = np.array(res)
+            profile_bytes(ltensor, rtensor, cmo, xs, res)
+            return res
+        xs = asxp(xs)
+        # convert the vectors to initial structure according to qn pattern on the device
+        cstruct = xp.zeros((len(xs),) + qn_mask.shape, dtype=xs.dtype)
+        cstruct[:, qn_mask_xp] = xs
+        cout = expr(cstruct) * inverse
+        profile_bytes(ltensor, rtensor, cmo, xs, cstruct, cout)
+        # convert structure c to 1d according to qn
+        return asnumpy(cout[:, qn_mask_xp])
+
+    def hop(x):
         if x.ndim == 1:
-            clist.append(x)
+            return hop_batch(x[None, :])[0]
         else:
-            for icol in range(x.shape[1]):
-                clist.append(x[:, icol])
-        res = []
-        for c in clist:
-            # convert c to initial structure according to qn pattern
-            cstruct = asxp(cvec2cmat(c, qn_mask))
-            cout = expr(cstruct) * inverse
-            # convert structure c to 1d according to qn
-            res.append(asnumpy(cout)[qn_mask])
-
-        if len(res) == 1:
-            return res[0]
-        else:
-            return np.stack(res, axis=1)
+            return hop_batch(x.T).T
 
     # Find the eigenvectors
     algo = mps.optimize_config.algo
@@ -533,10 +627,15 @@ def eigh_iterative(
     if algo == "davidson":
         precond = lambda x, e, *args: x / (hdiag - e + 1e-4)
 
-        e, c = davidson(
-            hop, cguess, precond, max_cycle=100, nroots=nroots, max_memory=64000
+        # the trial vectors are passed to `hop_batch` in blocks
+        _, e, c = davidson1(
+            lambda xs: list(hop_batch(np.array(xs))), cguess, precond, max_cycle=100, nroots=nroots,
+            max_memory=mps.optimize_config.davidson_max_memory,
+            scratch_dir=mps.optimize_config.davidson_scratch_dir,
         )
-        # if one root, davidson return e as np.float
+        # if one root, return e as np.float
+        if nroots == 1:
+            e, c = e[0], c[0]
 
     # elif algo == "arpack":
     #    # scipy arpack solver : much slower than pyscf/davidson
@@ -572,7 +671,7 @@ def eigh_iterative(
         )
     else:
         assert False
-    logger.debug(f"use {algo}, HC hops: {count}")
+    logger.debug(f"use {algo}, HC applied to {count} vectors")
     return e, sign_fix(c, nroots)
 
 
@@ -599,11 +698,9 @@ class DmrgFCISolver:
         # spatial orbital to spin orbital
         h1, h2 = int_to_h(h1, h2)
 
-        basis, ham_terms = qc_model(h1, h2)
-
-
-        model = Model(basis, ham_terms)
-        mpo = Mpo(model)
+        # the MPO is constructed from the integrals directly
+        model = Model(qc_basis(self.nsorb), [])
+        mpo = Mpo.ab_initio(model, h1, h2)
         logger.info(f"mpo_bond_dims:{mpo.bond_dims}")
 
         if isinstance(nelec, (int, np.integer)):
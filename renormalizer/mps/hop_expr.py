@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+from renormalizer.mps import block_sparse as bs
 from renormalizer.mps.matrix import asxp
 from renormalizer.mps.oe_contract_wrap import oe_contract_expression
 
@@ -32,24 +33,18 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             #   |   f   |
             #   O-c-O-i-O
             #   S-d h k-S
-            expr = oe_contract_expression(
-                "abcd, befg, cfhi, jgik, aej -> dhk",
-                ltensor, cmo[0], cmo[0], rtensor, cshape,
-                constants=[0, 1, 2, 3]
-            )
+            subscripts = "abcd, befg, cfhi, jgik, aej -> dhk"
+            tensors = [ltensor, cmo[0], cmo[0], rtensor]
         else:
             #   S-a e   j o-S
             #   O-b-O-g-O-l-O
             #   |   f   k   |
             #   O-c-O-i-O-n-O
             #   S-d h   m p-S
-            expr = oe_contract_expression(
-                "abcd, befg, cfhi, gjkl, ikmn, olnp, aejo -> dhmp",
-                ltensor, cmo[0], cmo[0], cmo[1], cmo[1], rtensor, cshape,
-                constants=[0, 1, 2, 3, 4, 5],
-            )
+            subscripts = "abcd, befg, cfhi, gjkl, ikmn, olnp, aejo -> dhmp"
+            tensors = [ltensor, cmo[0], cmo[0], cmo[1], cmo[1], rtensor]
         # early return
-        return expr
+        return _contract_expression(subscripts, tensors, cshape)
 
     # Single layer, the most common case
     # Could be written in an automatic way
@@ -60,11 +55,8 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
         # O-b - b-O
         #
         # S-c   k-S
-        expr = oe_contract_expression(
-            "abc, lbk, ck -> al",
-            ltensor, rtensor, cshape,
-            constants=[0, 1],
-        )
+        subscripts = "abc, lbk, ck -> al"
+        tensors = [ltensor, rtensor]
     elif nsite == 1:
         if not ancilla:
             # S-a   l-S
@@ -72,11 +64,8 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             # O-b-O-f-O
             #     e
             # S-c   k-S
-            expr = oe_contract_expression(
-                "abc, bdef, lfk, cek -> adl",
-                ltensor, cmo[0], rtensor, cshape,
-                constants=[0, 1, 2],
-            )
+            subscripts = "abc, bdef, lfk, cek -> adl"
+            tensors = [ltensor, cmo[0], rtensor]
         else:
             # S-a   l-S
             #     d
@@ -84,11 +73,8 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             #     e
             # S-c   k-S
             #     g
-            expr = oe_contract_expression(
-                "abc, bdef, lfk, cegk -> adgl",
-                ltensor, cmo[0], rtensor, cshape,
-                constants=[0, 1, 2],
-            )
+            subscripts = "abc, bdef, lfk, cegk -> adgl"
+            tensors = [ltensor, cmo[0], rtensor]
     else:
         if not ancilla:
             # S-a       l-S
@@ -96,11 +82,8 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             # O-b-O-f-O-j-O
             #     e   h
             # S-c       k-S
-            expr = oe_contract_expression(
-                "abc, bdef, fghj, ljk, cehk -> adgl",
-                ltensor, cmo[0], cmo[1], rtensor, cshape,
-                constants=[0, 1, 2, 3],
-            )
+            subscripts = "abc, bdef, fghj, ljk, cehk -> adgl"
+            tensors = [ltensor, cmo[0], cmo[1], rtensor]
         else:
             # S-a       l-S
             #     d   g
@@ -108,10 +91,61 @@ def hop_expr(ltensor, rtensor, cmo, cshape, twolayer:bool=False):
             #     e   h
             # S-c       k-S
             #     m   n
-            expr = oe_contract_expression(
-                "abc, bdef, fghj, ljk, cemhnk -> admgnl",
-                ltensor, cmo[0], cmo[1], rtensor, cshape,
-                constants=[0, 1, 2, 3],
+            subscripts = "abc, bdef, fghj, ljk, cemhnk -> admgnl"
+            tensors = [ltensor, cmo[0], cmo[1], rtensor]
+
+    return _contract_expression(subscripts, tensors, cshape)
+
+
+def _contract_expression(subscripts, tensors, cshape):
+    # The returned function accepts either a single coefficient array with shape ``cshape``
+    # or a batch of coefficient arrays with an additional leading index.
+    # The batch is contracted in one call so that BLAS-3 routines are used
+    # when several vectors are applied at once, such as in Davidson iterations.
+    constants = list(range(len(tensors)))
+    expr = oe_contract_expression(subscripts, *tensors, cshape, constants=constants)
+
+    inputs, output = subscripts.split("->")
+    inputs = [s.strip() for s in inputs.split(",")]
+    # upper case letters are not used in the subscripts
+    batch_subscripts = ", ".join(inputs[:-1] + ["Z" + inputs[-1]]) + " -> Z" + output.strip()
+    # the contraction paths depend on the batch size
+    batch_exprs = {}
+
+    def expr_wrapped(cstruct, *args, **kwargs):
+        if cstruct.ndim == len(cshape):
+            return expr(cstruct, *args, **kwargs)
+        assert cstruct.ndim == len(cshape) + 1
+        nbatch = cstruct.shape[0]
+        if nbatch not in batch_exprs:
+            batch_exprs[nbatch] = oe_contract_expression(
+                batch_subscripts, *tensors, (nbatch,) + tuple(cshape), constants=constants
             )
+        return batch_exprs[nbatch](cstruct, *args, **kwargs)
+
+    return expr_wrapped
+
+
+def hop_expr_block_sparse(ltensor, rtensor, cmo):
+    # the block-sparse version of `hop_expr` for single layer MPS without ancilla.
+    # The tensors are `renormalizer.mps.block_sparse.BlockSparseTensor`.
+    # The index convention is the same with `hop_expr`
+    nsite = len(cmo)
+    assert nsite in [1, 2]
+
+    def expr(cstruct):
+        # abc, cek -> abek  or  abc, cehk -> abehk
+        res = bs.tensordot(ltensor, cstruct, ([2], [0]))
+        # abek, bdef -> akdf  or  abehk, bdef -> ahkdf
+        res = bs.tensordot(res, cmo[0], ([1, 2], [0, 2]))
+        if nsite == 1:
+            # akdf, lfk -> adl
+            res = bs.tensordot(res, rtensor, ([3, 1], [1, 2]))
+        else:
+            # ahkdf, fghj -> akdgj
+            res = bs.tensordot(res, cmo[1], ([4, 1], [0, 2]))
+            # akdgj, ljk -> adgl
+            res = bs.tensordot(res, rtensor, ([4, 1], [1, 2]))
+        return res
 
-    return expr
\ No newline at end of file
+    return expr
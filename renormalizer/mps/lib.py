@@ -7,29 +7,47 @@ from collections import deque
 from renormalizer.mps.backend import np, backend, xp
 from renormalizer.mps.matrix import (Matrix, multi_tensor_contract, asxp,
     asnumpy, tensordot)
+from renormalizer.mps import block_sparse as bs
+from renormalizer.mps.environ_storage import get_storage
+from renormalizer.utils.profiler import profile_phase, profile_bytes
 
 
 class Environ:
-    def __init__(self, mps, mpo, domain=None, mps_conj=None):
-        # todo: real disk and other backend
+    def __init__(self, mps, mpo, domain=None, mps_conj=None, block_sparse=False,
+                 storage="memory", storage_dir=None):
         # todo: contract_one_site_multi_mpo could generalize contract_one_site,
         # we could unify them in the future.
 
         # idx indicates the exact position of L or R, like
         # L(idx-1) - mpo(idx) - R(idx+1)
-        self._virtual_disk = {}
+        # storage: "memory", "npy" (memory-mapped files) or "hdf5".
+        # See `renormalizer.mps.environ_storage`
+        if block_sparse and storage != "memory":
+            raise NotImplementedError("Block-sparse environment is only supported with the memory storage")
+        self._virtual_disk = get_storage(storage, storage_dir)
+        # the direction of the sweep, inferred from the last written environment.
+        # 1 if L is being updated (sweeping to the right), -1 if R is being updated
+        self._sweep_direction = None
         if type(mpo) is list:
             ndim = len(mpo) + 2
         else:
             ndim = 3
         self.sentinel = xp.ones([1,]*ndim, dtype=backend.real_dtype)
+        # store and contract the environments with the block-sparse format
+        # in `renormalizer.mps.block_sparse`. Only a single MPO with MPS is supported.
+        self.block_sparse = block_sparse
+        if block_sparse:
+            if type(mpo) is list:
+                raise NotImplementedError("Block-sparse environment for a list of MPOs is not implemented")
+            if mps.qn is None or mpo.qn is None:
+                raise ValueError("Block-sparse environment requires quantum numbers")
         self._construct(mps, mpo, domain, mps_conj)
 
     def _construct(self, mps, mpo, domain=None, mps_conj=None):
 
         assert domain in ["L", "R", None]
 
-        if mps_conj is None:
+        if mps_conj is None and not self.block_sparse:
             mps_conj = mps.conj()
 
         if domain is None:
@@ -44,8 +62,14 @@ class Environ:
         self.write_r_sentinel(mps)
 
         tensor = self.sentinel
+        if self.block_sparse:
+            self.write("L", -1, self._block_sparse_sentinel("L", mps, mpo, mps_conj))
+            self.write("R", len(mps), self._block_sparse_sentinel("R", mps, mpo, mps_conj))
+            tensor = self.read(domain, start - inc)
         for idx in range(start, end, inc):
-            if type(mpo) is list:
+            if self.block_sparse:
+                tensor = self._contract_one_site_block_sparse(tensor, mps, mpo, idx, domain, mps_conj)
+            elif type(mpo) is list:
                 # a list of mpos
                 tensor = contract_one_site_multi_mpo(tensor, mps[idx], [mp[idx] for mp in mpo], domain, ms_conj=mps_conj[idx])
             else:
@@ -78,44 +102,102 @@ class Environ:
             mps_conj = [None] * len(mps)
 
         if siteidx not in range(len(mps)):
+            if self.block_sparse:
+                return self._block_sparse_sentinel(domain, mps, mpo, mps_conj)
             return self.sentinel
 
-        if method == "Scratch":
-            itensor = self.sentinel
-            if domain == "L":
-                sitelist = range(siteidx + 1)
-            else:
-                sitelist = range(len(mps) - 1, siteidx - 1, -1)
-            for imps in sitelist:
-                if type(mpo) is list:
-                    itensor = contract_one_site_multi_mpo(itensor, mps[imps],
-                            [mp[imps] for mp in mpo], domain,
-                            ms_conj=mps_conj[imps])
+        phase = "environ_read" if method == "Enviro" else "environ"
+        with profile_phase(phase, site=siteidx):
+            if method == "Scratch":
+                itensor = self.sentinel
+                if self.block_sparse:
+                    itensor = self._block_sparse_sentinel(domain, mps, mpo, mps_conj)
+                if domain == "L":
+                    sitelist = range(siteidx + 1)
                 else:
-                    itensor = contract_one_site(itensor, mps[imps], mpo[imps],
-                        domain, ms_conj=mps_conj[imps])
-        elif method == "Enviro":
-            itensor = self.read(domain, siteidx)
-        elif method == "System":
-            if itensor is None:
-                offset = -1 if domain == "L" else 1
-                itensor = self.read(domain, siteidx + offset)
-            if type(mpo) is list:
-                itensor = contract_one_site_multi_mpo(itensor, mps[siteidx],
-                        [mp[siteidx] for mp in mpo],
-                        domain, mps_conj[siteidx])
-            else:
-                itensor = contract_one_site(itensor, mps[siteidx], mpo[siteidx],
-                        domain, mps_conj[siteidx])
-            self.write(domain, siteidx, itensor)
+                    sitelist = range(len(mps) - 1, siteidx - 1, -1)
+                for imps in sitelist:
+                    if self.block_sparse:
+                        itensor = self._contract_one_site_block_sparse(itensor, mps, mpo, imps, domain, mps_conj)
+                    elif type(mpo) is list:
+                        itensor = contract_one_site_multi_mpo(itensor, mps[imps],
+                                [mp[imps] for mp in mpo], domain,
+                                ms_conj=mps_conj[imps])
+                    else:
+                        itensor = contract_one_site(itensor, mps[imps], mpo[imps],
+                            domain, ms_conj=mps_conj[imps])
+            elif method == "Enviro":
+                itensor = self.read(domain, siteidx)
+            elif method == "System":
+                if itensor is None:
+                    offset = -1 if domain == "L" else 1
+                    itensor = self.read(domain, siteidx + offset)
+                if self.block_sparse:
+                    itensor = self._contract_one_site_block_sparse(itensor, mps, mpo, siteidx, domain, mps_conj)
+                elif type(mpo) is list:
+                    itensor = contract_one_site_multi_mpo(itensor, mps[siteidx],
+                            [mp[siteidx] for mp in mpo],
+                            domain, mps_conj[siteidx])
+                else:
+                    itensor = contract_one_site(itensor, mps[siteidx], mpo[siteidx],
+                            domain, mps_conj[siteidx])
+                self.write(domain, siteidx, itensor)
+
+            profile_bytes(itensor)
 
         return itensor
 
     def write(self, domain, siteidx, tensor):
-        self._virtual_disk[(domain, siteidx)] = asnumpy(tensor)
+        direction = 1 if domain == "L" else -1
+        if direction != self._sweep_direction:
+            # the prefetched environments are for the other direction
+            self._virtual_disk.discard_prefetch()
+            self._sweep_direction = direction
+        if isinstance(tensor, bs.BlockSparseTensor):
+            self._virtual_disk[(domain, siteidx)] = tensor
+        else:
+            self._virtual_disk[(domain, siteidx)] = asnumpy(tensor)
 
     def read(self, domain: str, siteidx: int):
-        return asxp(self._virtual_disk[(domain, siteidx)])
+        tensor = self._virtual_disk[(domain, siteidx)]
+        # When sweeping to the right, R is read from left to right and L is updated, and vice versa.
+        # Only the environment of the next site in the direction of the sweep is prefetched
+        if domain == "R" and self._sweep_direction == 1:
+            self._virtual_disk.prefetch((domain, siteidx + 1))
+        elif domain == "L" and self._sweep_direction == -1:
+            self._virtual_disk.prefetch((domain, siteidx - 1))
+        if isinstance(tensor, bs.BlockSparseTensor):
+            return tensor
+        return asxp(tensor)
+
+    def close(self):
+        # release the disk storage
+        self._virtual_disk.close()
+
+    def _block_sparse_sentinel(self, domain, mps, mpo, mps_conj):
+        # the boundary of the environment with the quantum numbers of the
+        # bra, mpo and ket bonds at the edge of the chain.
+        if mps_conj is None or mps_conj[0] is None:
+            mps_conj = mps
+        if domain == "L":
+            bond_idx = 0
+            signs = [1, -1, -1]
+        else:
+            bond_idx = len(mps)
+            signs = [-1, 1, 1]
+        qns = [bs.mp_bond_qn(mp, bond_idx)[:1] for mp in (mps_conj, mpo, mps)]
+        qntot = sum(sign * qn[0] for sign, qn in zip(signs, qns))
+        return bs.BlockSparseTensor.from_dense(asnumpy(self.sentinel), qns, signs, qntot)
+
+    def _contract_one_site_block_sparse(self, environ, mps, mpo, idx, domain, mps_conj):
+        ms = bs.mp_site_to_block_sparse(mps, idx)
+        mo = bs.mp_site_to_block_sparse(mpo, idx)
+        if mps_conj is None or mps_conj[idx] is None:
+            ms_conj = ms.conj()
+        else:
+            # `mps_conj` is already conjugated
+            ms_conj = bs.mp_site_to_block_sparse(mps_conj, idx).reverse_flow()
+        return contract_one_site_block_sparse(environ, ms, mo, domain, ms_conj)
 
 
 def contract_one_site_multi_mpo(environ, ms, mos, domain, ms_conj=None):
@@ -250,6 +332,33 @@ def contract_one_site(environ, ms, mo, domain, ms_conj=None):
     return outtensor
 
 
+def contract_one_site_block_sparse(environ, ms, mo, domain, ms_conj=None):
+    """
+    contract one mpo/mps site with the block-sparse tensors in
+    `renormalizer.mps.block_sparse`. The index convention is the same with
+    ``contract_one_site``. MPDM is not supported.
+    """
+    assert domain in ["L", "R"]
+    assert ms.ndim == 3
+    if ms_conj is None:
+        ms_conj = ms.conj()
+    if domain == "L":
+        # abc, adf -> bcdf
+        outtensor = bs.tensordot(environ, ms_conj, ([0], [0]))
+        # bcdf, bdeg -> cfeg
+        outtensor = bs.tensordot(outtensor, mo, ([0, 2], [0, 1]))
+        # cfeg, ceh -> fgh
+        outtensor = bs.tensordot(outtensor, ms, ([0, 2], [0, 1]))
+    else:
+        # fda, abc -> fdbc
+        outtensor = bs.tensordot(ms_conj, environ, ([2], [0]))
+        # fdbc, gdeb -> fcge
+        outtensor = bs.tensordot(outtensor, mo, ([1, 2], [1, 3]))
+        # fcge, hec -> fgh
+        outtensor = bs.tensordot(outtensor, ms, ([1, 3], [2, 1]))
+    return outtensor
+
+
 def select_basis(vset, sset, qnlist, compset, Mmax, percent=0):
     """
     select basis to construct new mps, and complementary mps
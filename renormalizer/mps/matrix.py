@@ -6,6 +6,7 @@ import logging
 from typing import List, Union
 
 from renormalizer.mps.backend import np, backend, xp, USE_GPU
+from renormalizer.utils.profiler import profiling_enabled, profile_count, profile_flops, profile_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -271,6 +272,13 @@ def multi_tensor_contract(path, *operands: [List[Union[Matrix, np.ndarray, xp.nd
             input_str[1],
             idx_removed,
         )
+        if profiling_enabled():
+            left, right = operands[ipath[0][0]], operands[ipath[0][1]]
+            dims = dict(zip(input_str[0], left.shape))
+            dims.update(zip(input_str[1], right.shape))
+            # one multiplication and one addition for each combination of the indices
+            profile_flops(2 * np.prod([dims[idx] for idx in dims], dtype=float))
+            profile_bytes(left, right, tmpmat)
 
         for x in sorted(ipath[0], reverse=True):
             del operands[x]
@@ -307,6 +315,7 @@ def asnumpy(array: Union[np.ndarray, xp.ndarray, Matrix, List]) -> np.ndarray:
         return array
     if isinstance(array, np.ndarray):
         return array
+    profile_count("device_to_host_bytes", array.nbytes)
     stream = xp.cuda.get_current_stream()
     return xp.asnumpy(array, stream=stream)
 
@@ -319,6 +328,8 @@ def asxp(array: Union[np.ndarray, xp.ndarray, Matrix]) -> xp.ndarray:
     if not USE_GPU:
         assert isinstance(array, np.ndarray)
         return array
+    if isinstance(array, np.ndarray):
+        profile_count("host_to_device_bytes", array.nbytes)
     return xp.asarray(array)
 
 
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Bond dimensions within a memory budget.
+
+The peak memory of a sweep is projected from the bond dimensions by :class:`SweepMemoryModel`.
+If the projection exceeds ``CompressConfig.memory_limit``, :func:`allocate_bond_dims`
+reduces the bond dimensions to minimize the total discarded weight
+:math:`\\sum_i \\sum_{k \\geq M_i} w_{ik}` under the budget, where :math:`w_{ik}` is the
+normalized squared singular value of the :math:`k` th state on bond :math:`i`
+recorded in the last sweep.
+The optimal condition of the relaxed problem is that all bonds keep the states whose
+weight per byte :math:`w_{ik} / c_{ik}` is above a common threshold :math:`\\lambda`,
+where :math:`c_{ik}` is the marginal memory cost of the state.
+So the truncation error is distributed to the bonds on which the bytes are cheaply saved.
+:math:`\\lambda` is then determined by bisection with the full projection.
+"""
+
+import logging
+
+import numpy as np
+
+from renormalizer.utils import sizeof_fmt
+
+logger = logging.getLogger(__name__)
+
+
+class SweepMemoryModel:
+    r"""
+    The projected peak memory of a sweep as a function of the bond dimensions :math:`M_i`.
+
+    The projection is the sum of
+
+    - the local tensors of the MP :math:`\sum_i M_i d_i M_{i+1}`;
+    - the environments of both sides :math:`2 \sum_i M_i^2 W_i`;
+    - the largest local problem of the sites :math:`j, \cdots, j+n-1`,
+      with the local vector size :math:`v_j = M_j d_j \cdots d_{j+n-1} M_{j+n}`.
+      The Krylov (or Davidson) vectors take ``nvectors`` :math:`\times v_j`, the two largest
+      intermediates of the effective Hamiltonian contraction take :math:`(W_j + W_{j+n}) v_j`,
+      and the local tensor and the two factors of its decomposition take :math:`3 v_j`.
+
+    Here :math:`d_i` is the physical dimension (for MPDM the product of the two physical indices)
+    and :math:`W_i` is the bond dimension of the MPO.
+
+    Parameters
+    ----------
+    pdims : list of int
+        The physical dimensions of the sites.
+    mpo_bond_dims : list of int
+        The bond dimensions of the MPO, including the two terminals.
+    itemsize : int
+        The number of bytes of one element.
+    nsite : int
+        The number of sites of the local problem. 1 or 2.
+    nvectors : int
+        The number of Krylov (or Davidson) vectors in the memory at the same time.
+    """
+
+    def __init__(self, pdims, mpo_bond_dims, itemsize, nsite=2, nvectors=50):
+        self.pdims = np.asarray(pdims, dtype=float)
+        self.mpo_bond_dims = np.asarray(mpo_bond_dims, dtype=float)
+        assert len(self.mpo_bond_dims) == len(self.pdims) + 1
+        assert nsite in [1, 2]
+        self.itemsize = itemsize
+        self.nsite = nsite
+        self.nvectors = nvectors
+        # the physical dimension of the local problems
+        window = self.pdims[:len(self.pdims) - nsite + 1].copy()
+        for i in range(1, nsite):
+            window *= self.pdims[i:len(self.pdims) - nsite + 1 + i]
+        self.window_pdims = window
+        # number of vectors for each local problem
+        self.local_factor = nvectors + 3 + self.mpo_bond_dims[:len(window)] + self.mpo_bond_dims[nsite:]
+
+    @classmethod
+    def from_mps(cls, mps, mpo, nsite=2, nvectors=50, dtype=None):
+        """
+        Construct the model from the shapes of ``mps`` and ``mpo``.
+        ``dtype`` overrides the data type of ``mps``, such as the complex type in time evolution.
+        """
+        pdims = [int(np.prod(mps[i].shape[1:-1])) for i in range(len(mps))]
+        if dtype is None:
+            dtype = mps.dtype
+        return cls(pdims, mpo.bond_dims, np.dtype(dtype).itemsize, nsite, nvectors)
+
+    def _local_sizes(self, bond_dims):
+        n = self.nsite
+        return bond_dims[..., :len(self.window_pdims)] * self.window_pdims * bond_dims[..., n:]
+
+    def peak_bytes(self, bond_dims) -> float:
+        """
+        The projected peak memory in bytes. ``bond_dims`` may have leading batch indices.
+        """
+        m = np.asarray(bond_dims, dtype=float)
+        mp_size = (m[..., :-1] * self.pdims * m[..., 1:]).sum(axis=-1)
+        environ_size = 2 * (m ** 2 * self.mpo_bond_dims).sum(axis=-1)
+        local_size = (self._local_sizes(m) * self.local_factor).max(axis=-1)
+        return self.itemsize * (mp_size + environ_size + local_size)
+
+    def marginal_bytes(self, bond_dims, bond_idx: int, states: np.ndarray) -> np.ndarray:
+        """
+        The increase of the memory when the ``states`` th state (0-based) is added to bond ``bond_idx``,
+        while the other bonds are fixed at ``bond_dims``.
+        The local problems of both sides of the bond are counted.
+        """
+        m = np.asarray(bond_dims, dtype=float)
+        i = bond_idx
+        n = self.nsite
+        linear = 0.
+        if 0 < i:
+            linear += self.pdims[i - 1] * m[i - 1]
+        if i < len(self.pdims):
+            linear += self.pdims[i] * m[i + 1]
+        # the bond as the left edge and the right edge of a local problem
+        if i < len(self.window_pdims):
+            linear += self.local_factor[i] * self.window_pdims[i] * m[i + n]
+        if 0 <= i - n:
+            linear += self.local_factor[i - n] * self.window_pdims[i - n] * m[i - n]
+        quadratic = 2 * self.mpo_bond_dims[i] * (2 * np.asarray(states) + 1)
+        return self.itemsize * (linear + quadratic)
+
+
+def allocate_bond_dims(model: SweepMemoryModel, budget: float, target, weights, floor=None) -> np.ndarray:
+    r"""
+    Reduce the bond dimensions so that the projected peak memory is within the budget.
+
+    The constraints are relaxed in turn until the budget is met:
+
+    1. the bonds are kept at least at ``floor`` and the bonds without singular values at ``target``;
+    2. the bonds without singular values are kept at ``target``;
+    3. the states on the bonds without singular values are assumed to have equal weights.
+
+    If the budget can not be met even with bond dimension 1, all bond dimensions are 1.
+
+    Parameters
+    ----------
+    model : SweepMemoryModel
+        The memory model.
+    budget : float
+        The memory budget in bytes.
+    target : list of int
+        The bond dimensions without the budget.
+    weights : list of np.ndarray or None
+        The normalized squared singular values on each bond in descending order. ``None`` if unknown.
+    floor : list of int, optional
+        The bond dimensions that are preferably kept, such as the current bond dimensions.
+        The states with tiny weight in the last sweep may be required for the growth of the bond,
+        so the budget is first used to keep them.
+
+    Returns
+    -------
+    bond_dims : np.ndarray
+        The bond dimensions within the budget, no larger than ``target``.
+    """
+    target = np.asarray(target, dtype=int)
+    if model.peak_bytes(target) <= budget:
+        return target
+    stages = [(floor, False), (None, False), (None, True)]
+    if floor is None:
+        stages = stages[1:]
+    for stage_floor, equal_unknown in stages:
+        bond_dims = _allocate(model, budget, target, weights, stage_floor, equal_unknown)
+        if bond_dims is not None:
+            return bond_dims
+    logger.warning(f"The memory budget {sizeof_fmt(budget)} can not be met. "
+                   f"Projected peak memory with bond dimension 1: {sizeof_fmt(model.peak_bytes(np.ones_like(target)))}")
+    return np.ones_like(target)
+
+
+def _allocate(model, budget, target, weights, floor, equal_unknown):
+    # the weight per byte of each state, which is non-increasing for each bond.
+    # The states that must be kept have infinite ratio
+    ratios = []
+    for i, m in enumerate(target):
+        w = weights[i]
+        if w is None or len(w) == 0:
+            if not equal_unknown:
+                ratios.append(np.full(m, np.inf))
+                continue
+            w = np.full(m, 1 / m)
+        w = np.concatenate([w, np.zeros(max(m - len(w), 0))])[:m]
+        r = np.minimum.accumulate(w / model.marginal_bytes(target, i, np.arange(m)))
+        if floor is not None:
+            r[:floor[i]] = np.inf
+        ratios.append(r)
+
+    def bond_dims_at(threshold):
+        # at least one state is kept for each bond
+        return np.array([max(1, np.searchsorted(-r, -threshold, side="right")) for r in ratios])
+
+    # bisection over the sorted ratios for the lowest threshold within the budget
+    all_ratios = np.unique(np.concatenate(ratios))[::-1]
+    lo, hi = -1, len(all_ratios)
+    while 1 < hi - lo:
+        mid = (lo + hi) // 2
+        if model.peak_bytes(bond_dims_at(all_ratios[mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid
+    if lo == -1:
+        return None
+    return bond_dims_at(all_ratios[lo])
+
+
+def update_memory_bonddim(mps, mpo, nsite=2, nvectors=50, dtype=None):
+    """
+    Set the bond dimension limits of ``mps.compress_config`` for the next sweep
+    according to ``CompressConfig.memory_limit``.
+    The target bond dimensions are determined by the other criteria of the config
+    from the singular values recorded in the last sweep.
+    Does nothing if the memory limit is not set.
+
+    Parameters
+    ----------
+    mps : renormalizer.mps.mp.MatrixProduct
+        The MPS (or MPDM) to be swept.
+    mpo : renormalizer.mps.Mpo
+        The MPO in the sweep.
+    nsite : int
+        The number of sites of the local problem. 1 or 2.
+    nvectors : int
+        The number of Krylov (or Davidson) vectors in the memory at the same time.
+    dtype : np.dtype, optional
+        The data type in the sweep. Default is the data type of ``mps``.
+    """
+    config = mps.compress_config
+    if config.memory_limit == np.inf:
+        return
+    if config.bonddim_should_set:
+        config.set_bonddim(len(mps) + 1)
+    model = SweepMemoryModel.from_mps(mps, mpo, nsite, nvectors, dtype)
+    target = np.array(mps.bond_dims)
+    weights = [None] * len(target)
+    for bond_idx, sigma in config.spectra.items():
+        if not 0 < bond_idx < len(mps):
+            continue
+        target[bond_idx] = max(1, config.criteria_m_trunc(sigma, bond_idx, left=False))
+        w = np.sort(np.asarray(sigma) ** 2)[::-1]
+        weights[bond_idx] = w / w.sum()
+    bond_dims = allocate_bond_dims(model, config.memory_limit, target, weights, floor=mps.bond_dims)
+    if np.all(bond_dims == target):
+        config.memory_max_dims = None
+        return
+    config.memory_max_dims = bond_dims
+    discarded = sum(w[m:].sum() for w, m in zip(weights, bond_dims) if w is not None)
+    logger.info(f"Bond dimensions limited by the memory budget {sizeof_fmt(config.memory_limit)}: "
+                f"{bond_dims.tolist()}, projected peak memory: {sizeof_fmt(model.peak_bytes(bond_dims))}, "
+                f"estimated discarded weight: {discarded:g}")
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # Author: Jiajun Ren <jiajunren0522@gmail.com>
 
+import json
 import logging
 import os
 import shutil
@@ -10,6 +11,7 @@ from renormalizer.model import Model, HolsteinModel
 from renormalizer.mps.backend import np, xp
 from renormalizer.mps import svd_qn
 from renormalizer.mps.svd_qn import add_outer, get_qn_mask
+from renormalizer.mps.block_sparse import BlockSparseTensor
 from renormalizer.mps.matrix import (
     asnumpy,
     asxp,
@@ -27,14 +29,31 @@ from renormalizer.mps.lib import (
     )
 from renormalizer.mps.hop_expr import hop_expr
 from renormalizer.utils import sizeof_fmt, CompressConfig, CompressCriteria, OFS, calc_vn_entropy
+from renormalizer.utils.profiler import profile_phase
 
 logger = logging.getLogger(__name__)
 
 
+class _ConjugatedSites:
+    # conjugate the sites of a matrix product on demand,
+    # instead of conjugating the whole matrix product in advance
+    def __init__(self, mp):
+        self.mp = mp
+
+    def __getitem__(self, idx):
+        return self.mp[idx].conj()
+
+    def __len__(self):
+        return len(self.mp)
+
+
 class MatrixProduct:
 
     @classmethod
     def load(cls, model: Model, fname: str):
+        if os.path.isdir(fname):
+            mp, _ = cls._load_dir(model, fname)
+            return mp
         npload = np.load(fname, allow_pickle=True)
         mp = cls()
         mp.model = model
@@ -57,6 +76,31 @@ class MatrixProduct:
         mp.to_right = bool(npload["to_right"])
         return mp
 
+    @classmethod
+    def _load_dir(cls, model: Model, fname: str):
+        # load the directory format dumped by ``dump(fname, fmt="dir")``.
+        # The matrices are memory-mapped and only read from the disk on access
+        with open(os.path.join(fname, "header.json")) as fin:
+            header = json.load(fin)
+        if header["version"] != "0.4":
+            raise ValueError(f"Unknown dump version: {header['version']}")
+        mp = cls()
+        mp.model = model
+        if header["complex"]:
+            mp.dtype = backend.complex_dtype
+        else:
+            mp.dtype = backend.real_dtype
+        mp._mp = [os.path.join(fname, f"mt_{i}.npy") for i in range(header["nsites"])]
+        mp.qn = header["qn"]
+        mp.qnidx = header["qnidx"]
+        mp.qntot = np.array(header["qntot"], dtype=int)
+        mp.to_right = header["to_right"]
+        attrs = {}
+        if header["other_attrs"]:
+            with np.load(os.path.join(fname, "attrs.npz"), allow_pickle=True) as npload:
+                attrs = dict(npload)
+        return mp, attrs
+
     def __init__(self):
         # XXX: when modify theses codes, keep in mind to update `metacopy` method
         # set to a list of None upon metacopy. String is used when the matrix is
@@ -552,8 +596,11 @@ class MatrixProduct:
 
         procedure = mps.compress_config.vprocedure
         method = mps.compress_config.vmethod
+        vconv = mps.compress_config.vconv
 
         environ = Environ(self, mpo, "L", mps_conj=mps.conj())
+        # only the sites being updated are conjugated during the sweeps
+        mps_conj = _ConjugatedSites(mps)
 
         for isweep, (compress_config, percent) in enumerate(procedure):
             logger.debug(f"isweep: {isweep}")
@@ -596,14 +643,13 @@ class MatrixProduct:
                     assert False
                 logger.debug(f"optimize site: {cidx}")
 
-                # todo: avoid the conjugations
                 ltensor = environ.GetLR(
                     "L", lidx, self, mpo, itensor=None, method=lmethod,
-                    mps_conj=mps.conj()
+                    mps_conj=mps_conj
                 )
                 rtensor = environ.GetLR(
                     "R", ridx, self, mpo, itensor=None, method=rmethod,
-                    mps_conj=mps.conj()
+                    mps_conj=mps_conj
                 )
 
                 # get the quantum number pattern
@@ -617,26 +663,38 @@ class MatrixProduct:
                 else:
                     assert method == "2site"
                     cms = tensordot(self[cidx[0]], self[cidx[1]], axes=1)
-                hop = hop_expr(ltensor, rtensor, cmo, cms.shape)
-                cout = hop(cms)
+                with profile_phase("apply", site=cidx):
+                    hop = hop_expr(ltensor, rtensor, cmo, cms.shape)
+                    cout = hop(cms)
                 # clean up the elements which do not meet the qn requirements
                 cout[~qn_mask] = 0
-                mps._update_mps(cout, cidx, qnbigl, qnbigr, percent)
+                with profile_phase("svd", site=cidx):
+                    mps._update_mps(cout, cidx, qnbigl, qnbigr, percent)
                 if mps.compress_config.ofs is not None:
                     # need to swap the original MPS. Tedious to implement and probably not useful.
                     raise NotImplementedError("OFS for variational compress not implemented")
 
             mps._switch_direction()
 
-            # check convergence
+            # check convergence. By default the distance between the wavefunctions of the two sweeps
+            # is estimated from the norm of the last local solution, i.e., the projection of
+            # the target onto the current basis, whose square increases as the basis improves.
+            # The copy and the overlaps of the whole MPS are thus avoided.
+            if vconv == "norm":
+                norm = float(xp.linalg.norm(cout))
             if isweep > 0 and percent == 0:
-                error = mps.distance(mps_old) / np.sqrt(mps.dot(mps.conj()).real)
+                if vconv == "norm":
+                    error = np.sqrt(abs(norm ** 2 - norm_old ** 2)) / norm
+                else:
+                    error = mps.distance(mps_old) / np.sqrt(mps.dot(mps.conj()).real)
                 logger.info(f"Variation compress relative error: {error}")
                 if error < mps.compress_config.vrtol:
                     logger.info("Variational compress is converged!")
                     break
-
-            mps_old = mps.copy()
+            if vconv == "norm":
+                norm_old = norm
+            else:
+                mps_old = mps.copy()
         else:
             logger.warning(
                 "Variational compress is not converged! Please increase the procedure!"
@@ -654,7 +712,7 @@ class MatrixProduct:
 
         Parameters
         ---------
-        cstruct : ndarray, List[ndarray]
+        cstruct : ndarray, List[ndarray], BlockSparseTensor
             The active site coefficient.
         cidx : list
             The List of active site index.
@@ -690,10 +748,14 @@ class MatrixProduct:
             if self.compress_config.ofs is None:
                 # SVD method
                 # full_matrices = True here to enable increase the bond dimension
+                if not isinstance(cstruct, BlockSparseTensor):
+                    cstruct = asnumpy(cstruct)
                 Uset, SUset, qnlnew, Vset, SVset, qnrnew = svd_qn.svd_qn(
-                    asnumpy(cstruct), qnbigl, qnbigr, self.qntot, system=system
+                    cstruct, qnbigl, qnbigr, self.qntot, system=system
                 )
             else:
+                if isinstance(cstruct, BlockSparseTensor):
+                    cstruct = cstruct.to_dense()
                 if isinstance(self.model, HolsteinModel):
                     # the HolsteinModel class methods are incompatible with OFS
                     raise NotImplementedError("Can't perform OFS on Holstein model")
@@ -1082,13 +1144,36 @@ class MatrixProduct:
     def build_empty_mp(self, num):
         self._mp = [[None]] * num
 
-    def dump(self, fname, other_attrs=None):
+    def dump(self, fname, other_attrs=None, fmt="npz"):
+        """
+        Dump the matrix product to the disk.
+
+        Parameters
+        ----------
+        fname : str
+            The file name.
+        other_attrs : list of str
+            Other attributes to dump.
+        fmt : str
+            ``"npz"``: a single ``.npz`` archive.
+            ``"dir"``: a directory with one ``.npy`` file for each site and a ``header.json``.
+            When loaded, the matrices are memory-mapped, which is suitable for large
+            matrix products shared by many jobs.
+        """
 
         if other_attrs is None:
             other_attrs = []
         elif isinstance(other_attrs, str):
             other_attrs = [other_attrs]
         assert isinstance(other_attrs, list)
+        assert fmt in ["npz", "dir"]
+
+        if fmt == "dir":
+            try:
+                self._dump_dir(fname, other_attrs)
+            except Exception:
+                logger.exception(f"Dump MP failed.")
+            return
 
         data_dict = dict()
         # version of the protocol
@@ -1112,6 +1197,35 @@ class MatrixProduct:
         except Exception:
             logger.exception(f"Dump MP failed.")
 
+    def _dump_dir(self, fname, other_attrs):
+        os.makedirs(fname, exist_ok=True)
+        for idx in range(self.site_num):
+            mt_fname = os.path.join(fname, f"mt_{idx}.npy")
+            mt_or_str = self._mp[idx]
+            if isinstance(mt_or_str, str) and os.path.abspath(mt_or_str) == os.path.abspath(mt_fname):
+                # loaded from the same directory and not modified
+                continue
+            # the old file might be memory-mapped. Don't overwrite it in place
+            tmp_fname = mt_fname + ".tmp.npy"
+            np.save(tmp_fname, np.asarray(self[idx].array))
+            os.replace(tmp_fname, mt_fname)
+        if other_attrs:
+            np.savez(os.path.join(fname, "attrs.npz"), **{attr: getattr(self, attr) for attr in other_attrs})
+        header = {
+            "version": "0.4",
+            "nsites": self.site_num,
+            "complex": bool(np.issubdtype(self.dtype, np.complexfloating)),
+            "qn": [np.asarray(qn).astype(int).tolist() for qn in self.qn],
+            "qnidx": int(self.qnidx),
+            "qntot": np.asarray(self.qntot).astype(int).tolist(),
+            "to_right": bool(self.to_right),
+            "other_attrs": other_attrs,
+        }
+        # the header is written at last. The dumped data is complete if the header exists
+        with open(os.path.join(fname, "header.json.tmp"), "w") as fout:
+            json.dump(header, fout)
+        os.replace(os.path.join(fname, "header.json.tmp"), os.path.join(fname, "header.json"))
+
     @property
     def total_bytes(self):
         return sum(array.nbytes for array in self)
@@ -1148,30 +1262,28 @@ class MatrixProduct:
         return self.scale(other)
 
     def __getitem__(self, item):
-        mt_or_str_or_list = self._mp[item]
-        if isinstance(mt_or_str_or_list, list):
-            assert isinstance(item, slice)
-            for elem in mt_or_str_or_list:
-                if isinstance(elem, str):
-                    # load all matrices to memory will make
-                    # the dump mechanism pointless
-                    raise IndexError("Can't slice on dump matrices.")
-        if isinstance(mt_or_str_or_list, str):
+        if isinstance(item, slice):
+            return [self[i] for i in range(len(self))[item]]
+        mt_or_str = self._mp[item]
+        if isinstance(mt_or_str, str):
             try:
-                mt = Matrix(np.load(mt_or_str_or_list), dtype=self.dtype)
+                # memory-mapped (copy-on-write). Only read from the disk on access
+                mt = Matrix(np.load(mt_or_str, mmap_mode="c"), dtype=self.dtype)
                 mt.sigmaqn = self._get_sigmaqn(item)
             except:
-                logger.exception(f"Can't load matrix from {mt_or_str_or_list}")
+                logger.exception(f"Can't load matrix from {mt_or_str}")
                 raise RuntimeError("MPS internal structure corrupted.")
         else:
-            if not isinstance(mt_or_str_or_list, (Matrix, type(None))):
-                raise RuntimeError(f"Unknown matrix type: {type(mt_or_str_or_list)}")
-            mt = mt_or_str_or_list
+            if not isinstance(mt_or_str, (Matrix, type(None))):
+                raise RuntimeError(f"Unknown matrix type: {type(mt_or_str)}")
+            mt = mt_or_str
         return mt
 
     def __setitem__(self, key, array):
         old_mt = self._mp[key]
-        if isinstance(old_mt, str):
+        dir_with_id = os.path.join(self.compress_config.dump_matrix_dir, str(id(self)))
+        # only remove the temporary files. Files loaded by ``load`` are kept
+        if isinstance(old_mt, str) and os.path.dirname(old_mt) == dir_with_id:
             try:
                 os.remove(old_mt)
             except:
@@ -1,5 +1,10 @@
+import hashlib
+import json
 import logging
 import itertools
+import os
+import shutil
+import tempfile
 from copy import deepcopy
 from typing import List, Union
 
@@ -14,9 +19,10 @@ from renormalizer.mps.mp import MatrixProduct
 from renormalizer.mps.svd_qn import add_outer
 from renormalizer.mps import svd_qn
 from renormalizer.mps.lib import update_cv
+from renormalizer.mps.ab_initio_mpo import construct_ab_initio_mpo
 from renormalizer.mps.symbolic_mpo import construct_symbolic_mpo, _terms_to_table, symbolic_mo_to_numeric_mo, swap_site
 from renormalizer.utils import Quantity
-from renormalizer.model.op import Op
+from renormalizer.model.op import Op, OpTerms
 from renormalizer.utils.elementop import (
     construct_ph_op_dict,
 )
@@ -24,6 +30,11 @@ from renormalizer.utils.elementop import (
 
 logger = logging.getLogger(__name__)
 
+# the directory of the on-disk MPO cache. Disabled by default
+MPO_CACHE_DIR = os.environ.get("RENO_MPO_CACHE_DIR")
+# bump when the construction or the format of the cache changes
+MPO_CACHE_VERSION = "2"
+
 
 class Mpo(MatrixProduct):
     """
@@ -247,10 +258,55 @@ class Mpo(MatrixProduct):
         mpo.build_empty_qn()
         return mpo
 
-    def __init__(self, model: Model = None, terms: Union[Op, List[Op]] = None, offset: Quantity = Quantity(0), algo = "qr"):
+    @classmethod
+    def ab_initio(cls, model: Model, h1e, h2e, offset: Quantity = Quantity(0)):
+        r"""
+        Construct the ab initio electronic Hamiltonian MPO directly from the integrals
+        with the complementary operator scheme.
+        The result is the same as ``Mpo(Model(*qc_model(h1e, h2e)))``,
+        but the cost scales polynomially with the number of orbitals rather than the number of terms.
+        See :mod:`renormalizer.mps.ab_initio_mpo`.
+
+        Parameters
+        ----------
+        model : :class:`~renormalizer.model.Model`
+            The model with the basis from :func:`~renormalizer.model.h_qc.qc_model`.
+            The Hamiltonian terms of the model are not used.
+        h1e : np.ndarray
+            The 1-e integrals in spin orbitals.
+        h2e : np.ndarray or scipy.sparse.spmatrix
+            The 2-e integrals in spin orbitals, dense or sparse.
+            See :func:`~renormalizer.model.h_qc.int_to_h`.
+        offset : Quantity
+            The offset of the Hamiltonian.
+        """
+        if not isinstance(offset, Quantity):
+            raise ValueError(f"offset must be Quantity object. Got {offset} of {type(offset)}.")
+        mpo = cls()
+        mpo.model = model
+        mpo.offset = offset.as_au()
+        mpo.to_right = False
+        mo_list, mpo.qn, mpo.qntot, mpo.qnidx = construct_ab_initio_mpo(model.basis, h1e, h2e, -mpo.offset)
+        mpo.dtype = np.result_type(*mo_list)
+        for mo in mo_list:
+            mpo.append(mo)
+        return mpo
+
+    def __init__(self, model: Model = None, terms: Union[Op, List[Op]] = None, offset: Quantity = Quantity(0), algo = "qr",
+                 nproc: int = None, cache_dir: str = None):
 
         """
         todo: document
+
+        ``nproc`` is the number of worker processes for the symbolic MPO construction,
+        see :func:`~renormalizer.mps.symbolic_mpo.construct_symbolic_mpo`.
+
+        ``cache_dir`` is the directory of the on-disk MPO cache.
+        The MPO is looked up by a hash of the basis, the terms, the offset and ``algo``
+        and only constructed if not found. ``nproc`` is not a part of the key because
+        the parallel construction gives the same MPO as the serial one.
+        Default is the environment variable ``RENO_MPO_CACHE_DIR``. Set to ``False`` to disable.
+        MPOs loaded from the cache do not have the symbolic representation.
         """
         super(Mpo, self).__init__()
         # leave the possibility to construct MPO by hand
@@ -271,16 +327,25 @@ class Mpo(MatrixProduct):
         if len(terms) == 0:
             raise ValueError("Terms all have factor 0.")
 
+        self.model = model
+        self.to_right = False
+
+        if cache_dir is None:
+            cache_dir = MPO_CACHE_DIR
+        if cache_dir:
+            cache_path = os.path.join(cache_dir, _mpo_cache_key(model, terms, self.offset, algo))
+            if self._load_cache(cache_path):
+                logger.debug(f"MPO loaded from the cache {cache_path}")
+                return
+
         table, primary_ops, factor = _terms_to_table(model, terms, -self.offset)
 
         self.dtype = factor.dtype
 
         self.symbolic_mpo, self.qn, self.qntot, self.qnidx, self.symbolic_out_ops_list, self.primary_ops \
-            = construct_symbolic_mpo(table, primary_ops, factor, algo=algo)
+            = construct_symbolic_mpo(table, primary_ops, factor, algo=algo, nproc=nproc)
         # from renormalizer.mps.symbolic_mpo import _format_symbolic_mpo
         # print(_format_symbolic_mpo(mpo_symbol))
-        self.model = model
-        self.to_right = False
 
         # evaluate the symbolic mpo
         assert model.basis is not None
@@ -289,6 +354,46 @@ class Mpo(MatrixProduct):
             mo_mat = symbolic_mo_to_numeric_mo(model.basis[impo], mo, self.dtype)
             self.append(mo_mat)
 
+        if cache_dir:
+            self._dump_cache(cache_path)
+
+    def _load_cache(self, path) -> bool:
+        # the cache is in the directory format of `MatrixProduct.dump`.
+        # The header is written at last, so the entry is complete if the header exists
+        try:
+            with open(os.path.join(path, "header.json")) as fin:
+                header = json.load(fin)
+            arrays = [np.load(os.path.join(path, f"mt_{i}.npy")) for i in range(header["nsites"])]
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.exception(f"Loading MPO cache {path} failed")
+            return False
+        self.dtype = np.result_type(*arrays)
+        for array in arrays:
+            self.append(array)
+        self.qn = [np.array(qn, dtype=int).reshape(-1, self.model.qn_size) for qn in header["qn"]]
+        self.qntot = np.array(header["qntot"], dtype=int)
+        self.qnidx = header["qnidx"]
+        return True
+
+    def _dump_cache(self, path):
+        # write to a temporary directory and then rename,
+        # so that the jobs sharing the cache never see an incomplete entry
+        cache_dir = os.path.dirname(path)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(dir=cache_dir, prefix=".tmp_")
+            self._dump_dir(tmp_path, [])
+        except Exception:
+            logger.exception(f"Dumping MPO cache {path} failed")
+            return
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # the same MPO has been cached by another job
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
 
     def _get_sigmaqn(self, idx):
         array_up = self.model.basis[idx].sigmaqn
@@ -435,6 +540,8 @@ class Mpo(MatrixProduct):
             logger.debug("MPO: No need to swap")
             return
         assert len(diffs) == 2
+        if not hasattr(self, "symbolic_out_ops_list"):
+            raise ValueError("The MPO does not have the symbolic representation, such as loaded from the cache")
         i, j = min(diffs), max(diffs)
         assert j - i == 1
         logger.debug(f"MPO: swaping {i} and {j}")
@@ -492,3 +599,43 @@ class StackedMpo:
     """
     def __init__(self, mpos: List[Mpo]):
         self.mpos = mpos
+
+
+def _mpo_cache_key(model: Model, terms: Union[List[Op], OpTerms], offset: float, algo: str) -> str:
+    # A stable hash of the MPO construction input.
+    # Python's builtin `hash` is randomized for strings, so `hashlib` is used.
+    h = hashlib.sha256()
+    h.update(f"version: {MPO_CACHE_VERSION}, offset: {float(offset)!r}, algo: {algo}".encode())
+    for b in model.basis:
+        h.update(b.__class__.__name__.encode())
+        # the private attributes are used for internal states such as recursion flags
+        attrs = {k: v for k, v in vars(b).items() if not k.startswith("_")}
+        _update_digest(h, attrs)
+    if isinstance(terms, OpTerms):
+        _update_digest(h, [terms.symbols, terms.dofs, terms.offsets, terms.symbol_ids,
+                           terms.dof_ids, terms.factors, terms.qn])
+        return h.hexdigest()
+    for op in terms:
+        factor = op.factor
+        factor = complex(factor) if np.iscomplexobj(factor) else float(factor)
+        qn_list = [qn.tolist() for qn in op.qn_list]
+        h.update(repr((op.symbol, op.dofs, factor, qn_list)).encode())
+    return h.hexdigest()
+
+
+def _update_digest(h, obj):
+    # `repr` is not enough for arrays, which might be truncated
+    if isinstance(obj, np.ndarray):
+        h.update(f"ndarray{obj.dtype.str}{obj.shape}".encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        h.update(b"dict")
+        for k in sorted(obj.keys(), key=repr):
+            h.update(repr(k).encode())
+            _update_digest(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f"{type(obj).__name__}{len(obj)}".encode())
+        for item in obj:
+            _update_digest(h, item)
+    else:
+        h.update(repr(obj).encode())
@@ -1,7 +1,9 @@
 # -*- encoding: utf-8 -*-
 
 import logging
-from collections import Counter, deque
+import os
+from collections import Counter, deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps, reduce
 from typing import Union, List, Dict
 import itertools
@@ -29,9 +31,11 @@ from renormalizer.mps.matrix import (
     Matrix,
     asnumpy,
     asxp)
+from renormalizer.mps.oe_contract_wrap import oe_contract
 from renormalizer.mps.mp import MatrixProduct
 from renormalizer.mps.hop_expr import hop_expr
 from renormalizer.mps.mpo import Mpo
+from renormalizer.mps.memory_budget import update_memory_bonddim
 from renormalizer.utils import (
     OptimizeConfig,
     CompressCriteria,
@@ -39,9 +43,14 @@ from renormalizer.utils import (
     EvolveMethod
 )
 from renormalizer.utils.utils import calc_vn_entropy, calc_vn_entropy_dm
+from renormalizer.utils.profiler import profile_phase, profile_count, profile_bytes
 
 logger = logging.getLogger(__name__)
 
+# default parallelization of `Mps.expectations`
+EXPECTATIONS_THREADS = int(os.environ.get("RENO_EXPECTATIONS_THREADS", 1))
+EXPECTATIONS_BATCH = os.environ.get("RENO_EXPECTATIONS_BATCH") is not None
+
 
 def adaptive_tdvp(fun):
     # evolve t/2 (twice) and t to obtain the O(dt^3) error term in 2nd-order Trotter decomposition
@@ -348,6 +357,11 @@ class Mps(MatrixProduct):
 
     @classmethod
     def load(cls, model: Model, fname: str):
+        if os.path.isdir(fname):
+            # directory format. See `MatrixProduct.dump`
+            mp, attrs = cls._load_dir(model, fname)
+            mp.coeff = attrs["coeff"].item(0)
+            return mp
         npload = np.load(fname, allow_pickle=True)
         mp = cls()
         mp.model = model
@@ -480,12 +494,38 @@ class Mps(MatrixProduct):
         # This is time and memory consuming
         # return self_conj.dot(mpo.apply(self)).real
 
-    def expectations(self, mpos, self_conj=None, opt=True) -> np.ndarray:
+    def expectations(self, mpos, self_conj=None, opt=True, nthreads=None, batch=None) -> np.ndarray:
+        r"""
+        Expectations of a list of MPOs. In the optimized way, the environments shared by the
+        MPOs are calculated only once.
+
+        Parameters
+        ----------
+        mpos : list of :class:`~renormalizer.mps.Mpo`
+            The MPOs.
+        self_conj : :class:`Mps`
+            The conjugate of the MPS.
+        opt : bool
+            Whether to use the optimized way.
+        nthreads : int
+            Number of threads to carry out the remaining contractions of each MPO.
+            The contractions release the GIL in BLAS.
+            Defaults to the environment variable ``RENO_EXPECTATIONS_THREADS`` or 1.
+        batch : bool
+            Whether to stack the remaining contractions of MPOs with the same shape
+            and contract them as a batch.
+            Defaults to the environment variable ``RENO_EXPECTATIONS_BATCH`` or ``False``.
+        """
 
         if not opt:
             # the naive way, slow and time consuming. Yet predictable and reliable
             return np.array([self.expectation(mpo, self_conj) for mpo in mpos])
 
+        if nthreads is None:
+            nthreads = EXPECTATIONS_THREADS
+        if batch is None:
+            batch = EXPECTATIONS_BATCH
+
         # optimized way, cache for intermediates
         # hash is used as indices of the matrices.
         # The chance for collision (the same hash for two different matrices) is
@@ -509,13 +549,87 @@ class Mps(MatrixProduct):
             self_conj = self._expectation_conj()
         l_environ_dict = _construct_freq_environ(mpos_hash, hash_to_obj, self, "L", self_conj)
         r_environ_dict = _construct_freq_environ(mpos_hash, hash_to_obj, self, "R", self_conj)
-        results = []
+        tasks = []
         for mpo in mpos:
             l_environ, l_idx = _get_freq_environ(l_environ_dict, mpo, "L", np.inf)
             r_environ, r_idx = _get_freq_environ(r_environ_dict, mpo, "R", len(mpo)-l_idx-1)
-            for i in range(l_idx+1, r_idx):
-                l_environ = contract_one_site(l_environ, self[i], mpo[i], "L", self_conj[i])
-            results.append(complex(l_environ.flatten() @ r_environ.flatten()))  # cast to python type
+            tasks.append((mpo, l_environ, l_idx, r_environ, r_idx))
+
+        if batch:
+            results = _expectations_batched(self, self_conj, tasks)
+        else:
+            def contract_remaining(task):
+                mpo, l_environ, l_idx, r_environ, r_idx = task
+                for i in range(l_idx+1, r_idx):
+                    l_environ = contract_one_site(l_environ, self[i], mpo[i], "L", self_conj[i])
+                return complex(l_environ.flatten() @ r_environ.flatten())  # cast to python type
+
+            if nthreads == 1 or len(tasks) == 1:
+                results = list(map(contract_remaining, tasks))
+            else:
+                with ThreadPoolExecutor(nthreads) as executor:
+                    results = list(executor.map(contract_remaining, tasks))
+
+        results = np.array(results)
+        if np.allclose(results.imag, 0):
+            return results.real
+        else:
+            return results
+
+    def calc_local_expectations(self, ops: List[Op], self_conj=None) -> np.ndarray:
+        r"""
+        Expectations of one-site and nearest-neighbour operators without constructing
+        an MPO for each operator. The overlap environments of the sites are constructed once
+        and shared by all operators, so the total cost is :math:`O(N)` contractions.
+
+        Parameters
+        ----------
+        ops : list of :class:`~renormalizer.model.Op`
+            The operators. Each operator should act on one MPS site or two neighbouring MPS sites.
+        self_conj : :class:`Mps`
+            The conjugate of the MPS. Defaults to the conjugate of ``self``.
+
+        Returns
+        -------
+        expectations : np.ndarray
+            The expectation values in the same order of ``ops``.
+            Consistent with ``self.expectations([Mpo(self.model, op) for op in ops])``.
+        """
+        if self_conj is None:
+            self_conj = self._expectation_conj()
+
+        # (factor, [(site idx, local operator matrix)]) for each operator
+        ops_info = []
+        for op in ops:
+            elem_ops, factor = op.split_elementary(self.model.dof_to_siteidx)
+            site_ops = []
+            for elem_op in elem_ops:
+                isite = self.model.dof_to_siteidx[elem_op.dofs[0]]
+                site_ops.append((isite, self.model.basis[isite].op_mat(elem_op)))
+            if 2 < len(site_ops) or (len(site_ops) == 2 and site_ops[1][0] != site_ops[0][0] + 1):
+                raise ValueError(f"Only one-site and nearest-neighbour operators are supported. Got {op}")
+            ops_info.append((factor, site_ops))
+
+        l_environ = _overlap_environ(self, self_conj, "L")
+        r_environ = _overlap_environ(self, self_conj, "R")
+
+        rdm_cache = {}
+        results = []
+        for factor, site_ops in ops_info:
+            if len(site_ops) == 1:
+                isite, op_mat = site_ops[0]
+                if isite not in rdm_cache:
+                    rdm_cache[isite] = _local_rdm(self, self_conj, isite, l_environ, r_environ)
+                val = (rdm_cache[isite] * asxp(op_mat)).sum()
+            else:
+                (isite1, op_mat1), (isite2, op_mat2) = site_ops
+                ms1, ms1_conj = _as_4d(self[isite1]), _as_4d(self_conj[isite1])
+                ms2, ms2_conj = _as_4d(self[isite2]), _as_4d(self_conj[isite2])
+                tensor = oe_contract("ab, aplc, pq, bqld -> cd",
+                    l_environ[isite1-1], ms1_conj, asxp(op_mat1), ms1)
+                val = oe_contract("cd, cmxe, mn, dnxf, ef",
+                    tensor, ms2_conj, asxp(op_mat2), ms2, r_environ[isite2+1])
+            results.append(complex(val) * factor)
 
         results = np.array(results)
         if np.allclose(results.imag, 0):
@@ -529,17 +643,8 @@ class Mps(MatrixProduct):
         phonon occupations :math:`b^\dagger_i b_i` for each electronic DoF.
         The order is defined by :attr:`~renormalizer.model.model.v_dofs`.
         """
-        key = "ph_occupations"
         # ph_occupations is actually the occupation of the basis
-        if key not in self.model.mpos:
-            mpos = []
-            for dof in self.model.v_dofs:
-                mpos.append(Mpo(self.model, Op("n", dof)))
-            self.model.mpos[key] = mpos
-        else:
-            mpos = self.model.mpos[key]
-
-        return self.expectations(mpos)
+        return self.calc_local_expectations([Op("n", dof) for dof in self.model.v_dofs])
 
     @property
     def e_occupations(self):
@@ -547,15 +652,7 @@ class Mps(MatrixProduct):
         Electronic occupations :math:`a^\dagger_i a_i` for each electronic DoF.
         The order is defined by :attr:`~renormalizer.model.model.e_dofs`.
         """
-        key = "e_occupations"
-        if key not in self.model.mpos:
-            mpos = []
-            for dof in self.model.e_dofs:
-                mpos.append(Mpo(self.model, Op(r"a^\dagger a", dof)))
-            self.model.mpos[key] = mpos
-        else:
-            mpos = self.model.mpos[key]
-        return self.expectations(mpos)
+        return self.calc_local_expectations([Op(r"a^\dagger a", dof) for dof in self.model.e_dofs])
 
     def metacopy(self) -> "Mps":
         new: Mps = super().metacopy()
@@ -1231,10 +1328,14 @@ class Mps(MatrixProduct):
 
         # construct the environment matrix
         # almost half is not used. Not a big deal.
-        environ = Environ(mps, mpo)
+        environ = Environ(mps, mpo, storage=self.evolve_config.environ_storage,
+                          storage_dir=self.evolve_config.environ_dir)
 
         # statistics for debug output
         local_steps = []
+        # the sizes of the last Krylov subspaces of the site and the bond propagation,
+        # used as the hints for the next site
+        krylov_hint = {"site": None, "bond": None}
         # sweep for 2 rounds
         for i in range(2):
             for imps in mps.iter_idx_list(full=True):
@@ -1245,36 +1346,42 @@ class Mps(MatrixProduct):
                 shape = list(mps[imps].shape)
                 hop = hop_expr(l_array, r_array, [asxp(mpo[imps].array)], shape)
 
-                if self.evolve_config.ivp_solver == "krylov":
-                    mps_t, j = expm_krylov(
-                        lambda y: hop(y.reshape(shape)).ravel(),
-                        -1j * evolve_dt / 2, mps[imps].ravel().array
-                    )
-                else:
-                    sol = solve_ivp(
-                        lambda t, y: hop(y.reshape(shape)).ravel() / coef,
-                        (0, evolve_dt/2),
-                        mps[imps].ravel().array,
-                        method=self.evolve_config.ivp_solver,
-                        rtol=self.evolve_config.ivp_rtol,
-                        atol=self.evolve_config.ivp_atol,
-                    )
-                    mps_t, j = sol.y, sol.nfev
+                with profile_phase("propagate", site=imps):
+                    if self.evolve_config.ivp_solver == "krylov":
+                        mps_t, j = expm_krylov(
+                            lambda y: hop(y.reshape(shape)).ravel(),
+                            -1j * evolve_dt / 2, mps[imps].ravel().array,
+                            size_hint=krylov_hint["site"]
+                        )
+                        krylov_hint["site"] = j
+                    else:
+                        sol = solve_ivp(
+                            lambda t, y: hop(y.reshape(shape)).ravel() / coef,
+                            (0, evolve_dt/2),
+                            mps[imps].ravel().array,
+                            method=self.evolve_config.ivp_solver,
+                            rtol=self.evolve_config.ivp_rtol,
+                            atol=self.evolve_config.ivp_atol,
+                        )
+                        mps_t, j = sol.y, sol.nfev
+                    profile_count("hop_vectors", j)
+                    profile_bytes(l_array, r_array, mpo[imps].array, mps_t, j * mps_t.nbytes)
 
                 local_steps.append(j)
                 mps_t = mps_t.reshape(shape)
 
-                qnbigl, qnbigr, _ = mps._get_big_qn([imps])
-                u, qnlset, v, qnrset = svd_qn.svd_qn(
-                    asnumpy(mps_t),
-                    qnbigl,
-                    qnbigr,
-                    mps.qntot,
-                    QR=True,
-                    system=system,
-                    full_matrices=False,
-                )
-                vt = v.T
+                with profile_phase("svd", site=imps):
+                    qnbigl, qnbigr, _ = mps._get_big_qn([imps])
+                    u, qnlset, v, qnrset = svd_qn.svd_qn(
+                        asnumpy(mps_t),
+                        qnbigl,
+                        qnbigr,
+                        mps.qntot,
+                        QR=True,
+                        system=system,
+                        full_matrices=False,
+                    )
+                    vt = v.T
 
                 if not mps.to_right and imps != 0:
                     mps[imps] = vt.reshape([-1] + shape[1:])
@@ -1288,21 +1395,26 @@ class Mps(MatrixProduct):
                     # reverse update u site
                     shape_u = u.shape
                     hop_u = hop_expr(l_array, r_array, [], shape_u)
-                    if self.evolve_config.ivp_solver == "krylov":
-                        mps_t, j = expm_krylov(
-                            lambda y: hop_u(y.reshape(shape_u)).ravel(),
-                            1j * evolve_dt / 2, u.ravel()
-                        )
-                    else:
-                        sol = solve_ivp(
-                            lambda t, y: hop_u(y.reshape(shape_u)).ravel() / -coef,
-                            (0, evolve_dt/2),
-                            u.ravel(),
-                            method=self.evolve_config.ivp_solver,
-                            rtol=self.evolve_config.ivp_rtol,
-                            atol=self.evolve_config.ivp_atol,
-                        )
-                        mps_t, j = sol.y, sol.nfev
+                    with profile_phase("propagate_bond", site=imps):
+                        if self.evolve_config.ivp_solver == "krylov":
+                            mps_t, j = expm_krylov(
+                                lambda y: hop_u(y.reshape(shape_u)).ravel(),
+                                1j * evolve_dt / 2, u.ravel(),
+                                size_hint=krylov_hint["bond"]
+                            )
+                            krylov_hint["bond"] = j
+                        else:
+                            sol = solve_ivp(
+                                lambda t, y: hop_u(y.reshape(shape_u)).ravel() / -coef,
+                                (0, evolve_dt/2),
+                                u.ravel(),
+                                method=self.evolve_config.ivp_solver,
+                                rtol=self.evolve_config.ivp_rtol,
+                                atol=self.evolve_config.ivp_atol,
+                            )
+                            mps_t, j = sol.y, sol.nfev
+                        profile_count("hop_vectors", j)
+                        profile_bytes(l_array, r_array, mps_t, j * mps_t.nbytes)
 
                     local_steps.append(j)
                     mps_t = mps_t.reshape(shape_u)
@@ -1321,21 +1433,26 @@ class Mps(MatrixProduct):
                     # reverse update svt site
                     shape_svt = vt.shape
                     hop_svt = hop_expr(l_array, r_array, [], shape_svt)
-                    if self.evolve_config.ivp_solver == "krylov":
-                        mps_t, j = expm_krylov(
-                            lambda y: hop_svt(y.reshape(shape_svt)).ravel(),
-                            1j * evolve_dt / 2, vt.ravel()
-                        )
-                    else:
-                        sol = solve_ivp(
-                            lambda t, y: hop_svt(y.reshape(shape_svt)).ravel() / -coef,
-                            (0, evolve_dt/2),
-                            vt.ravel(),
-                            method=self.evolve_config.ivp_solver,
-                            rtol=self.evolve_config.ivp_rtol,
-                            atol=self.evolve_config.ivp_atol,
-                        )
-                        mps_t, j = sol.y, sol.nfev
+                    with profile_phase("propagate_bond", site=imps):
+                        if self.evolve_config.ivp_solver == "krylov":
+                            mps_t, j = expm_krylov(
+                                lambda y: hop_svt(y.reshape(shape_svt)).ravel(),
+                                1j * evolve_dt / 2, vt.ravel(),
+                                size_hint=krylov_hint["bond"]
+                            )
+                            krylov_hint["bond"] = j
+                        else:
+                            sol = solve_ivp(
+                                lambda t, y: hop_svt(y.reshape(shape_svt)).ravel() / -coef,
+                                (0, evolve_dt/2),
+                                vt.ravel(),
+                                method=self.evolve_config.ivp_solver,
+                                rtol=self.evolve_config.ivp_rtol,
+                                atol=self.evolve_config.ivp_atol,
+                            )
+                            mps_t, j = sol.y, sol.nfev
+                        profile_count("hop_vectors", j)
+                        profile_bytes(l_array, r_array, mps_t, j * mps_t.nbytes)
 
                     local_steps.append(j)
                     mps_t = mps_t.reshape(shape_svt)
@@ -1346,6 +1463,7 @@ class Mps(MatrixProduct):
                     mps[imps] = mps_t
             mps._switch_direction()
 
+        environ.close()
         steps_stat = stats.describe(local_steps)
         logger.debug(f"TDVP-PS Krylov space: {steps_stat}")
         mps.evolve_config.stat = steps_stat
@@ -1370,12 +1488,19 @@ class Mps(MatrixProduct):
 
         # construct the environment matrix
         # almost half is not used. Not a big deal.
-        environ = Environ(mps, mpo)
+        environ = Environ(mps, mpo, storage=self.evolve_config.environ_storage,
+                          storage_dir=self.evolve_config.environ_dir)
 
         # statistics for debug output
         local_steps = []
+        # the sizes of the last Krylov subspaces of the site and the bond propagation,
+        # used as the hints for the next site
+        krylov_hint = {"site": None, "bond": None}
         # sweep for 2 rounds
         for i in range(2):
+            # the Krylov vectors are preallocated according to the last size. See `expm_krylov`
+            nvectors = 50 if krylov_hint["site"] is None else krylov_hint["site"] + 2
+            update_memory_bonddim(mps, mpo, nsite=2, nvectors=nvectors)
             for imps in mps.iter_idx_list(full=False):
                 if mps.to_right:
                     lidx, cidx0, cidx1, ridx = range(imps - 1, imps + 3)
@@ -1399,8 +1524,10 @@ class Mps(MatrixProduct):
                     mps_t, j = expm_krylov(
                         lambda y: hop(y.reshape(ms2.shape)).ravel(),
                         -1j * evolve_dt / 2,
-                        ms2.ravel()
+                        ms2.ravel(),
+                        size_hint=krylov_hint["site"]
                     )
+                    krylov_hint["site"] = j
                 else:
                     sol = solve_ivp(
                         lambda t, y: hop(y.reshape(ms2.shape)).ravel() / coef,
@@ -1439,8 +1566,10 @@ class Mps(MatrixProduct):
                 if self.evolve_config.ivp_solver == "krylov":
                     mps_t, j = expm_krylov(
                         lambda y: hop(y.reshape(ms1.shape)).ravel(),
-                        1j * evolve_dt / 2, ms1.ravel()
+                        1j * evolve_dt / 2, ms1.ravel(),
+                        size_hint=krylov_hint["bond"]
                     )
+                    krylov_hint["bond"] = j
                 else:
                     sol = solve_ivp(
                         lambda t, y: hop(y.reshape(ms1.shape)).ravel() / -coef,
@@ -1459,6 +1588,7 @@ class Mps(MatrixProduct):
 
             mps._switch_direction()
 
+        environ.close()
         steps_stat = stats.describe(local_steps)
         logger.debug(f"TDVP-PS Krylov space: {steps_stat}")
         mps.evolve_config.stat = steps_stat
@@ -1510,8 +1640,6 @@ class Mps(MatrixProduct):
             :math:`\{0:\rho_0, 1:\rho_1, \cdots\}`. The key is the index of the site.
         """
 
-        identity = Mpo.identity(self.model)
-        environ = Environ(self, identity, "R")
         if idx is None:
             idx = list(range(self.site_num))
         elif type(idx) is int:
@@ -1521,88 +1649,120 @@ class Mps(MatrixProduct):
         else:
             assert False
 
+        self_conj = self.conj()
+        l_environ = _overlap_environ(self, self_conj, "L", max(idx) - 1)
+        r_environ = _overlap_environ(self, self_conj, "R", min(idx) + 1)
         rdm = {}
-        for ims, ms in enumerate(self):
-            ltensor = environ.GetLR(
-                "L", ims-1, self, identity, itensor=None, method="System"
-            )
-            rtensor = environ.GetLR(
-                "R", ims+1, self, identity, itensor=None, method="Enviro"
-            )
-            if ims not in idx:
-                continue
-
-            ltensor = ltensor.reshape(ltensor.shape[0], ltensor.shape[-1])
-            rtensor = rtensor.reshape(rtensor.shape[0], rtensor.shape[-1])
-            
-            tensor = tensordot(ltensor, ms.conj(), ([0],[0]))
-            tensor = tensordot(tensor, rtensor, ([-1],[0]))
-            if ms.ndim == 3:
-                tensor = tensordot(tensor, ms, ([0,-1],[0,-1]))
-            else:
-                tensor = tensordot(tensor, ms, ([0,-1,-2],[0,-1,-2]))
+        for ims in sorted(idx):
+            tensor = _local_rdm(self, self_conj, ims, l_environ, r_environ)
             assert xp.allclose(tensor, tensor.T.conj())
             rdm[ims] = asnumpy(tensor)
 
         return rdm
     
-    def calc_2site_rdm(self):
+    def calc_2site_rdm(self, idx=None, max_distance=None, lazy=False, nthreads=None):
         r""" Calculate 2-site reduced density matrix
         
         :math:`\rho_{ij} = \textrm{Tr}_{k \neq i, k \neq j} | \Psi \rangle \langle \Psi |`.
-        
+
+        Parameters
+        ----------
+        idx : tuple, list of tuple, optional
+            The pairs of site indices of the rdms. Default is None, which means all
+            the pairs ``(i, j)`` with ``i < j`` are calculated.
+        max_distance : int, optional
+            Only calculate the pairs with ``abs(i - j) <= max_distance``.
+        lazy : bool
+            If ``True``, a generator that yields ``((i, j), rdm)`` is returned instead of a dict,
+            so that the rdms are not held in the memory at the same time.
+        nthreads : int
+            Number of threads to calculate the rdms starting from different sites.
+            Defaults to the environment variable ``RENO_EXPECTATIONS_THREADS`` or 1.
+
         Returns
         -------
         rdm: Dict
             :math:`\{(0,1):\rho_{01}, (0,2):\rho_{02}, \cdots\}`. The key is a tuple of index of the site.
         """
-        
-        identity = Mpo.identity(self.model)
-        environ_R = Environ(self, identity, "R")
-        environ_L = Environ(self, identity, "L")
-        L_component = []
-        R_component = []
-        rdm = {}
-        # first construct 1-site environment
-        for ims, ms in enumerate(self):
-            ltensor = environ_L.GetLR("L", ims-1, self, identity,
-                    itensor=None, method="Enviro")
-            ltensor = ltensor.reshape(ltensor.shape[0], ltensor.shape[-1])
-            tensor = tensordot(ltensor, ms.conj(), ([0],[0]))
-            if ms.ndim == 3:
-                tensor = tensordot(tensor, ms, ([0],[0]))
-            elif ms.ndim == 4:
-                tensor = tensordot(tensor, ms, ([0,2],[0,2]))
-            L_component.append(tensor.transpose((0,2,1,3)))
-            
-            rtensor = environ_R.GetLR("R", ims+1, self, identity,
-                    itensor=None, method="Enviro")
-            rtensor = rtensor.reshape(rtensor.shape[0], rtensor.shape[-1])
-            tensor = tensordot(ms.conj(), rtensor, ([-1],[0]))
-            if ms.ndim == 3:
-                tensor = tensordot(tensor, ms, ([-1],[-1]))
-            elif ms.ndim == 4:
-                tensor = tensordot(tensor, ms, ([2,-1],[2,-1]))
-            R_component.append(tensor.transpose((0,2,1,3)))
-        
-        # merge two 1-site environment together
-        for ims in range(self.site_num):
-            tensor = L_component[ims]
-            for jms in range(ims+1, self.site_num):
-                if jms != ims+1:
-                    kms = jms - 1
-                    tensor = tensordot(tensor, self[kms].conj(), ([2],[0]))
-                    if self[kms].ndim == 3:
-                        tensor = tensordot(tensor, self[kms], ([2,3],[0,1]))
-                    elif self[kms].ndim == 4:
-                        tensor = tensordot(tensor, self[kms], ([2,3,4],[0,1,2]))
-                
-                rtensor = R_component[jms]
-                res = tensordot(tensor, rtensor,
-                        ([2,3],[0,1])).transpose(0,2,1,3)
-                rdm[(ims, jms)] = asnumpy(res.reshape(res.shape[0]*res.shape[1],-1))
-        return rdm
-    
+        if idx is None:
+            idx = list(itertools.combinations(range(self.site_num), 2))
+        elif isinstance(idx, tuple):
+            idx = [idx]
+        else:
+            idx = list(idx)
+        for i, j in idx:
+            if i == j or not (0 <= i < self.site_num and 0 <= j < self.site_num):
+                raise ValueError(f"Invalid site pair: {(i, j)}")
+        if max_distance is not None:
+            idx = [(i, j) for i, j in idx if abs(i - j) <= max_distance]
+        if nthreads is None:
+            nthreads = EXPECTATIONS_THREADS
+
+        generator = self._calc_2site_rdm_generator(idx, nthreads)
+        if lazy:
+            return generator
+        return dict(generator)
+
+    def _calc_2site_rdm_generator(self, idx, nthreads):
+        # the pairs are grouped by the left site. Each group is calculated by sweeping
+        # to the right once, and the groups are independent of each other.
+        rows = defaultdict(set)
+        for i, j in idx:
+            rows[min(i, j)].add(max(i, j))
+        if not rows:
+            return
+        self_conj = self.conj()
+        l_environ = _overlap_environ(self, self_conj, "L", max(rows.keys()) - 1)
+        r_environ = _overlap_environ(self, self_conj, "R", min(min(row) for row in rows.values()) + 1)
+
+        def calc_row(ims):
+            jms_set = rows[ims]
+            #  S-a-S-c
+            #      p
+            #      q
+            #  S-b-S-d
+            ms, ms_conj = _as_4d(self[ims]), _as_4d(self_conj[ims])
+            tensor = oe_contract("ab, aplc, bqld -> pqcd", l_environ[ims-1], ms_conj, ms)
+            res = {}
+            for jms in range(ims+1, max(jms_set)+1):
+                ms, ms_conj = _as_4d(self[jms]), _as_4d(self_conj[jms])
+                if jms in jms_set:
+                    rdm = oe_contract("pqab, arlc, bsld, cd -> prqs", tensor, ms_conj, ms, r_environ[jms+1])
+                    res[(ims, jms)] = asnumpy(rdm.reshape(rdm.shape[0] * rdm.shape[1], -1))
+                tensor = oe_contract("pqab, arlc, brld -> pqcd", tensor, ms_conj, ms)
+            return res
+
+        row_idx = defaultdict(list)
+        for i, j in idx:
+            row_idx[min(i, j)].append((i, j))
+
+        def reorder(ims, row_res):
+            # yield in the order of `idx`
+            for i, j in row_idx[ims]:
+                rdm = row_res[(min(i, j), max(i, j))]
+                if j < i:
+                    # swap the two sites
+                    di, dj = self.pbond_list[i], self.pbond_list[j]
+                    rdm = rdm.reshape(dj, di, dj, di).transpose(1, 0, 3, 2).reshape(di * dj, -1)
+                yield (i, j), rdm
+
+        sorted_rows = sorted(rows.keys())
+        if nthreads == 1 or len(sorted_rows) == 1:
+            for ims in sorted_rows:
+                yield from reorder(ims, calc_row(ims))
+        else:
+            with ThreadPoolExecutor(nthreads) as executor:
+                # at most `nthreads` rows are calculated and held at the same time
+                futures = deque()
+                for ims in sorted_rows:
+                    futures.append((ims, executor.submit(calc_row, ims)))
+                    if len(futures) == nthreads:
+                        done_ims, future = futures.popleft()
+                        yield from reorder(done_ims, future.result())
+                while futures:
+                    done_ims, future = futures.popleft()
+                    yield from reorder(done_ims, future.result())
+
     def calc_edof_rdm(self) -> np.ndarray:
         r"""Calculate the reduced density matrix of electronic DoF
         
@@ -1664,12 +1824,12 @@ class Mps(MatrixProduct):
 
         if entropy_type in ["1site", "2site"]:
             if entropy_type == "1site":
-                rdm = self.calc_1site_rdm()
+                rdm_items = self.calc_1site_rdm().items()
             else:
-                rdm = self.calc_2site_rdm()
+                rdm_items = self.calc_2site_rdm(lazy=True)
             
             entropy = {}
-            for key, dm in rdm.items():
+            for key, dm in rdm_items:
                 entropy[key] = calc_vn_entropy_dm(dm)
 
         elif entropy_type == "mutual":
@@ -1680,14 +1840,20 @@ class Mps(MatrixProduct):
             raise ValueError(f"unsupported entropy type {entropy_type}")
         return entropy
     
-    def calc_2site_mutual_entropy(self) -> np.ndarray:
+    def calc_2site_mutual_entropy(self, max_distance=None) -> np.ndarray:
         r""" 
         Calculate mutual entropy between two sites. Also known as mutual information
         
         :math:`m_{ij} = (s_i + s_j - s_{ij})/2`
             
         See Chemical Physics 323 (2006) 519–531
-        
+
+        Parameters
+        ----------
+        max_distance : int, optional
+            Only calculate the pairs with ``abs(i - j) <= max_distance``.
+            The other elements are set to zero.
+
         Returns
         -------
         mutual_entropy : 2d np.ndarry
@@ -1695,13 +1861,12 @@ class Mps(MatrixProduct):
 
         """
         entropy_1site = self.calc_entropy("1site")
-        entropy_2site = self.calc_entropy("2site")
         nsites = self.site_num
         mut_entropy = np.zeros((nsites, nsites))
-        for isite, jsite in itertools.combinations(range(nsites),2):
-            key = (isite, jsite) if (isite, jsite) in entropy_2site.keys() else (jsite, isite)
+        # the 2-site rdms are discarded once the entropy is calculated
+        for (isite, jsite), dm in self.calc_2site_rdm(max_distance=max_distance, lazy=True):
             mut_entropy[isite, jsite] = (entropy_1site[isite] + entropy_1site[jsite] -
-                    entropy_2site[key]) / 2
+                    calc_vn_entropy_dm(dm)) / 2
         mut_entropy += mut_entropy.T
         return mut_entropy
 
@@ -1741,8 +1906,8 @@ class Mps(MatrixProduct):
             s_array = self.calc_bond_singular_values()
         return np.array([calc_vn_entropy(sigma ** 2) for sigma in s_array])
 
-    def dump(self, fname):
-        super().dump(fname, other_attrs=["coeff"])
+    def dump(self, fname, fmt="npz"):
+        super().dump(fname, other_attrs=["coeff"], fmt=fmt)
 
     def __setitem__(self, key, value):
         return super().__setitem__(key, value)
@@ -2095,6 +2260,86 @@ def _construct_freq_environ(mpos_hash: List[List[int]], hash_to_obj: Dict[int, M
     return result
 
 
+def _as_4d(ms):
+    # (left bond, physical bond, ancillary bond, right bond) for both MPS and MPDM
+    ms = asxp(ms)
+    if ms.ndim == 3:
+        return ms.reshape(ms.shape[0], ms.shape[1], 1, ms.shape[2])
+    return ms
+
+
+def _overlap_environ(mps: Mps, mps_conj, domain: str, end: int = None):
+    """
+    The environments of the overlap between ``mps_conj`` and ``mps``.
+    The first index is for ``mps_conj`` and the second index is for ``mps``.
+
+    Returns
+    -------
+    environ : dict
+        The key is the index of the last site contracted.
+        For "L", the key ranges from ``-1`` (the boundary) to ``end``.
+        For "R", the key ranges from ``len(mps)`` (the boundary) to ``end``.
+    """
+    assert domain in ["L", "R"]
+    if domain == "L":
+        if end is None:
+            end = len(mps) - 1
+        boundary, sitelist = -1, range(end + 1)
+    else:
+        if end is None:
+            end = 0
+        boundary, sitelist = len(mps), range(len(mps) - 1, end - 1, -1)
+    environ = {boundary: xp.ones((1, 1), dtype=backend.real_dtype)}
+    tensor = environ[boundary]
+    for isite in sitelist:
+        ms, ms_conj = _as_4d(mps[isite]), _as_4d(mps_conj[isite])
+        if domain == "L":
+            tensor = oe_contract("ab, aplc, bpld -> cd", tensor, ms_conj, ms)
+        else:
+            tensor = oe_contract("cd, aplc, bpld -> ab", tensor, ms_conj, ms)
+        environ[isite] = tensor
+    return environ
+
+
+def _local_rdm(mps: Mps, mps_conj, isite: int, l_environ, r_environ):
+    # one-site reduced density matrix. The first index is for ``mps_conj``
+    ms, ms_conj = _as_4d(mps[isite]), _as_4d(mps_conj[isite])
+    return oe_contract("ab, aplc, bqld, cd -> pq",
+        l_environ[isite-1], ms_conj, ms, r_environ[isite+1])
+
+
+def _expectations_batched(mps: Mps, mps_conj, tasks):
+    """
+    Carry out the remaining contractions in ``Mps.expectations``.
+    The tasks that start and end at the same sites with the same shapes are stacked
+    and contracted with an additional batch index ``B``.
+    """
+    groups = defaultdict(list)
+    for itask, (mpo, l_environ, l_idx, r_environ, r_idx) in enumerate(tasks):
+        key = (l_idx, r_idx, l_environ.shape, r_environ.shape) \
+              + tuple(mpo[i].shape for i in range(l_idx+1, r_idx))
+        groups[key].append(itask)
+
+    results = [None] * len(tasks)
+    for key, itasks in groups.items():
+        l_idx, r_idx = key[:2]
+        l_environ = xp.stack([tasks[itask][1] for itask in itasks])
+        r_environ = xp.stack([tasks[itask][3] for itask in itasks])
+        for i in range(l_idx+1, r_idx):
+            mo = xp.stack([asxp(tasks[itask][0][i]) for itask in itasks])
+            ms, ms_conj = asxp(mps[i]), asxp(mps_conj[i])
+            # see `contract_one_site`
+            if ms.ndim == 3:
+                l_environ = oe_contract("Babc, adf, Bbdeg, ceh -> Bfgh", l_environ, ms_conj, mo, ms)
+            else:
+                l_environ = oe_contract("Babc, adlf, Bbdeg, celh -> Bfgh", l_environ, ms_conj, mo, ms)
+        values = asnumpy(xp.einsum("Bx, Bx -> B",
+            l_environ.reshape(len(itasks), -1), r_environ.reshape(len(itasks), -1)))
+        for itask, value in zip(itasks, values):
+            results[itask] = complex(value)
+    return results
+
+
 def _get_freq_environ(environ_dict, mpo, domain, max_length):
     assert domain in ["L", "R"]
 
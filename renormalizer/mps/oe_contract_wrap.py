@@ -1,14 +1,112 @@
 # wraps opt_einsum contraction to show memory errors
+# and to cache the contraction paths
+import atexit
 import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
 
 import opt_einsum as oe
 
 from renormalizer.mps.backend import MEMORY_ERRORS, ARRAY_TYPES, xp
+from renormalizer.utils.profiler import profiling_enabled, profile_flops, profile_bytes
 
 
 logger = logging.getLogger(__name__)
 
 
+PATH_CACHE_KEY = "RENO_OE_PATH_CACHE"
+
+
+class ContractionPathCache:
+    """
+    LRU cache of the contraction paths keyed by the subscripts, the shapes of the operands
+    and the path optimization algorithm.
+    In Reno the same contraction with the same shapes is performed thousands of times
+    during a sweep, and searching for the ``optimal`` path is a considerable overhead
+    for small and medium bond dimensions.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of paths stored in the cache.
+    """
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            path = self._cache.get(key)
+            if path is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(key)
+            return path
+
+    def put(self, key, path):
+        with self._lock:
+            self._cache[key] = path
+            self._cache.move_to_end(key)
+            while self.maxsize < len(self._cache):
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def dump(self, fname: str):
+        with self._lock:
+            items = list(self._cache.items())
+        # write to a temporary file first in case of shutdown while dumping
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "wb") as fout:
+            pickle.dump(items, fout)
+        os.replace(tmp_fname, fname)
+        logger.debug(f"{len(items)} contraction paths dumped to {fname}")
+
+    def load(self, fname: str):
+        with open(fname, "rb") as fin:
+            items = pickle.load(fin)
+        for key, path in items:
+            self.put(key, path)
+        logger.debug(f"{len(items)} contraction paths loaded from {fname}")
+
+    def __len__(self):
+        return len(self._cache)
+
+
+path_cache = ContractionPathCache()
+
+
+def _load_persistent_path_cache():
+    fname = os.environ.get(PATH_CACHE_KEY, None)
+    if fname is None:
+        return
+    if os.path.exists(fname):
+        try:
+            path_cache.load(fname)
+        except Exception:
+            logger.exception(f"Loading contraction path cache from {fname} failed")
+
+    def dump_at_exit():
+        try:
+            path_cache.dump(fname)
+        except Exception:
+            logger.exception(f"Dumping contraction path cache to {fname} failed")
+
+    atexit.register(dump_at_exit)
+
+
+_load_persistent_path_cache()
+
+
 def log_error(e, args, kwargs):
     logger.exception(e)
     logger.fatal("The arguments are:")
@@ -34,8 +132,70 @@ def update_kwargs(args, kwargs):
         # modify in-place
         kwargs["optimize"] = algo
 
+
+def _shape_args(args):
+    # replace the arrays by their shapes. Subscripts and interleaved indices are unchanged
+    res = []
+    for arg in args:
+        if hasattr(arg, "shape"):
+            res.append(tuple(arg.shape))
+        elif isinstance(arg, str):
+            res.append(arg)
+        else:
+            res.append(tuple(arg))
+    return res
+
+
+def update_path(args, kwargs, kind):
+    # replace the path optimization algorithm in `kwargs` by the cached path.
+    # `kind` distinguishes `oe.contract` and `oe.contract_expression` in which
+    # shapes are provided directly.
+    algo = kwargs["optimize"]
+    if not isinstance(algo, str):
+        # explicit path
+        return
+    shape_args = _shape_args(args)
+    key = (kind, algo) + tuple(shape_args)
+    path = path_cache.get(key)
+    if path is None:
+        path, _ = oe.contract_path(*shape_args, optimize=algo, shapes=True)
+        path_cache.put(key, path)
+    kwargs["optimize"] = path
+
+
+# the estimated cost of the contractions, only used when profiling
+_cost_cache = {}
+
+
+def contraction_cost(args, path):
+    """
+    The estimated number of floating point operations and the number of elements
+    of the largest intermediate of a contraction with the given path.
+    """
+    shape_args = tuple(_shape_args(args))
+    key = (shape_args, tuple(tuple(step) for step in path))
+    cost = _cost_cache.get(key)
+    if cost is None:
+        _, info = oe.contract_path(*shape_args, optimize=path, shapes=True)
+        cost = _cost_cache[key] = (int(info.opt_cost), int(info.largest_intermediate))
+    return cost
+
+
+def _profile_contraction(args, path, *operands):
+    # report the FLOPs and the bytes of the contraction to the active profiler.
+    # `operands` are the arrays that are not included in `args`
+    flops, largest_intermediate = contraction_cost(args, path)
+    arrays = [arg for arg in args + operands if hasattr(arg, "dtype")]
+    itemsize = max(array.dtype.itemsize for array in arrays)
+    profile_flops(flops)
+    profile_bytes(arrays, largest_intermediate * itemsize)
+
+
 def oe_contract(*args, **kwargs):
     update_kwargs(args, kwargs)
+    update_path(args, kwargs, "contract")
+    if profiling_enabled():
+        _profile_contraction(args, kwargs["optimize"])
     try:
         return oe.contract(*args, **kwargs)
     except MEMORY_ERRORS as e:
@@ -46,8 +206,11 @@ def oe_contract(*args, **kwargs):
 
 def oe_contract_expression(*args, **kwargs):
     update_kwargs(args, kwargs)
+    update_path(args, kwargs, "expression")
     expr = oe.contract_expression(*args, **kwargs)
     def expr_wrapped(matrix: xp.ndarray, *args2, **kwargs2):
+        if profiling_enabled():
+            _profile_contraction(args, kwargs["optimize"], matrix, *args2)
         try:
             return expr(matrix, *args2, **kwargs2)
         except MEMORY_ERRORS as e:
@@ -5,6 +5,8 @@ import logging
 import scipy.linalg
 
 from renormalizer.mps.backend import np, backend
+from renormalizer.mps.block_sparse import BlockSparseTensor
+from renormalizer.utils.profiler import profile_flops, profile_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -111,7 +113,7 @@ def svd_qn(
 
     Parameters
     ----------
-    coef_array : np.ndarray
+    coef_array : np.ndarray or renormalizer.mps.block_sparse.BlockSparseTensor
         The coefficient array to be decomposed
     qnbigl : np.ndarray
         Quantum number of the left side (aka the super-L-block quantum number).
@@ -154,7 +156,12 @@ def svd_qn(
         New quantum number for V (super-R-block).
     """
     SVD = not QR
-    coef_matrix = coef_array.reshape((np.prod(qnbigl.shape[:-1]), np.prod(qnbigr.shape[:-1])))
+    matrix_shape = (np.prod(qnbigl.shape[:-1]), np.prod(qnbigr.shape[:-1]))
+    if isinstance(coef_array, BlockSparseTensor):
+        # the blocks are assembled sector by sector without the dense array
+        coef_matrix = None
+    else:
+        coef_matrix = coef_array.reshape(matrix_shape)
 
     assert qntot.ndim == 1
     qn_size = len(qntot)
@@ -180,9 +187,12 @@ def svd_qn(
         if len(rset) == 0:
             continue
         lset = np.where(get_qn_mask(localqnl, nl))[0]
-        block = coef_matrix.ravel().take(
-            (lset * coef_matrix.shape[1]).reshape(-1, 1) + rset
-        )
+        if coef_matrix is None:
+            block = coef_array.fused_matrix(qnbigl.ndim - 1, nl, lset, rset)
+        else:
+            block = coef_matrix.ravel().take(
+                (lset * coef_matrix.shape[1]).reshape(-1, 1) + rset
+            )
         dim = min(block.shape)
         if SVD:
             block_u, block_s, block_vt = optimized_svd(
@@ -202,14 +212,17 @@ def svd_qn(
                 block_u, block_vt = scipy.linalg.qr(block, mode=mode)
             else:
                 assert False
+        # rough FLOP estimates of the dense factorizations
+        profile_flops((4 if SVD else 2) * block.shape[0] * block.shape[1] * dim)
+        profile_bytes(block, block_u, block_vt)
 
         blockappend(
             block_u_list, block_u_list0, qnl_list, qnl_list0, block_su_list0,
-            block_u, nl, dim, lset, coef_matrix.shape[0], full_matrices=full_matrices,
+            block_u, nl, dim, lset, matrix_shape[0], full_matrices=full_matrices,
         )
         blockappend(
             block_v_list, block_v_list0, qnr_list, qnr_list0, block_sv_list0,
-            block_vt.T, nr, dim, rset, coef_matrix.shape[1], full_matrices=full_matrices,
+            block_vt.T, nr, dim, rset, matrix_shape[1], full_matrices=full_matrices,
         )
 
     # sanity check
@@ -288,6 +301,8 @@ def eigh_qn(dm, qnbigl, qnbigr, qntot, system):
             (lset * len(localqn)).reshape(-1, 1) + rset
         )
         block_s2, block_u = scipy.linalg.eigh(block)
+        profile_flops(9 * len(block) ** 3)
+        profile_bytes(block, block_u)
         # numerical error for eigenvalue < 0
         block_s2[block_s2 < 0] = 0
         block_s = np.sqrt(block_s2)
@@ -1,15 +1,19 @@
 # -*- coding: utf-8 -*-
 import logging
+import os
 from collections import namedtuple, OrderedDict, defaultdict
-from typing import List, Set, Tuple, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Set, Tuple, Dict, Iterable, Union
 
 import numpy as np
 import scipy
+import scipy.linalg
 import scipy.sparse
+import scipy.sparse.csgraph
 
 from renormalizer.model import Model
 from renormalizer.model.basis import BasisSet
-from renormalizer.model.op import Op
+from renormalizer.model.op import Op, OpTerms
 from renormalizer.lib import bipartite_vertex_cover
 
 logger = logging.getLogger(__name__)
@@ -18,8 +22,11 @@ logger = logging.getLogger(__name__)
 # for better performance
 OpTuple = namedtuple("OpTuple", ["symbol", "qn", "factor"])
 
+# the default number of worker processes for the decomposition of the operator table
+MPO_PROCESSES = int(os.environ.get("RENO_MPO_PROCESSES", 1))
 
-def construct_symbolic_mpo(table, primary_ops, factor, algo="Hopcroft-Karp"):
+
+def construct_symbolic_mpo(table, primary_ops, factor, algo="Hopcroft-Karp", nproc=None):
     r"""
     A General Compact (Symbolic) MPO Construction Routine
 
@@ -29,6 +36,11 @@ def construct_symbolic_mpo(table, primary_ops, factor, algo="Hopcroft-Karp"):
     factor (np.ndarray): one prefactor vector (dim: operator nterm)
     algo: the algorithm used to select local ops, "Hopcroft-Karp"(default), "Hungarian".
           They are both global optimal and have only minor performance difference.
+    nproc: the number of worker processes. At each site the left and right operators form
+          a bipartite graph, and the minimum vertex covers of its connected components are
+          found independently in the workers, which gives the same MPO as the serial construction.
+          The ``"qr"`` algorithm always runs serially, since the QR of the components
+          would give a different gauge. Default is the environment variable ``RENO_MPO_PROCESSES`` or 1.
 
     Note:
     op with the same op.symbol must have the same op.qn and op.factor
@@ -141,7 +153,13 @@ def construct_symbolic_mpo(table, primary_ops, factor, algo="Hopcroft-Karp"):
 
     in_ops = [[OpTuple([0], qn=np.zeros(qn_size, dtype=int), factor=1)]]
 
-    out_ops_list = _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo)
+    if nproc is None:
+        nproc = MPO_PROCESSES
+    if nproc > 1 and not algo.startswith("qr"):
+        with ProcessPoolExecutor(nproc) as executor:
+            out_ops_list = _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo, executor)
+    else:
+        out_ops_list = _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo)
     # number of sites + 1. Note that the table was expanded for convenience
     assert len(out_ops_list) == len(table[0]) - 1
     mpo = []
@@ -161,16 +179,20 @@ def construct_symbolic_mpo(table, primary_ops, factor, algo="Hopcroft-Karp"):
     return mpo, mpoqn, qntot, qnidx, out_ops_list, primary_ops
 
 
-def _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo="qr"):
+def _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo="qr", executor=None):
     assert len(np.unique(table, axis=0)) == len(table)
     nsite = table.shape[1] - 2
 
     out_ops_list = [in_ops]
+    peak_nbytes = table.nbytes + factor.nbytes
 
     for isite in range(nsite):
         table_row = table[:, :2]
         table_col = table[:, 2:]
-        out_ops, table, factor = _construct_symbolic_mpo_one_site(table_row, table_col, [in_ops], factor, primary_ops, algo)
+        out_ops, table, factor = _construct_symbolic_mpo_one_site(
+            table_row, table_col, [in_ops], factor, primary_ops, algo, executor=executor
+        )
+        peak_nbytes = max(peak_nbytes, table.nbytes + factor.nbytes)
 
         # debug
         # logger.debug(f"in_ops: {in_ops}")
@@ -181,41 +203,71 @@ def _construct_symbolic_mpo(table, in_ops, factor, primary_ops, algo="qr"):
         out_ops_list.append(out_ops)
 
 
+    logger.debug(f"peak memory of the operator table in the decomposition: {peak_nbytes / 2**20:.1f} MiB")
     assert len(factor) == 1 and len(table) == 1
     assert factor[0] == 1
     return out_ops_list
 
 
-def _construct_symbolic_mpo_one_site(table_row, table_col, in_ops_list, factor, primary_ops, algo, k=1):
+def _construct_symbolic_mpo_one_site(table_row, table_col, in_ops_list, factor, primary_ops, algo, k=1, executor=None):
     # split table into the row and col part
     term_row, row_unique_inverse = np.unique(table_row, axis=0, return_inverse=True)
     assert len(in_ops_list) + k == term_row.shape[1]
 
-    # faster version of the following code
+    # faster version of the following code, with the unique rows in the order of the first appearance
     # term_col, col_unique_inverse = np.unique(table_col, axis=0, return_inverse=True)
-    term_col = {}
-    col_unique_inverse = []
-    for row in table_col:
-        row_bytes = row.tobytes()
-        i_and_row = term_col.get(row_bytes)
-        if i_and_row is None:
-            i_and_row = (len(term_col), row)
-            term_col[row_bytes] = i_and_row
-        col_unique_inverse.append(i_and_row[0])
-    term_col = [v[1] for v in term_col.values()]
+    if table_col.shape[1] == 0:
+        # the root of a tree
+        col_unique_inverse = np.zeros(len(table_col), dtype=int)
+        term_col = table_col[:1]
+    else:
+        table_col = np.ascontiguousarray(table_col)
+        col_bytes = table_col.view(np.dtype((np.void, table_col.dtype.itemsize * table_col.shape[1]))).reshape(-1)
+        _, first_idx, col_unique_inverse = np.unique(col_bytes, return_index=True, return_inverse=True)
+        order = np.argsort(first_idx)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        col_unique_inverse = rank[col_unique_inverse.reshape(-1)]
+        term_col = table_col[first_idx[order]]
 
     non_red = scipy.sparse.coo_matrix((np.arange(len(factor)) + 1, (row_unique_inverse, col_unique_inverse))).tocsr()
 
     if not algo.startswith("qr"):
-        return _decompose_graph(term_row, term_col, non_red, in_ops_list, factor, primary_ops, algo, k)
+        return _decompose_graph(term_row, term_col, non_red, in_ops_list, factor, primary_ops, algo, k, executor)
     else:
         return _decompose_qr(term_row, term_col, non_red, in_ops_list, factor, primary_ops, algo, k)
 
 
-
-def _decompose_graph(term_row, term_col, non_red, in_ops_list, factor, primary_ops, algo, k=1):
+def _connected_blocks(non_red):
+    # The connected components of the bipartite graph between the left and right operators.
+    # The operator table is block diagonal with respect to the components,
+    # so each block can be decomposed independently.
+    # Returns the row and column indices of each block.
+    nrow, ncol = non_red.shape
+    adjacency = scipy.sparse.bmat([[None, non_red], [non_red.T, None]])
+    ncomp, labels = scipy.sparse.csgraph.connected_components(adjacency, directed=False)
+    row_label, col_label = labels[:nrow], labels[nrow:]
+    row_order = np.argsort(row_label, kind="stable")
+    col_order = np.argsort(col_label, kind="stable")
+    row_split = np.cumsum(np.bincount(row_label, minlength=ncomp))[:-1]
+    col_split = np.cumsum(np.bincount(col_label, minlength=ncomp))[:-1]
+    return list(zip(np.split(row_order, row_split), np.split(col_order, col_split)))
+
+
+def _map(executor, func, *iterables):
+    if executor is None:
+        return list(map(func, *iterables))
+    return list(executor.map(func, *iterables))
+
+
+def _vertex_cover(non_red, algo, by_row=None):
+    # the minimum vertex cover of the bipartite graph defined by the sparse matrix `non_red`.
+    # The cover of Koenig's theorem does not depend on the maximum matching found,
+    # but on which side (`by_row`) the alternating paths start from
+    if by_row is None:
+        by_row = non_red.shape[0] < non_red.shape[1]
     bigraph = []
-    if non_red.shape[0] < non_red.shape[1]:
+    if by_row:
         for i in range(non_red.shape[0]):
             bigraph.append(non_red.indices[non_red.indptr[i]:non_red.indptr[i + 1]])
         rowbool, colbool = bipartite_vertex_cover(bigraph, algo=algo)
@@ -224,6 +276,25 @@ def _decompose_graph(term_row, term_col, non_red, in_ops_list, factor, primary_o
         for i in range(non_red.shape[1]):
             bigraph.append(non_red_csc.indices[non_red_csc.indptr[i]:non_red_csc.indptr[i + 1]])
         colbool, rowbool = bipartite_vertex_cover(bigraph, algo=algo)
+    return np.asarray(rowbool, dtype=bool), np.asarray(colbool, dtype=bool)
+
+
+def _decompose_graph(term_row, term_col, non_red, in_ops_list, factor, primary_ops, algo, k=1, executor=None):
+    if executor is None:
+        rowbool, colbool = _vertex_cover(non_red, algo)
+    else:
+        # the union of the minimum vertex covers of the components is the minimum vertex cover.
+        # The side is fixed by the whole graph to obtain the same cover as the serial decomposition
+        blocks = _connected_blocks(non_red)
+        logger.debug(f"{len(blocks)} independent blocks in the operator table")
+        sub_graphs = [non_red[rows][:, cols] for rows, cols in blocks]
+        by_row = [non_red.shape[0] < non_red.shape[1]] * len(blocks)
+        covers = _map(executor, _vertex_cover, sub_graphs, [algo] * len(blocks), by_row)
+        rowbool = np.zeros(non_red.shape[0], dtype=bool)
+        colbool = np.zeros(non_red.shape[1], dtype=bool)
+        for (rows, cols), (sub_rowbool, sub_colbool) in zip(blocks, covers):
+            rowbool[rows] = sub_rowbool
+            colbool[cols] = sub_colbool
 
     row_select = np.nonzero(rowbool)[0]
     # largest cover first
@@ -303,16 +374,18 @@ def _decompose_qr(term_row, term_col, non_red, in_ops_list, factor, primary_ops,
 
     The bond dimension is the size of the index $l$, which is truncated based on the rank of $\Gamma$.
 
+    $\Gamma$ is always decomposed as a whole, even if it is block diagonal,
+    because the QR of the blocks gives a different gauge of the MPO.
     """
     assert non_red.shape == (len(term_row), len(term_col))
 
     non_red.data = factor[non_red.data - 1]
-    gamma = non_red.todense()
+    gamma = non_red.toarray()
 
     # gamma[:, p] = q @ r
     if gamma.shape[1] != 1:
         # normal qr
-        q, r, p = scipy.linalg.qr(gamma, mode="economic", pivoting=True)
+        q, r, p = _pivoted_qr(gamma)
     else:
         # move the factor to q
         q = gamma
@@ -326,9 +399,13 @@ def _decompose_qr(term_row, term_col, non_red, in_ops_list, factor, primary_ops,
 
     # use absolute tolerance for q since it's normalized
     atol = 1e-10
+    # the quantum numbers of the rows
+    qn_cache = {}
     for i, j in zip(*np.where(np.abs(q[:, :rank]) > atol)):
         symbol = term_row[i]
-        qn = _compute_qn(in_ops_list, symbol, primary_ops, k)
+        qn = qn_cache.get(i)
+        if qn is None:
+            qn = qn_cache[i] = _compute_qn(in_ops_list, symbol, primary_ops, k)
         out_op = OpTuple(symbol, qn, factor=q[i, j])
         out_ops[j].append(out_op)
 
@@ -343,29 +420,35 @@ def _decompose_qr(term_row, term_col, non_red, in_ops_list, factor, primary_ops,
     # a+b  y  1/2
     # a-b  x  -1/2
     # a-b  y  -1/2
-    new_table = np.concatenate([idx1.reshape(-1, 1), [term_col[i] for i in idx2]], axis=1)
+    col_part = np.array([term_col[i] for i in idx2]).reshape(len(idx2), -1)
+    new_table = np.concatenate([idx1.reshape(-1, 1), col_part], axis=1)
     return out_ops, new_table, new_factor
 
 
+def _pivoted_qr(gamma):
+    return scipy.linalg.qr(gamma, mode="economic", pivoting=True)
+
+
 def _compute_qn(in_ops_list, symbol, primary_ops, k) -> int:
     qn = sum(in_ops[i][0].qn for in_ops, i in zip(in_ops_list, symbol[:-k]))
     qn += sum(primary_ops[i].qn for i in symbol[-k:])
     return qn
 
 
-def _terms_to_table(model: Model, terms: List[Op], const: float):
+def _terms_to_table(model: Model, terms: Union[Iterable[Op], OpTerms], const: float, chunk_size: int = 100000):
     r"""
     constructing a general operator table
     according to model.model and model.order
-    """
 
-    table = []
-    factor_list = []
+    The terms are streamed into ``np.uint16`` tables of ``chunk_size`` rows
+    and the same terms are combined chunk by chunk,
+    so the table is never held as Python lists and ``terms`` could be a generator.
+    :class:`~renormalizer.model.OpTerms` is split chunk by chunk with array operations.
+    """
 
-    primary_ops_eachsite = []
     primary_ops = []
-
-    index = 0
+    # the elementary operators on each site. The key is from `_elementary_keys`
+    primary_ops_eachsite = []
 
     dummy_table_entry = []
     for b in model.basis:
@@ -375,64 +458,161 @@ def _terms_to_table(model: Model, terms: List[Op], const: float):
             dof = b.dof
         op = Op.identity(dof, qn_size=model.qn_size)
 
-        primary_ops_eachsite.append({op:index})
+        key = (op.symbol, tuple(op.dofs), tuple(tuple(qn.tolist()) for qn in op.qn_list))
+        primary_ops_eachsite.append({key: len(primary_ops)})
+        dummy_table_entry.append(len(primary_ops))
         primary_ops.append(op)
-        dummy_table_entry.append(index)
-        index += 1
-
-    for op in terms:
-        elem_ops, factor = op.split_elementary(model.dof_to_siteidx)
-        table_entry = dummy_table_entry.copy()
-        
-        for elem_op in elem_ops:
-            # it is ensured in `elem_op` every symbol is on the same site
-            site_idx = model.dof_to_siteidx[elem_op.dofs[0]]
-            if elem_op not in primary_ops_eachsite[site_idx].keys():
-                primary_ops_eachsite[site_idx][elem_op] = index
-                primary_ops.append(elem_op)
-                index += 1
-            table_entry[site_idx] = primary_ops_eachsite[site_idx][elem_op]
-
-        table.append(table_entry)
-        factor_list.append(factor)
+
+    # use np.uint16 to save memory
+    max_uint16 = np.iinfo(np.uint16).max
+    stream = _TableStream(np.array(dummy_table_entry, dtype=np.uint16), chunk_size)
+
+    def get_index(site_idx, key):
+        index = primary_ops_eachsite[site_idx].get(key)
+        if index is None:
+            index = len(primary_ops)
+            assert index < max_uint16
+            primary_ops_eachsite[site_idx][key] = index
+            symbol, dofs, qn_list = key
+            primary_ops.append(Op(symbol, list(dofs), qn=[np.array(qn) for qn in qn_list]))
+        return index
+
+    if isinstance(terms, OpTerms):
+        # split the terms chunk by chunk with array operations
+        for start in range(0, len(terms), chunk_size):
+            chunk = terms[start:start+chunk_size]
+            term_idx, site_idx, elem_idx, elem_ops = chunk.split_elementary(model.dof_to_siteidx)
+            index_map = np.zeros(len(elem_ops), dtype=np.uint16)
+            for i, op in enumerate(elem_ops):
+                key = (op.symbol, tuple(op.dofs), tuple(tuple(qn.tolist()) for qn in op.qn_list))
+                index_map[i] = get_index(model.dof_to_siteidx[op.dofs[0]], key)
+            block = np.tile(stream.dummy_row, (len(chunk), 1))
+            block[term_idx, site_idx] = index_map[elem_idx]
+            stream.extend(block, chunk.factors)
+    else:
+        for op in terms:
+            table_entry = stream.append(op.factor)
+            for site_idx, key in _elementary_keys(op, model.dof_to_siteidx):
+                table_entry[site_idx] = get_index(site_idx, key)
 
     # const
     if const != 0:
-        table_entry = dummy_table_entry.copy()
-        factor_list.append(const)
-        table.append(table_entry)
-
-    factor = np.array(factor_list)
-    logger.debug(f"# of operator terms: {len(table)}")
-    
-    # use np.uint32, np.uint16 to save memory
-    max_uint16 = np.iinfo(np.uint16).max
-    assert len(primary_ops) < max_uint16
-    
-    table = np.array(table, dtype=np.uint16)
-    logger.debug(f"Input operator terms: {table.shape[0]}")
-    table, factor = _deduplicate_table(table, factor)
+        stream.append(const)
+
+    logger.debug(f"Input operator terms: {stream.nterms}")
+    table, factor = stream.finish()
     logger.debug(f"After combination of the same terms: {table.shape[0]}")
+    logger.debug(f"peak memory of the operator table: {stream.peak_nbytes / 2**20:.1f} MiB")
 
     return table, primary_ops, factor
 
 
+def _elementary_keys(op: Op, dof_to_siteidx):
+    # The light-weight version of `Op.split_elementary`, which is the bottleneck
+    # for a large number of terms. The elementary operators are represented by the hashable keys
+    # (symbol, dofs, qn_list), which are equivalent to `Op.to_tuple` with the factor of 1.
+    # Returns a list of (site index, key) with small site index first.
+    if len(op.dofs) == 1:
+        return [(dof_to_siteidx[op.dofs[0]], (op.symbol, tuple(op.dofs), (tuple(op.qn_list[0].tolist()),)))]
+    grouped = defaultdict(list)
+    for elem_symbol, elem_name, qn in zip(op.split_symbol, op.dofs, op.qn_list):
+        site_idx = dof_to_siteidx.get(elem_name)
+        if site_idx is None:
+            raise ValueError(f"Unknown DoF name {elem_name} in {op}.")
+        # Note that the order of operators on each site is not changed
+        grouped[site_idx].append((elem_symbol, elem_name, tuple(qn.tolist())))
+    keys = []
+    for site_idx in sorted(grouped.keys()):
+        symbols, dofs, qn_list = zip(*grouped[site_idx])
+        keys.append((site_idx, (" ".join(symbols), dofs, qn_list)))
+    return keys
+
+
+class _TableStream:
+    # Accumulate the rows of the operator table into a preallocated np.uint16 buffer.
+    # The same terms in each full buffer are combined and the result is kept as a chunk.
+    # The peak memory of the table (buffer + chunks) is recorded.
+
+    def __init__(self, dummy_row, chunk_size):
+        self.dummy_row = dummy_row
+        self.buffer = np.tile(dummy_row, (chunk_size, 1))
+        self.buffer_factor = []
+        self.tables = []
+        self.factors = []
+        self.nterms = 0
+        self.peak_nbytes = 0
+
+    def append(self, factor):
+        # returns the row to be filled in
+        if len(self.buffer_factor) == len(self.buffer):
+            self._flush()
+        row = self.buffer[len(self.buffer_factor)]
+        self.buffer_factor.append(factor)
+        self.nterms += 1
+        return row
+
+    def extend(self, block, factor):
+        # add a block of filled rows
+        if self.buffer_factor:
+            self._flush()
+        self.nterms += len(block)
+        self.peak_nbytes = max(self.peak_nbytes, self._nbytes() + block.nbytes + factor.nbytes)
+        table, factor = _combine_table(block, factor)
+        self.tables.append(table)
+        self.factors.append(factor)
+
+    def _nbytes(self):
+        nbytes = sum(t.nbytes + f.nbytes for t, f in zip(self.tables, self.factors))
+        if self.buffer is not None:
+            # the python float objects are about 32 bytes each
+            nbytes += self.buffer.nbytes + 32 * len(self.buffer_factor)
+        return nbytes
+
+    def _flush(self):
+        self.peak_nbytes = max(self.peak_nbytes, self._nbytes())
+        n = len(self.buffer_factor)
+        table, factor = _combine_table(self.buffer[:n], np.array(self.buffer_factor))
+        self.tables.append(table)
+        self.factors.append(factor)
+        self.buffer[:n] = self.dummy_row
+        self.buffer_factor = []
+
+    def finish(self):
+        if self.buffer_factor:
+            self._flush()
+        self.buffer = None
+        # the chunks and the concatenated table coexist for a while
+        self.peak_nbytes = max(self.peak_nbytes, 2 * self._nbytes())
+        if len(self.tables) == 1:
+            table, factor = self.tables[0], self.factors[0]
+        else:
+            table, factor = np.concatenate(self.tables), np.concatenate(self.factors)
+        self.tables = self.factors = None
+        return _deduplicate_table(table, factor)
+
+
+def _combine_table(table, factor):
+    # combine the same terms but with different factors(add them together)
+    new_table, unique_inverse = np.unique(table, axis=0, return_inverse=True)
+    unique_inverse = unique_inverse.reshape(-1)
+    new_factor = np.zeros(len(new_table), dtype=np.result_type(factor, np.float64))
+    if len(new_table) == len(table):
+        new_factor[unique_inverse] = factor
+    else:
+        np.add.at(new_factor, unique_inverse, factor)
+    return new_table, new_factor
+
+
 def _deduplicate_table(table, factor):
 
     # check the index of interaction could be represented with np.uint32
     assert table.shape[0] < np.iinfo(np.uint32).max
 
-    # combine the same terms but with different factors(add them together)
-    new_table, unique_inverse = np.unique(table, axis=0, return_inverse=True)
-    # it is efficient to vectorize the operation that moves the rows and cols
-    # and sum them together
-    coord = np.array([[newidx, oldidx] for oldidx, newidx in enumerate(unique_inverse)])
-    mask = scipy.sparse.csr_matrix((np.ones(len(coord)), (coord[:, 0], coord[:, 1])))
-    factor = mask.dot(factor)
+    new_table, factor = _combine_table(table, factor)
 
     # remove zeros
     mask = np.abs(factor) > (np.max(np.abs(factor)) * 1e-15)
-    new_table = np.array(new_table)[mask]
+    new_table = new_table[mask]
     factor = factor[mask]
 
     return new_table, factor
@@ -443,13 +623,14 @@ def _deduplicate_table(table, factor):
 def compose_symbolic_mo(in_ops, out_ops, primary_ops):
     shape = [len(in_ops), len(out_ops)]
     mo = np.full(shape, None, dtype=object)
-    for i, _ in np.ndenumerate(mo):
-        mo[i] = []
+    mo_flat = mo.reshape(-1)
+    for i in range(len(mo_flat)):
+        mo_flat[i] = []
     for iop, out_op in enumerate(out_ops):
         for composed_op in out_op:
             in_idx = composed_op.symbol[0]
             op = primary_ops[composed_op.symbol[1]]
-            mo[in_idx][iop].append(composed_op.factor * op)
+            mo[in_idx, iop].append(composed_op.factor * op)
     return mo
 
 
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from renormalizer.mps import Mps, Mpo
+from renormalizer.mps import block_sparse as bs
+from renormalizer.mps.lib import Environ
+from renormalizer.mps.svd_qn import svd_qn, add_outer, get_qn_mask
+from renormalizer.tests.parameter import holstein_model
+
+
+def random_bst(qns, signs, qntot):
+    shape = [len(qn) for qn in qns]
+    array = np.random.rand(*shape)
+    t = bs.BlockSparseTensor.from_dense(array, qns, signs, qntot, check=False)
+    return t, t.to_dense()
+
+
+def test_from_dense_check():
+    qn = np.array([[0], [1]])
+    array = np.eye(2)
+    t = bs.BlockSparseTensor.from_dense(array, [qn, qn], [1, -1], [0])
+    assert np.allclose(t.to_dense(), array)
+    assert t.size == 2
+    with pytest.raises(ValueError):
+        bs.BlockSparseTensor.from_dense(np.ones((2, 2)), [qn, qn], [1, -1], [0])
+
+
+def test_tensordot():
+    qn1 = np.array([[0], [1], [1], [2], [0]])
+    qn2 = np.array([[0], [1], [0]])
+    qn3 = np.array([[1], [0], [2], [1]])
+    a, a_dense = random_bst([qn1, qn2, qn3], [1, 1, -1], [0])
+    b, b_dense = random_bst([qn3, qn2, qn1], [1, -1, 1], [1])
+    c = bs.tensordot(a, b, ([2, 1], [0, 1]))
+    assert np.allclose(c.to_dense(), np.tensordot(a_dense, b_dense, ([2, 1], [0, 1])))
+    assert np.allclose(c.transpose(1, 0).to_dense(), c.to_dense().T)
+    with pytest.raises(ValueError):
+        bs.tensordot(a, a, ([2], [0]))
+    assert np.allclose(c.unravel(c.ravel()).to_dense(), c.to_dense())
+
+
+def test_environ():
+    mps = Mps.random(holstein_model, 1, 10)
+    mpo = Mpo(holstein_model)
+    mps = mps.evolve(mpo, 10)
+    environ = Environ(mps, mpo)
+    environ_bs = Environ(mps, mpo, block_sparse=True)
+    for key, tensor in environ._virtual_disk.items():
+        tensor_bs = environ_bs._virtual_disk[key]
+        assert np.allclose(tensor_bs.to_dense(), tensor)
+        assert tensor_bs.size <= tensor.size
+
+
+def test_svd_qn():
+    mps = Mps.random(holstein_model, 1, 10)
+    idx = 3
+    mps.ensure_left_canonical()
+    mps.move_qnidx(idx)
+    mps.to_right = True
+    ms = mps[idx].array
+    qnbigl, qnbigr, qnmat = mps._get_big_qn([idx])
+    ms_bs = bs.mp_site_to_block_sparse(mps, idx)
+    res1 = svd_qn(ms, qnbigl, qnbigr, mps.qntot, full_matrices=False)
+    res2 = svd_qn(ms_bs, qnbigl, qnbigr, mps.qntot, full_matrices=False)
+    assert np.allclose(res1[1], res2[1])
+    assert np.allclose(res1[0] * res1[1] @ res1[3].T, res2[0] * res2[1] @ res2[3].T)
@@ -9,7 +9,7 @@ import numpy as np
 
 from renormalizer.model import Model
 from renormalizer.mps.backend import backend
-from renormalizer.mps import Mps, Mpo, MpDm
+from renormalizer.mps import Mps, Mpo, MpDm, MpsEnsemble
 from renormalizer.utils import EvolveMethod, EvolveConfig, CompressConfig, CompressCriteria, Quantity, OFS
 from renormalizer.tests.parameter_exact import qutip_clist, qutip_h, model
 
@@ -146,6 +146,32 @@ def test_tdvp_ps2(init_state, mpo, solver):
     assert max(mps.bond_dims) == 5
 
 
+def test_ensemble():
+    tentative_mpo = Mpo(model)
+    gs = Mps.ground_state(model, False)
+    mps_list = []
+    for i in range(model.n_edofs):
+        mps = Mpo.onsite(model, r"a^\dagger", dof_set={i}) @ gs
+        mps = mps.expand_bond_dimension(hint_mpo=tentative_mpo)
+        mps.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps)
+        mps_list.append(mps)
+    ensemble = MpsEnsemble(mps_list)
+    # the first trajectory is the same as `init_mps`
+    expectations = [ensemble[0].e_occupations]
+    for i in range(round(5 / 0.4)):
+        ensemble = ensemble.evolve(mpo, 0.4)
+        expectations.append(ensemble[0].e_occupations)
+    qutip_end = round(5 / QUTIP_STEP) + 1
+    qutip_interval = round(0.4 / QUTIP_STEP)
+    mcd = np.abs(expectations - qutip_expectations[:qutip_end:qutip_interval]).mean()
+    assert mcd < 1e-4
+    # the same as evolving the MPSs one by one
+    for mps, evolved in zip(mps_list, ensemble):
+        for _ in range(round(5 / 0.4)):
+            mps = mps.evolve(mpo, 0.4)
+        assert np.allclose(mps.e_occupations, evolved.e_occupations)
+
+
 @pytest.mark.parametrize("init_state, mpo", (
         [init_mps, mpo],
         [init_mpdm, mpo],
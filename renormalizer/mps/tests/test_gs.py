@@ -9,6 +9,8 @@ import pytest
 from renormalizer.model import Model, h_qc
 from renormalizer.mps.backend import primme
 from renormalizer.mps.gs import construct_mps_mpo, optimize_mps, DmrgFCISolver
+from renormalizer.mps.environ_storage import DiskStorage
+from renormalizer.mps.hop_expr import hop_expr
 from renormalizer.mps import Mpo, Mps, StackedMpo
 from renormalizer.tests.parameter import holstein_model
 from renormalizer.utils.configs import OFS
@@ -147,6 +149,83 @@ def test_qc(with_ofs, stacked):
     assert np.allclose(gs_e, fci_e, atol=5e-3)
 
 
+def test_qc_ab_initio():
+    spatial_norbs = 6
+    h1e, h2e, nuc = h_qc.read_fcidump(os.path.join(cur_dir, "H6.txt"), spatial_norbs)
+    model = Model(h_qc.qc_basis(2 * spatial_norbs), [])
+    mpo = Mpo.ab_initio(model, h1e, h2e)
+
+    fci_e = -3.23747673055271 - nuc
+
+    nelec = [3, 3]
+    M = 30
+    procedure = [[M, 0.4], [M, 0.2], [M, 0.1], [M, 0], [M, 0], [M, 0], [M, 0]]
+    np.random.seed(2023)
+    mps = Mps.random(model, nelec, M, percent=1.0)
+    hf = Mps.hartree_product_state(model, {i:1 for i in range(sum(nelec))})
+    mps = mps.scale(1e-8)+hf
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.method = "2site"
+    energies, mps = optimize_mps(mps.copy(), mpo)
+    gs_e = min(energies)
+    assert np.allclose(gs_e, fci_e, atol=5e-3)
+
+
+@pytest.mark.parametrize("method", (
+        "1site",
+        "2site",
+))
+def test_block_sparse(method):
+    mps, mpo = construct_mps_mpo(holstein_model, procedure[0][0], nexciton)
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.method = method
+    mps.optimize_config.block_sparse = True
+    energies, mps_opt = optimize_mps(mps.copy(), mpo)
+    assert energies[-1] == pytest.approx(GS_E, rel=1e-5)
+    assert mps_opt.expectation(mpo) == pytest.approx(GS_E, rel=1e-5)
+
+
+@pytest.mark.parametrize("nsite", (1, 2))
+@pytest.mark.parametrize("twolayer", (False, True))
+def test_hop_expr_batch(nsite, twolayer):
+    rng = np.random.default_rng(2023)
+    m, d, mo = 6, 3, 4
+    if twolayer:
+        ltensor = rng.random((m, mo, mo, m))
+        rtensor = rng.random((m, mo, mo, m))
+    else:
+        ltensor = rng.random((m, mo, m))
+        rtensor = rng.random((m, mo, m))
+    cmo = [rng.random((mo, d, d, mo)) for _ in range(nsite)]
+    cshape = (m,) + (d,) * nsite + (m,)
+    expr = hop_expr(ltensor, rtensor, cmo, cshape, twolayer)
+    cstructs = rng.random((3,) + cshape)
+    batch_res = expr(cstructs)
+    for c, res in zip(cstructs, batch_res):
+        np.testing.assert_allclose(res, expr(c))
+
+
+@pytest.mark.parametrize("storage", ("npy", "hdf5"))
+def test_environ_storage(storage, tmpdir, monkeypatch):
+    mps, mpo = construct_mps_mpo(holstein_model, procedure[0][0], nexciton)
+    mps.optimize_config.procedure = procedure
+    mps.optimize_config.environ_storage = storage
+    mps.optimize_config.environ_dir = str(tmpdir)
+    # record the number of prefetched environments in the memory
+    nprefetched = []
+    getitem = DiskStorage.__getitem__
+    def record_getitem(self, key):
+        nprefetched.append(len(self._futures))
+        return getitem(self, key)
+    monkeypatch.setattr(DiskStorage, "__getitem__", record_getitem)
+    energies, mps_opt = optimize_mps(mps.copy(), mpo)
+    assert max(nprefetched) == 1
+    assert energies[-1] == pytest.approx(GS_E, rel=1e-5)
+    assert mps_opt.expectation(mpo) == pytest.approx(GS_E, rel=1e-5)
+    # the files are removed after the optimization
+    assert len(os.listdir(tmpdir)) == 0
+
+
 def test_stackedmpo():
     scheme = 1
     method = '1site'
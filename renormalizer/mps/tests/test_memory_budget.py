@@ -0,0 +1,118 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from renormalizer.mps import Mps, Mpo
+from renormalizer.mps.gs import optimize_mps
+from renormalizer.mps.memory_budget import SweepMemoryModel, allocate_bond_dims, update_memory_bonddim
+from renormalizer.tests.parameter import holstein_model
+from renormalizer.utils import CompressConfig, CompressCriteria, EvolveConfig, EvolveMethod
+
+
+def discarded_weight(weights, bond_dims):
+    return sum(w[m:].sum() for w, m in zip(weights, bond_dims) if w is not None)
+
+
+def test_allocate_bond_dims():
+    nsite = 10
+    model = SweepMemoryModel([2] * nsite, [1] + [5] * (nsite - 1) + [1], 16, nsite=2, nvectors=20)
+    target = np.array([1] + [min(2 ** min(i, nsite - i), 64) for i in range(1, nsite)] + [1])
+    # the spectra decay faster on the left half
+    weights = [None]
+    for i in range(1, nsite):
+        w = np.exp(-(0.1 if i < nsite // 2 else 0.5) * np.arange(target[i]))
+        weights.append(w / w.sum())
+    weights.append(None)
+
+    # no limit
+    assert np.all(allocate_bond_dims(model, np.inf, target, weights) == target)
+
+    budget = model.peak_bytes(target) * 0.5
+    bond_dims = allocate_bond_dims(model, budget, target, weights)
+    assert model.peak_bytes(bond_dims) <= budget
+    assert np.all(bond_dims <= target)
+    assert np.all(1 <= bond_dims)
+    # better than the same maximum bond dimension for all bonds
+    for m in range(target.max(), 0, -1):
+        uniform = np.minimum(target, m)
+        if model.peak_bytes(uniform) <= budget:
+            break
+    assert discarded_weight(weights, bond_dims) < discarded_weight(weights, uniform)
+
+    # the bonds without singular values are not truncated if possible
+    weights[3] = None
+    bond_dims = allocate_bond_dims(model, budget, target, weights)
+    assert model.peak_bytes(bond_dims) <= budget
+    assert bond_dims[3] == target[3]
+
+    # the current bond dimensions are kept if possible
+    floor = np.minimum(target, 4)
+    bond_dims = allocate_bond_dims(model, budget, target, weights, floor=floor)
+    assert model.peak_bytes(bond_dims) <= budget
+    assert np.all(floor <= bond_dims)
+    # the floor is dropped if the budget can not be met with it
+    bond_dims = allocate_bond_dims(model, model.peak_bytes(floor) * 0.9, target, weights, floor=floor)
+    assert model.peak_bytes(bond_dims) <= model.peak_bytes(floor) * 0.9
+
+    # the budget can not be met
+    assert np.all(allocate_bond_dims(model, 1, target, weights) == 1)
+
+
+@pytest.mark.parametrize("memory_limit", ("0.5 MB", 0.5 * 2 ** 20))
+def test_tdvp_ps2(memory_limit):
+    mpo = Mpo(holstein_model)
+    mps = Mpo.onsite(holstein_model, r"a^\dagger", dof_set={0}) @ Mps.ground_state(holstein_model, False)
+    mps.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps2)
+    mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=64)
+    ref = mps.copy()
+    for i in range(4):
+        ref = ref.evolve(mpo, 10)
+
+    mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=64, memory_limit=memory_limit)
+    for i in range(4):
+        mps = mps.evolve(mpo, 10)
+    budget = 0.5 * 2 ** 20
+    assert mps.compress_config.memory_limit == budget
+    # the number of Krylov vectors is at least 3
+    model = SweepMemoryModel.from_mps(mps, mpo, nsite=2, nvectors=3)
+    assert model.peak_bytes(ref.bond_dims) > budget
+    assert model.peak_bytes(mps.bond_dims) <= budget
+    assert np.all(np.array(mps.bond_dims) <= mps.compress_config.memory_max_dims)
+    # the truncation is mild
+    assert mps.e_occupations == pytest.approx(ref.e_occupations, abs=1e-2)
+
+
+def test_dmrg():
+    mpo = Mpo(holstein_model)
+    mps = Mps.random(holstein_model, 1, 10)
+    config = CompressConfig(CompressCriteria.fixed, max_bonddim=40, memory_limit="0.2 MB")
+    mps.optimize_config.procedure = [[config, 0.4], [config, 0.2], [config, 0], [config, 0]]
+    energies, mps_opt = optimize_mps(mps, mpo)
+    model = SweepMemoryModel.from_mps(mps, mpo, nsite=2, nvectors=2 * 12 + 3)
+    assert model.peak_bytes(mps.bond_dims) <= 0.2 * 2 ** 20
+    assert max(mps.bond_dims) < 40
+
+
+def test_dmrg_int_procedure():
+    mpo = Mpo(holstein_model)
+    mps = Mps.random(holstein_model, 1, 10)
+    mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=40, memory_limit="0.2 MB")
+    mps.optimize_config.procedure = [[40, 0.4], [40, 0.2], [40, 0], [40, 0]]
+    spectra = []
+    original = update_memory_bonddim
+
+    def record_spectra(mps, *args, **kwargs):
+        spectra.append(len(mps.compress_config.spectra))
+        return original(mps, *args, **kwargs)
+
+    with patch("renormalizer.mps.gs.update_memory_bonddim", record_spectra):
+        energies, mps_opt = optimize_mps(mps, mpo)
+    # the singular values of the last sweep are used after the first sweep
+    assert spectra[0] == 0
+    assert all(n > 0 for n in spectra[1:])
+    model = SweepMemoryModel.from_mps(mps, mpo, nsite=2, nvectors=2 * 12 + 3)
+    assert model.peak_bytes(mps.bond_dims) <= 0.2 * 2 ** 20
+    assert max(mps.bond_dims) < 40
+    # the original config is restored
+    assert mps_opt.compress_config.memory_limit == 0.2 * 2 ** 20
@@ -8,10 +8,12 @@ import pytest
 from renormalizer.mps import Mps, Mpo, MpDm
 from renormalizer.mps.matrix import tensordot, asnumpy
 from renormalizer.mps.lib import Environ
+from renormalizer.mps.mp import MatrixProduct
 from renormalizer.tests.parameter import custom_model, holstein_model
-from renormalizer.utils import CompressCriteria
+from renormalizer.utils import CompressCriteria, CompressConfig
 
-def test_save_load():
+@pytest.mark.parametrize("fmt", ("npz", "dir"))
+def test_save_load(fmt, tmpdir):
     model = holstein_model
     mps = Mpo.onsite(model, r"a^\dagger", dof_set={0}) @ Mps.ground_state(model, False)
     mpo = Mpo(model)
@@ -19,12 +21,17 @@ def test_save_load():
     for i in range(2):
         mps1 = mps1.evolve(mpo, 10)
     mps2 = mps.evolve(mpo, 10)
-    fname = "test.npz"
-    mps2.dump(fname)
+    fname = os.path.join(tmpdir, "test.npz" if fmt == "npz" else "test")
+    mps2.dump(fname, fmt=fmt)
     mps2 = Mps.load(model, fname)
+    if fmt == "dir":
+        # memory-mapped
+        assert all(isinstance(mt, str) for mt in mps2._mp)
+        mpo_fname = os.path.join(tmpdir, "mpo")
+        mpo.dump(mpo_fname, fmt="dir")
+        assert Mpo.load(model, mpo_fname) == mpo
     mps2 = mps2.evolve(mpo, 10)
     assert np.allclose(mps1.e_occupations, mps2.e_occupations)
-    os.remove(fname)
 
 
 def check_distance(a: Mps, b: Mps):
@@ -161,3 +168,34 @@ def test_variational_compress(comp, mp):
     print(f"var1_mps: {var_mps}, dis: {dis}")
     assert np.allclose(dis, 0.0, atol=1e-4)
     assert np.allclose(var_mps.mp_norm, std_mps.mp_norm, atol=1e-4)
+
+
+@pytest.mark.parametrize("mp", ("mps", "mpdm"))
+def test_variational_compress_convergence(mp, monkeypatch):
+    # the estimated error from the norm of the local solution converges
+    # at the same sweep and to the same accuracy as the exact distance
+    mps = Mps.random(holstein_model, 1, 10)
+    if mp == "mpdm":
+        mps = MpDm.from_mps(mps)
+    mps.canonicalise().normalize("mps_only")
+    mpo = Mpo(holstein_model)
+    std_mps = mpo.apply(mps, canonicalise=True).canonicalise()
+    M = 36
+
+    nsweeps = []
+    switch_direction = MatrixProduct._switch_direction
+    def count_switch_direction(self):
+        nsweeps[-1] += 1
+        return switch_direction(self)
+    monkeypatch.setattr(MatrixProduct, "_switch_direction", count_switch_direction)
+
+    dis = []
+    for vconv in ["distance", "norm"]:
+        nsweeps.append(0)
+        mps.compress_config = CompressConfig(CompressCriteria.fixed, max_bonddim=M, vconv=vconv,
+            vprocedure=[[M, 1.0], [M, 0.2], [M, 0.1]] + [[M, 0]] * 10)
+        var_mps = mps.variational_compress(mpo, guess=None)
+        dis.append(var_mps.distance(std_mps) / std_mps.mp_norm)
+    assert nsweeps[0] == nsweeps[1] < 13
+    assert dis[1] == pytest.approx(dis[0], abs=1e-6)
+    assert dis[1] < 1e-4
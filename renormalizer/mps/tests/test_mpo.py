@@ -8,9 +8,11 @@ import pickle
 import numpy as np
 import pytest
 
-from renormalizer.model import Mol, Phonon, HolsteinModel, Model, Op
+from renormalizer.model import Mol, Phonon, HolsteinModel, Model, Op, OpTerms, h_qc
 from renormalizer.model.basis import BasisHalfSpin
 from renormalizer.mps import Mpo, Mps
+from renormalizer.mps import mpo as mpo_module
+from renormalizer.mps.symbolic_mpo import _terms_to_table
 from renormalizer.mps.tests import cur_dir
 from renormalizer.tests.parameter import holstein_model
 from renormalizer.utils import Quantity
@@ -41,6 +43,92 @@ def test_symbolic_mpo(nsites, nterms, algo):
     assert np.allclose(dense_mpo, qutip_ham.data.todense())
 
 
+@pytest.mark.parametrize("algo", ["Hopcroft-Karp", "qr"])
+def test_symbolic_mpo_parallel(algo):
+    spatial_norbs = 6
+    h1e, h2e, nuc = h_qc.read_fcidump(os.path.join(cur_dir, "H6.txt"), spatial_norbs)
+    basis, ham_terms = h_qc.qc_model(h1e, h2e)
+    model = Model(basis, ham_terms)
+
+    # streamed in small chunks
+    table, primary_ops, factor = _terms_to_table(model, ham_terms, 0)
+    table2, primary_ops2, factor2 = _terms_to_table(model, iter(ham_terms), 0, chunk_size=7)
+    assert np.all(table == table2)
+    assert np.allclose(factor, factor2)
+    assert primary_ops == primary_ops2
+
+    mpo = Mpo(model, algo=algo)
+    mpo2 = Mpo(model, algo=algo, nproc=2)
+    # the process count does not change the MPO
+    assert mpo.bond_dims == mpo2.bond_dims
+    for mo, mo2 in zip(mpo, mpo2):
+        assert np.array_equal(mo.array, mo2.array)
+    np.random.seed(2023)
+    mps = Mps.random(model, [3, 3], 10)
+    assert np.allclose(mps.expectation(mpo), mps.expectation(mpo2))
+
+
+def test_op_terms():
+    spatial_norbs = 6
+    h1e, h2e, nuc = h_qc.read_fcidump(os.path.join(cur_dir, "H6.txt"), spatial_norbs)
+    basis, ham_terms = h_qc.qc_model(h1e, h2e)
+    # some terms with zero factor to be discarded
+    ham_terms = ham_terms + [ham_terms[0] * 0]
+    op_terms = OpTerms.from_ops(ham_terms)
+    assert list(op_terms) == ham_terms
+    assert list(op_terms[5:20]) == ham_terms[5:20]
+    assert op_terms[-1] == ham_terms[-1]
+
+    model = Model(basis, ham_terms)
+    model2 = Model(basis, op_terms)
+    assert isinstance(model2.ham_terms, OpTerms)
+    assert list(model2.ham_terms) == model.ham_terms
+
+    # the same table in small chunks
+    table, primary_ops, factor = _terms_to_table(model, model.ham_terms, 0)
+    table2, primary_ops2, factor2 = _terms_to_table(model2, model2.ham_terms, 0, chunk_size=100)
+    assert np.all(table == table2)
+    assert np.allclose(factor, factor2)
+    assert primary_ops == primary_ops2
+
+    mpo = Mpo(model)
+    mpo2 = Mpo(model2)
+    assert mpo.bond_dims == mpo2.bond_dims
+    np.random.seed(2023)
+    mps = Mps.random(model, [3, 3], 10)
+    assert np.allclose(mps.expectation(mpo), mps.expectation(mpo2))
+
+    with pytest.raises(ValueError):
+        Model(basis[:-1], op_terms)
+
+
+@pytest.mark.parametrize("sparse", (False, True))
+def test_ab_initio(sparse):
+    spatial_norbs = 4
+    rng = np.random.default_rng(0)
+    h1e = rng.random((spatial_norbs, spatial_norbs))
+    eri = rng.random((spatial_norbs,) * 4)
+    sh, aseri = h_qc.int_to_h(h1e, eri, sparse=sparse)
+    basis, ham_terms = h_qc.qc_model(sh, aseri)
+    model = Model(basis, ham_terms)
+    offset = Quantity(0.5)
+    mpo = Mpo.ab_initio(model, sh, aseri, offset=offset)
+    std_mpo = Mpo(model, offset=offset)
+    assert np.allclose(mpo.todense(), std_mpo.todense())
+    # not larger than the general construction on any bond
+    assert np.all(np.array(mpo.bond_dims) <= np.array(std_mpo.bond_dims))
+    for qn, mo in zip(mpo.qn[1:], mpo):
+        assert len(qn) == mo.shape[-1]
+
+    # general 2-e integrals without any symmetry
+    eri = rng.random((2 * spatial_norbs,) * 4) * (rng.random((2 * spatial_norbs,) * 4) < 0.3)
+    model = Model(basis, h_qc.qc_model(sh, eri)[1])
+    mpo = Mpo.ab_initio(model, sh, eri)
+    std_mpo = Mpo(model)
+    assert np.allclose(mpo.todense(), std_mpo.todense())
+    assert np.all(np.array(mpo.bond_dims) <= np.array(std_mpo.bond_dims))
+
+
 @pytest.mark.parametrize("algo", ["qr", "Hopcroft-Karp"])
 def test_swap_symbolic_mpo(algo):
     if algo == "qr":
@@ -102,6 +190,44 @@ def test_offset(scheme):
     assert np.allclose(evals1 - offset.as_au(), evals2)
 
 
+def test_cache(tmp_path, monkeypatch):
+    mpo1 = Mpo(holstein_model, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+
+    # loaded from the cache without the construction
+    def fail(*args, **kwargs):
+        raise AssertionError("the MPO is constructed again")
+    monkeypatch.setattr(mpo_module, "_terms_to_table", fail)
+    mpo2 = Mpo(holstein_model, cache_dir=str(tmp_path))
+    assert mpo2.dtype == mpo1.dtype
+    assert mpo2.bond_dims == mpo1.bond_dims
+    for mt1, mt2 in zip(mpo1, mpo2):
+        assert np.allclose(mt1, mt2)
+    for qn1, qn2 in zip(mpo1.qn, mpo2.qn):
+        assert np.all(qn1 == qn2)
+    assert np.all(mpo2.qntot == mpo1.qntot) and mpo2.qnidx == mpo1.qnidx
+    mps = Mps.random(holstein_model, 1, 5)
+    assert np.allclose(mps.expectation(mpo1), mps.expectation(mpo2))
+    monkeypatch.undo()
+
+    # different offset and algorithm
+    mpo3 = Mpo(holstein_model, offset=Quantity(0.1), cache_dir=str(tmp_path))
+    mpo4 = Mpo(holstein_model, algo="Hopcroft-Karp", cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 3
+    assert np.allclose(mps.expectation(mpo3), mps.expectation(mpo1) - 0.1)
+    assert np.allclose(mps.expectation(mpo4), mps.expectation(mpo1))
+
+    # the MPOs cached by the parallel construction are the same as the serial ones
+    for algo in ["qr", "Hopcroft-Karp"]:
+        cache_dir = tmp_path / f"parallel-{algo}"
+        Mpo(holstein_model, algo=algo, nproc=2, cache_dir=str(cache_dir))
+        mpo5 = Mpo(holstein_model, algo=algo, cache_dir=str(cache_dir))
+        assert len(os.listdir(cache_dir)) == 1
+        mpo6 = Mpo(holstein_model, algo=algo, cache_dir=False)
+        for mt5, mt6 in zip(mpo5, mpo6):
+            assert np.array_equal(mt5.array, mt6.array)
+
+
 def test_identity():
     identity = Mpo.identity(holstein_model)
     mps = Mps.random(holstein_model, qntot=1, m_max=5)
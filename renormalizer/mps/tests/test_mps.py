@@ -6,7 +6,7 @@ import pytest
 from renormalizer.model import Model
 from renormalizer.model.basis import BasisSHO, BasisMultiElectronVac, BasisMultiElectron, BasisSimpleElectron
 from renormalizer.model.op import Op
-from renormalizer.mps import Mps, Mpo
+from renormalizer.mps import Mps, Mpo, MpDm
 from renormalizer.tests import parameter
 
 
@@ -42,6 +42,26 @@ def test_expectations(mpos):
 
     assert np.allclose(e1, e2)
 
+    # parallel and batched contraction
+    e3 = random.expectations(mpos, random2, nthreads=2)
+    e4 = random.expectations(mpos, random2, batch=True)
+    assert np.allclose(e1, e3)
+    assert np.allclose(e1, e4)
+
+
+def test_local_expectations():
+    model = parameter.holstein_model
+    e_dofs, v_dofs = model.e_dofs, model.v_dofs
+    ops = [Op("n", dof) for dof in v_dofs] + [Op(r"a^\dagger a", dof) for dof in e_dofs]
+    # nearest neighbour
+    ops += [Op(r"a^\dagger a x", [e_dofs[0], e_dofs[0], v_dofs[0]], 0.3), Op("x a", [v_dofs[1], e_dofs[1]])]
+    for mp in [Mps.random(model, 1, 20), MpDm.max_entangled_ex(model)]:
+        e1 = mp.calc_local_expectations(ops)
+        e2 = mp.expectations([Mpo(model, op) for op in ops])
+        assert np.allclose(e1, e2)
+    with pytest.raises(ValueError):
+        mp.calc_local_expectations([Op(r"a^\dagger a", [e_dofs[0], e_dofs[1]])])
+
 
 def check_reduced_density_matrix(basis):
     model = Model(basis, [])
@@ -86,6 +106,35 @@ def test_site_entropy():
             (entropy_1site[0]+entropy_1site[1]-entropy_2site[(0,1)])/2)
 
 
+@pytest.mark.parametrize("nthreads", (1, 2))
+def test_2site_rdm(nthreads):
+    model = Model([BasisSHO(i, 1, 3) for i in range(5)], [])
+    mps = Mps.random(model, 0, 10)
+    mps.canonicalise().normalize("mps_only")
+    wfn = mps.todense().reshape([3] * 5)
+
+    rdm = mps.calc_2site_rdm(nthreads=nthreads)
+    assert len(rdm) == 10
+    for i, j in [(0, 1), (1, 3), (0, 4)]:
+        std = np.einsum(f"{'abcde'[:i]}p{'abcde'[i+1:j]}r{'abcde'[j+1:]}, "
+                        f"{'abcde'[:i]}q{'abcde'[i+1:j]}s{'abcde'[j+1:]} -> prqs",
+                        wfn.conj(), wfn).reshape(9, 9)
+        assert np.allclose(rdm[(i, j)], std)
+
+    # selected pairs, including the reversed order
+    selected = mps.calc_2site_rdm([(3, 1), (0, 4), (2, 3)], max_distance=2, lazy=True, nthreads=nthreads)
+    assert not isinstance(selected, dict)
+    selected = dict(selected)
+    assert list(selected.keys()) == [(3, 1), (2, 3)]
+    assert np.allclose(selected[(2, 3)], rdm[(2, 3)])
+    std = rdm[(1, 3)].reshape(3, 3, 3, 3).transpose(1, 0, 3, 2).reshape(9, 9)
+    assert np.allclose(selected[(3, 1)], std)
+
+    mutual = mps.calc_2site_mutual_entropy(max_distance=1)
+    assert mutual[0, 2] == 0
+    assert np.allclose(mutual, mutual.T)
+
+
 def test_load_from_dense_wfn():
     model = Model(basis=[BasisSimpleElectron(i) for i in range(5)], ham_terms=[])
     ref_mps = Mps.random(model, 1, 20)
@@ -1,7 +1,8 @@
+import os
 from unittest.mock import patch
 import pytest
 
-from renormalizer.mps.oe_contract_wrap import oe_contract, oe_contract_expression
+from renormalizer.mps.oe_contract_wrap import oe_contract, oe_contract_expression, path_cache
 from renormalizer.mps.backend import np, MEMORY_ERRORS
 
 
@@ -42,3 +43,35 @@ def test_oe_contract_expression():
             "Expected message not found in logger.fatal calls"
         )
 
+
+
+def test_path_cache(tmpdir):
+    path_cache.clear()
+    a = np.random.rand(3, 4)
+    b = np.random.rand(4, 5)
+    c = np.random.rand(5, 3)
+    res1 = oe_contract("ab, bc, ca -> a", a, b, c)
+    assert path_cache.misses == 1 and path_cache.hits == 0
+    res2 = oe_contract("ab, bc, ca -> a", a, b, c)
+    assert path_cache.hits == 1
+    assert np.allclose(res1, res2)
+    assert np.allclose(res1, np.einsum("ab, bc, ca -> a", a, b, c))
+
+    expr = oe_contract_expression("ab, bc, ca -> a", a, b, c.shape, constants=[0, 1])
+    assert np.allclose(expr(c), res1)
+    assert len(path_cache) == 2
+
+    fname = os.path.join(tmpdir, "path_cache.pickle")
+    path_cache.dump(fname)
+    path_cache.clear()
+    path_cache.load(fname)
+    assert len(path_cache) == 2
+    oe_contract("ab, bc, ca -> a", a, b, c)
+    assert path_cache.hits == 1
+
+    # LRU eviction
+    maxsize = path_cache.maxsize
+    path_cache.maxsize = 1
+    oe_contract("ab, bc -> ac", a, b)
+    assert len(path_cache) == 1
+    path_cache.maxsize = maxsize
@@ -133,6 +133,14 @@ class ThermalProp(TdMpsJob):
     def vn_entropy_array(self):
         return np.array(self._vn_entropy_array)
 
+    dump_series_keys = (
+        "time series",
+        "energies",
+        "electron occupations array",
+        "phonon occupations array",
+        "vn entropy array",
+    )
+
     def get_dump_dict(self):
         dump_dict = dict()
         dump_dict["time series"] = [-t.imag for t in self.evolve_times]
@@ -154,7 +162,8 @@ def load_thermal_state(model, path: str):
 
     Args:
         model (:class:`MolList`): system information
-        path (str): the path to load thermal state from. Should be an numpy ``.npz`` file.
+        path (str): the path to load thermal state from. Should be an numpy ``.npz`` file
+            or a directory dumped with ``fmt="dir"``, which is memory-mapped.
     Returns: Loaded MpDm
     """
     try:
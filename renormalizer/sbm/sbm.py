@@ -82,6 +82,8 @@ class SpinBosonDynamics(TdMpsJob):
     def evolve_single_step(self, evolve_dt):
         return self.latest_mps.evolve(self.h_mpo, evolve_dt)
 
+    dump_series_keys = ("time series", "sigma_x", "sigma_z", "rho", "bond_entropy")
+
     def get_dump_dict(self):
         dump_dict = dict()
         dump_dict["time series"] = self.evolve_times
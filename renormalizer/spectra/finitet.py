@@ -106,6 +106,8 @@ class SpectraFiniteT(SpectraTdMpsJobBase):
         assert self._defined_output_path
         return os.path.join(self.dump_dir, self.job_name + "_impo.npz")
 
+    dump_series_keys = ("time series", "autocorr")
+
     def get_dump_dict(self):
         dump_dict = dict()
         dump_dict['temperature'] = self.temperature.as_au()
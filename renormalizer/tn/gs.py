@@ -71,12 +71,14 @@ def optimize_2site(snode: TreeNodeTensor, ttns: TTNS, ttno: TTNO, ttne: TTNEnvir
 
     assert ttns.optimize_config.nroots == 1
     algo: str = ttns.optimize_config.algo
-    e, c = eigh_iterative(hop, hdiag, cguess, algo)
+    e, c = eigh_iterative(hop, hdiag, cguess, algo,
+                          max_memory=ttns.optimize_config.davidson_max_memory,
+                          scratch_dir=ttns.optimize_config.davidson_scratch_dir)
     c = vec2tensor(c, qn_mask)
     return e, c
 
 
-def eigh_iterative(hop, hdiag, cguess, algo):
+def eigh_iterative(hop, hdiag, cguess, algo, max_memory=64000, scratch_dir=None):
     hdiag = asnumpy(hdiag)
     cguess = asnumpy(cguess)
     h_dim = len(hdiag)
@@ -84,7 +86,8 @@ def eigh_iterative(hop, hdiag, cguess, algo):
     if algo == "davidson":
         precond = lambda x, e, *args: x / (hdiag - e + 1e-4)
 
-        e, c = davidson(hop, cguess, precond, max_cycle=100, nroots=1, max_memory=64000, verbose=0)
+        e, c = davidson(hop, cguess, precond, max_cycle=100, nroots=1, max_memory=max_memory,
+                        verbose=0, scratch_dir=scratch_dir)
     elif algo == "primme":
         if primme is None:
             logger.error("can not import primme")
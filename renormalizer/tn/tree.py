@@ -13,6 +13,7 @@ from renormalizer.mps.mps import normalize
 from renormalizer.mps.oe_contract_wrap import oe_contract
 from renormalizer.utils.configs import CompressConfig, OptimizeConfig, EvolveConfig, EvolveMethod
 from renormalizer.utils import calc_vn_entropy, calc_vn_entropy_dm
+from renormalizer.utils.profiler import profile_phase
 from renormalizer.tn.node import TreeNodeTensor, TreeNodeBasis, copy_connection, TreeNodeEnviron
 from renormalizer.tn.treebase import Tree, BasisTree, print_as_tree
 from renormalizer.tn.symbolic_ttno import construct_symbolic_ttno, symbolic_mo_to_numeric_mo_general
@@ -1621,7 +1622,8 @@ class TTNEnviron(Tree):
         # indices for the resulting tensor
         indices = self.get_parent_indices(enode, ttns, ttno)
         args.append(indices)
-        res = oe_contract(*asxp_oe_args(args))
+        with profile_phase("environ", site=ttns.node_idx[snode]):
+            res = oe_contract(*asxp_oe_args(args))
         if len(enode.parent.environ_children) != len(enode.parent.children):
             # first run
             enode.parent.environ_children.append(asnumpy(res))
@@ -1659,7 +1661,8 @@ class TTNEnviron(Tree):
         indices = self.get_child_indices(enode, ichild, ttns, ttno)
 
         args.append(indices)
-        res = oe_contract(*asxp_oe_args(args))
+        with profile_phase("environ", site=ttns.node_idx[snode]):
+            res = oe_contract(*asxp_oe_args(args))
         enode.children[ichild].environ_parent = asnumpy(res)
 
     def get_child_indices(self, enode, i, ttns, ttno):
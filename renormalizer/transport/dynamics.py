@@ -247,6 +247,19 @@ class ChargeDiffusionDynamics(TdMpsJob):
         # electron has moved to the edge
         return self.stop_at_edge and EDGE_THRESHOLD < self.e_occupations_array[-1][0]
 
+    dump_series_keys = (
+        "r square array",
+        "electron occupations array",
+        "phonon occupations array",
+        "k occupations array",
+        "eph entropy",
+        "bond entropy",
+        "coherent length array",
+        "reduced density matrices",
+        "time series",
+        "total time",
+    )
+
     def get_dump_dict(self):
         dump_dict = OrderedDict()
         dump_dict["mol list"] = self.model.to_dict()
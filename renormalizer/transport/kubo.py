@@ -342,6 +342,13 @@ class TransportKubo(TdMpsJob):
         """
         return np.array(self._auto_corr_deomposition)
 
+    @property
+    def dump_series_keys(self):
+        keys = ["time series", "auto correlation", "auto correlation decomposition", "mobility"]
+        if self.properties is not None:
+            keys.extend(self.properties.prop_res.keys())
+        return keys
+
     def get_dump_dict(self):
         dump_dict = dict()
         dump_dict["mol list"] = self.model.to_dict()
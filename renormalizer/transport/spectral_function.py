@@ -121,6 +121,8 @@ class SpectralFunctionZT(TdMpsJob):
         latest_ket_mpdm = prev_ket_mpdm.evolve(self.h_mpo, evolve_dt)
         return (prev_bra_mpdm, latest_ket_mpdm)
 
+    dump_series_keys = ("time series", "G array", "Gk array", "electron occupations array")
+
     def get_dump_dict(self):
         dump_dict = dict()
         dump_dict['temperature'] = self.temperature.as_au()
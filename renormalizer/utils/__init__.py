@@ -15,4 +15,5 @@ from renormalizer.utils.configs import (
 )
 
 from renormalizer.utils.tdmps import TdMpsJob
+from renormalizer.utils.profiler import SweepProfiler
 
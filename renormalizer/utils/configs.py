@@ -89,6 +89,12 @@ class CompressConfig:
     vrtol : float, optional
         The threshold of convergence in variational compression. Default is
         :math:`10^{-5}`.
+    vconv : str, optional
+        How the relative error between two sweeps in variational compression is computed.
+
+        - ``norm``: estimated from the change of the norm of the last local solution,
+          which avoids the copy and the overlaps of the whole MPS. The default.
+        - ``distance``: the exact distance between the MPSs of the two sweeps.
     vguess_m : tuple(int), optional
         The bond dimension of ``compressed_mpo`` and ``compressed_mps`` to construct the initial guess
         ``compressed_mpo @ compressed_mps`` in `MatrixProduct.variational_compress`.
@@ -117,6 +123,18 @@ class CompressConfig:
         for and only for ab initio Hamiltonian constructed by the experimental
         ``renormalizer.model.h_qc.qc_model``. Default is ``False``.
 
+    memory_limit : float or str, optional
+        The memory budget of the sweeps in bytes, or a string such as ``"16 GB"``.
+        Before each sweep of the two-site TDVP and DMRG algorithms, the peak memory of the sweep
+        is projected from the bond dimensions, the MPO and the number of Krylov vectors.
+        If the projection exceeds the budget, the bond dimensions are further limited
+        on top of ``criteria``, using the singular values recorded in the last sweep
+        to distribute the truncation error.
+        In DMRG, the integer entries of ``OptimizeConfig.procedure`` inherit the limit of
+        the ``compress_config`` of the input MPS, while the ``CompressConfig`` entries use their own limits.
+        The singular values are carried over from the config of the last sweep.
+        See `renormalizer.mps.memory_budget` for details. The default is ``None``, which means no limit.
+
     See Also
     --------
     CompressCriteria : Compression criteria
@@ -132,11 +150,13 @@ class CompressConfig:
         vmethod: str = "2site",
         vprocedure = None,
         vrtol = 1e-5,
+        vconv: str = "norm",
         vguess_m = (5,5),
         dump_matrix_size = np.inf,
         dump_matrix_dir = "./",
         ofs: OFS = None,
-        ofs_swap_jw: bool = False
+        ofs_swap_jw: bool = False,
+        memory_limit = None,
     ):
         # two sets of criteria here: threshold and max_bonddimension
         # `criteria` is to determine which to use
@@ -161,6 +181,9 @@ class CompressConfig:
                               [max_bonddim,0.1]] + [[max_bonddim,0],]*10
         self.vprocedure = vprocedure
         self.vrtol = vrtol
+        if vconv not in ["norm", "distance"]:
+            raise ValueError(f"Unknown vconv: {vconv}")
+        self.vconv = vconv
         self.vguess_m = vguess_m
 
         self.dump_matrix_size = dump_matrix_size
@@ -169,6 +192,13 @@ class CompressConfig:
         self.ofs: OFS = ofs
         self.ofs_swap_jw: bool = ofs_swap_jw
 
+        # the memory budget in bytes
+        self.memory_limit: float = parse_memory_limit(memory_limit)
+        # the bond dimensions limited by the memory budget. Same layout as `max_dims`
+        self.memory_max_dims: np.ndarray = None
+        # the singular values of the last truncation on each bond, recorded if `memory_limit` is set
+        self.spectra = {}
+
     @property
     def threshold(self):
         return self._threshold
@@ -200,6 +230,16 @@ class CompressConfig:
         return min(self.max_dims[bond_idx], len(sigma))
 
     def compute_m_trunc(self, sigma: np.ndarray, idx: int, left: bool) -> int:
+        trunc = self.criteria_m_trunc(sigma, idx, left)
+        if self.memory_limit != np.inf:
+            bond_idx = idx + 1 if left else idx
+            self.spectra[bond_idx] = sigma
+            if self.memory_max_dims is not None:
+                trunc = min(trunc, self.memory_max_dims[bond_idx])
+        return trunc
+
+    def criteria_m_trunc(self, sigma: np.ndarray, idx: int, left: bool) -> int:
+        # the truncation without the memory budget
         if self.criteria is CompressCriteria.threshold:
             trunc = self._threshold_m_trunc(sigma)
         elif self.criteria is CompressCriteria.fixed:
@@ -244,6 +284,7 @@ class CompressConfig:
         # deep copies
         if self.max_dims is not None:
             new.max_dims = self.max_dims.copy()
+        new.spectra = self.spectra.copy()
         return new
 
     @property
@@ -287,6 +328,18 @@ class OptimizeConfig:
         # inverse = 1.0 or -1.0
         # -1.0 to get the largest eigenvalue
         self.inverse = 1.0
+        # store the environments and carry out the H*C contractions in the
+        # U(1) block-sparse format in `renormalizer.mps.block_sparse`
+        self.block_sparse = False
+        # the storage of the environments: "memory", "npy" (memory-mapped files)
+        # or "hdf5". The files are put in `environ_dir`, or the system temporary directory if None
+        self.environ_storage = "memory"
+        self.environ_dir = None
+        # the memory budget (in MB) for the trial vectors of the Davidson solver.
+        # The vectors beyond the budget are spilled to `davidson_scratch_dir`,
+        # or the system temporary directory if None
+        self.davidson_max_memory = 64000
+        self.davidson_scratch_dir = None
 
     def copy(self):
         new = self.__class__.__new__(self.__class__)
@@ -374,6 +427,9 @@ class EvolveConfig:
         # the EOM has already considered the non-orthogonality of the left and right
         # renormalized basis, see arXiv:1907.12044
         self.force_ovlp: bool = force_ovlp
+        # the storage of the environments in tdvp_ps. See `OptimizeConfig`
+        self.environ_storage: str = "memory"
+        self.environ_dir: str = None
         # auto switch between mu_vmf and vmf for a higher efficiency
         self.vmf_auto_switch: bool = True
 
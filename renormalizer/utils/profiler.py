@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in profiling of the sweep algorithms.
+
+The sweeps (DMRG, TDVP, variational compression and the tree tensor network counterparts)
+mark their phases with :func:`profile_phase`, for example::
+
+    with profile_phase("eigensolver", site=cidx):
+        ...
+
+When no :class:`SweepProfiler` is active, :func:`profile_phase` returns a shared no-op context
+and :func:`profile_count`, :func:`profile_flops` and :func:`profile_bytes` return immediately,
+so the instrumentation costs a function call and a global lookup.
+Within the profiler each phase records its wall time, counters, the estimated number of
+floating point operations (FLOPs) of the tensor contractions and the peak number of bytes
+of the tensors involved. The FLOPs and the bytes are attributed to the innermost open phase.
+
+Example::
+
+    with SweepProfiler() as profiler:
+        optimize_mps(mps, mpo)
+    print(profiler.summary())
+    profiler.dump_chrome_trace("trace.json")
+
+The Chrome-trace file can be loaded into ``chrome://tracing`` or https://ui.perfetto.dev.
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+
+
+# the active profiler. ``None`` if profiling is disabled
+_active = None
+
+
+class _PhaseRecord:
+    __slots__ = ["name", "site", "start", "duration", "flops", "peak_bytes", "counters", "depth"]
+
+    def __init__(self, name, site, start, depth):
+        self.name = name
+        self.site = site
+        self.start = start
+        self.duration = 0.
+        self.flops = 0
+        self.peak_bytes = 0
+        self.counters = {}
+        self.depth = depth
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "site": self.site,
+            "start": self.start,
+            "duration": self.duration,
+            "flops": self.flops,
+            "peak_bytes": self.peak_bytes,
+            "counters": self.counters,
+            "depth": self.depth,
+        }
+
+
+class _Phase:
+    # context manager of an open phase of the active profiler
+    __slots__ = ["profiler", "record"]
+
+    def __init__(self, profiler, name, site):
+        self.profiler = profiler
+        self.record = _PhaseRecord(name, _normalize_site(site), 0., len(profiler._stack))
+
+    def __enter__(self):
+        self.profiler._stack.append(self.record)
+        self.record.start = time.perf_counter() - self.profiler._t0
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        record = self.record
+        record.duration = time.perf_counter() - self.profiler._t0 - record.start
+        stack = self.profiler._stack
+        assert stack[-1] is record
+        stack.pop()
+        if stack:
+            # the enclosing phase includes the cost of this phase
+            parent = stack[-1]
+            parent.flops += record.flops
+            parent.peak_bytes = max(parent.peak_bytes, record.peak_bytes)
+        self.profiler.records.append(record)
+        return False
+
+
+class _NullPhase:
+    # the phase when profiling is disabled
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def _normalize_site(site):
+    # list of sites in the two-site algorithms -> tuple, so that it can be used as a key
+    if site is None or isinstance(site, int):
+        return site
+    if isinstance(site, (list, tuple)):
+        site = tuple(int(s) for s in site)
+        return site[0] if len(site) == 1 else site
+    return int(site)
+
+
+def _nbytes(obj):
+    if obj is None:
+        return 0
+    if isinstance(obj, int):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return sum(_nbytes(o) for o in obj)
+    return int(getattr(obj, "nbytes", 0))
+
+
+class SweepProfiler:
+    """
+    Collect per-phase counters, wall times, FLOP estimates and peak bytes of the sweeps.
+
+    The profiler is enabled within the ``with`` block. Nested profilers are allowed
+    and only the innermost one is active.
+
+    Attributes
+    ----------
+    records : list
+        The closed phases in the order of completion.
+    counters : dict
+        The counters accumulated over all phases, such as the number of
+        :math:`H|c\\rangle` products and the bytes transferred between the host and the device.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.counters = defaultdict(int)
+        self._stack = []
+        self._previous = None
+        self._t0 = None
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        if self._t0 is None:
+            self._t0 = time.perf_counter()
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global _active
+        _active = self._previous
+        self._previous = None
+        return False
+
+    def summary(self):
+        """
+        Aggregate the phases by name and site.
+
+        Returns
+        -------
+        summary : dict
+            ``{name: {site: {"count", "time", "flops", "peak_bytes", "counters"}}}``.
+            The phases without site are aggregated with the key ``None``.
+        """
+        res = {}
+        for record in self.records:
+            item = res.setdefault(record.name, {}).setdefault(record.site, {
+                "count": 0, "time": 0., "flops": 0, "peak_bytes": 0, "counters": defaultdict(int)
+            })
+            item["count"] += 1
+            item["time"] += record.duration
+            item["flops"] += record.flops
+            item["peak_bytes"] = max(item["peak_bytes"], record.peak_bytes)
+            for k, v in record.counters.items():
+                item["counters"][k] += v
+        for sites in res.values():
+            for item in sites.values():
+                item["counters"] = dict(item["counters"])
+        return res
+
+    def to_dict(self):
+        """
+        All data of the profiler as a dict of JSON serializable objects.
+        """
+        summary = []
+        for name, sites in self.summary().items():
+            for site, item in sites.items():
+                summary.append(dict(name=name, site=site, **item))
+        return {
+            "summary": summary,
+            "counters": dict(self.counters),
+            "phases": [record.to_dict() for record in self.records],
+        }
+
+    def dump_json(self, fname):
+        """
+        Dump :meth:`to_dict` to a JSON file.
+        """
+        with open(fname, "w") as fout:
+            json.dump(self.to_dict(), fout, indent=1)
+
+    def dump_chrome_trace(self, fname):
+        """
+        Dump the phases to a JSON file in the Chrome trace event format.
+        The nested phases are shown as stacked slices.
+        """
+        events = []
+        pid = os.getpid()
+        for record in sorted(self.records, key=lambda r: (r.start, r.depth)):
+            args = {"site": record.site, "flops": record.flops, "peak_bytes": record.peak_bytes}
+            args.update(record.counters)
+            events.append({
+                "name": record.name,
+                "cat": "sweep",
+                "ph": "X",
+                # in microseconds
+                "ts": record.start * 1e6,
+                "dur": record.duration * 1e6,
+                "pid": pid,
+                "tid": 0,
+                "args": args,
+            })
+        with open(fname, "w") as fout:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fout)
+
+
+def profiling_enabled() -> bool:
+    """
+    Whether a :class:`SweepProfiler` is active.
+    """
+    return _active is not None
+
+
+def profile_phase(name: str, site=None):
+    """
+    The context manager of a phase of the sweep.
+
+    Parameters
+    ----------
+    name : str
+        The name of the phase, such as ``"environ"`` or ``"eigensolver"``.
+    site : int or list of int, optional
+        The site (or the sites in the two-site algorithms) being processed.
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _Phase(_active, name, site)
+
+
+def profile_count(name: str, n=1):
+    """
+    Increase the counter ``name`` by ``n``, both for the innermost open phase
+    and for the whole profiler.
+    """
+    if _active is None:
+        return
+    _active.counters[name] += n
+    if _active._stack:
+        counters = _active._stack[-1].counters
+        counters[name] = counters.get(name, 0) + n
+
+
+def profile_flops(flops):
+    """
+    Add the estimated number of floating point operations to the innermost open phase.
+    """
+    if _active is None or not _active._stack:
+        return
+    _active._stack[-1].flops += int(flops)
+
+
+def profile_bytes(*tensors):
+    """
+    Report a set of tensors that are simultaneously alive in the innermost open phase.
+    The peak bytes of the phase is the maximum of the total bytes of the reported sets.
+
+    Parameters
+    ----------
+    tensors : arrays, int or (nested) lists of them
+        The tensors, or the number of bytes directly.
+    """
+    if _active is None or not _active._stack:
+        return
+    record = _active._stack[-1]
+    record.peak_bytes = max(record.peak_bytes, _nbytes(tensors))
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only store of time series results.
+
+The store is a directory::
+
+    header.json     # keys, dtypes, row shapes and the number of committed rows
+    static.npz      # numerical data that is not a time series
+    static.json     # other data that is not a time series, such as a dict
+    series_0.bin    # raw rows of the first time series
+    series_1.bin
+    ...
+
+Each row is appended to the end of the ``.bin`` file, and the header is atomically replaced
+afterwards, so the cost of dumping a step does not grow with the number of steps.
+The rows beyond the committed number (caused by shutdown while dumping) are ignored.
+The store can be read by :class:`ResultStoreReader` while it is being written.
+No pickled objects are stored. In ``static.json`` the tuples are converted to lists,
+the keys of dicts to strings and the complex numbers to ``[real, imag]``.
+"""
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+HEADER = "header.json"
+STATIC = "static.npz"
+STATIC_JSON = "static.json"
+VERSION = 1
+
+
+def _write_atomic(path, write_func):
+    tmp_path = path + ".tmp"
+    write_func(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _json_default(obj):
+    # the objects that are not JSON serializable
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, complex):
+        return [obj.real, obj.imag]
+    raise TypeError(f"Object of type {type(obj)} can not be stored in the result store")
+
+
+def _read_static_json(directory):
+    path = os.path.join(directory, STATIC_JSON)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fin:
+        return json.load(fin)
+
+
+class ResultStore:
+    """
+    Writer of the result store.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the store.
+    mode : str
+        ``"w"``: create a new store and remove the old one if exists.
+        ``"a"``: append to the existing store.
+    chunk_size : int
+        Number of rows buffered in the memory before they are written to the disk.
+    """
+
+    def __init__(self, directory, mode="w", chunk_size=1):
+        assert mode in ["w", "a"]
+        self.directory = directory
+        self.chunk_size = chunk_size
+        if mode == "w" and os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory, exist_ok=True)
+        if mode == "a" and os.path.exists(os.path.join(directory, HEADER)):
+            with open(os.path.join(directory, HEADER)) as fin:
+                self.header = json.load(fin)
+            self._truncate_uncommitted()
+        else:
+            self.header = {"version": VERSION, "series": {}, "static": []}
+            self._write_header()
+        self._buffer = {}
+
+    def _fname(self, key):
+        return os.path.join(self.directory, self.header["series"][key]["fname"])
+
+    def _truncate_uncommitted(self):
+        for key, info in self.header["series"].items():
+            row_nbytes = np.dtype(info["dtype"]).itemsize * int(np.prod(info["shape"]))
+            with open(self._fname(key), "ab") as fout:
+                fout.truncate(row_nbytes * info["nrows"])
+
+    def _write_header(self):
+        def write_func(path):
+            with open(path, "w") as fout:
+                json.dump(self.header, fout)
+        _write_atomic(os.path.join(self.directory, HEADER), write_func)
+
+    def append(self, series, static=None):
+        """
+        Append rows of the time series.
+
+        Parameters
+        ----------
+        series : dict
+            The key is the name of the time series, and the value is the new rows.
+            The first axis of the value is the row index.
+        static : dict
+            Data that is not a time series. Overwrites the old data with the same key.
+            The numerical arrays are stored in ``static.npz`` and the others in ``static.json``.
+        """
+        for key, rows in series.items():
+            rows = np.asarray(rows)
+            if rows.dtype.hasobject:
+                raise ValueError(f"Object array {key} can not be stored as time series")
+            if key not in self.header["series"]:
+                fname = f"series_{len(self.header['series'])}.bin"
+                self.header["series"][key] = {
+                    "fname": fname,
+                    "dtype": rows.dtype.str,
+                    "shape": list(rows.shape[1:]),
+                    "nrows": 0,
+                }
+                open(self._fname(key), "wb").close()
+            info = self.header["series"][key]
+            if list(rows.shape[1:]) != info["shape"]:
+                raise ValueError(f"The shape of {key} changed from {info['shape']} to {list(rows.shape[1:])}")
+            self._buffer.setdefault(key, []).append(rows.astype(info["dtype"], copy=False))
+        if static:
+            self._write_static(static)
+        if self.chunk_size <= max([sum(len(rows) for rows in v) for v in self._buffer.values()], default=0):
+            self.flush()
+
+    def _write_static(self, static):
+        arrays = {}
+        objects = {}
+        for key, value in static.items():
+            array = np.asarray(value)
+            if array.dtype.hasobject:
+                objects[key] = value.item() if isinstance(value, np.ndarray) else value
+            else:
+                arrays[key] = array
+
+        path = os.path.join(self.directory, STATIC)
+        old_arrays = {}
+        if os.path.exists(path):
+            with np.load(path) as f:
+                old_arrays = dict(f)
+        old_objects = _read_static_json(self.directory)
+        # a key may change from an array to an object or vice versa
+        moved_to_arrays = [old_objects.pop(key) for key in arrays if key in old_objects]
+        moved_to_objects = [old_arrays.pop(key) for key in objects if key in old_arrays]
+        old_arrays.update(arrays)
+        old_objects.update(objects)
+
+        # only the changed file is written
+        if arrays or moved_to_objects:
+            def write_npz(tmp_path):
+                with open(tmp_path, "wb") as fout:
+                    np.savez(fout, **old_arrays)
+            _write_atomic(path, write_npz)
+        if objects or moved_to_arrays:
+            def write_json(tmp_path):
+                with open(tmp_path, "w") as fout:
+                    json.dump(old_objects, fout, default=_json_default)
+            _write_atomic(os.path.join(self.directory, STATIC_JSON), write_json)
+
+        self.header["static"] = sorted(list(old_arrays.keys()) + list(old_objects.keys()))
+        self._write_header()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        for key, rows_list in self._buffer.items():
+            rows = np.concatenate(rows_list)
+            with open(self._fname(key), "ab") as fout:
+                fout.write(np.ascontiguousarray(rows).tobytes())
+                fout.flush()
+            self.header["series"][key]["nrows"] += len(rows)
+        self._buffer.clear()
+        # commit the rows
+        self._write_header()
+
+    def close(self):
+        self.flush()
+
+
+class ResultStoreReader:
+    """
+    Reader of the result store. The time series are memory-mapped.
+    Can be used while the store is being written.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the store.
+
+    Examples
+    --------
+    Stream the results of a running job::
+
+        reader = ResultStoreReader("dump_dir/job_name.steps")
+        while True:
+            new_rows = reader.read_new()
+            ...
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.header = None
+        self._nrows_read = {}
+        self.refresh()
+
+    def refresh(self):
+        with open(os.path.join(self.directory, HEADER)) as fin:
+            self.header = json.load(fin)
+
+    def keys(self):
+        return list(self.header["series"].keys()) + list(self.header["static"])
+
+    def nrows(self, key):
+        return self.header["series"][key]["nrows"]
+
+    def __getitem__(self, key):
+        if key in self.header["series"]:
+            return self._read_rows(key, 0)
+        if key not in self.header["static"]:
+            raise KeyError(key)
+        objects = _read_static_json(self.directory)
+        if key in objects:
+            return objects[key]
+        with np.load(os.path.join(self.directory, STATIC)) as f:
+            return f[key]
+
+    def _read_rows(self, key, start):
+        info = self.header["series"][key]
+        shape = tuple(info["shape"])
+        nrows = info["nrows"]
+        if nrows == 0:
+            return np.zeros((0,) + shape, dtype=info["dtype"])
+        mm = np.memmap(os.path.join(self.directory, info["fname"]), dtype=info["dtype"],
+                       mode="r", shape=(nrows,) + shape)
+        return mm[start:]
+
+    def read_new(self):
+        """
+        Refresh the header and read the rows committed since the last call.
+
+        Returns
+        -------
+        new_rows : dict
+            The key is the name of the time series and the value is the new rows.
+        """
+        self.refresh()
+        new_rows = {}
+        for key in self.header["series"]:
+            start = self._nrows_read.get(key, 0)
+            new_rows[key] = self._read_rows(key, start)
+            self._nrows_read[key] = self.nrows(key)
+        return new_rows
+
+    def to_dict(self):
+        """
+        Read all data into a ``dict``. The time series are read into the memory.
+        """
+        d = {}
+        for key in self.keys():
+            value = self[key]
+            d[key] = np.array(value) if key in self.header["series"] else value
+        return d
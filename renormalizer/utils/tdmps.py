@@ -6,17 +6,90 @@
 import json
 import os
 import logging
+import queue
+import threading
 from datetime import datetime
 
 import numpy as np
 
 # this file shouldn't import anything from the `mps` module. IOW it's mps agnostic
 from renormalizer.utils.configs import EvolveConfig
+from renormalizer.utils.result_store import ResultStore, ResultStoreReader
 
 logger = logging.getLogger(__name__)
 
 
+class AsyncDumper:
+    """
+    Write the dumped files in a background thread, so that the evolution
+    of the next step is not blocked by the file system.
+    The submitted jobs are executed in order.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of pending jobs. If the writer falls behind, ``submit`` blocks.
+    """
+    def __init__(self, maxsize=2):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except IOError:  # never quit calculation because of IOError
+                logger.exception("dumping dict failed with IOError")
+            except Exception:
+                logger.exception("dumping dict failed")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args):
+        self._queue.put((func, args))
+
+    def wait(self):
+        # wait for all pending jobs to finish
+        self._queue.join()
+
+
+def _static_equal(a, b):
+    try:
+        return bool(np.array_equal(a, b))
+    except (ValueError, TypeError):
+        # objects that can not be compared, such as dicts of arrays
+        return False
+
+
+def load_dump_steps(directory):
+    """
+    Load the results dumped by :class:`TdMpsJob` with ``dump_append=True``.
+    Can be called while the job is running.
+    Use :class:`~renormalizer.utils.result_store.ResultStoreReader` to stream the new steps.
+
+    Parameters
+    ----------
+    directory : str
+        The ``job_name.steps`` directory in ``dump_dir``.
+
+    Returns
+    -------
+    d : dict
+        The static data and the time series data.
+    """
+    return ResultStoreReader(directory).to_dict()
+
+
 class TdMpsJob(object):
+    # The keys of ``get_dump_dict`` whose values are time series, i.e., lists (or arrays)
+    # that are only appended. With ``dump_append``, only the new rows of these keys are dumped.
+    # A scalar that changes every step, such as the total time, is also a time series,
+    # with one row appended per dump.
+    # The other keys are static data and written only if they are changed
+    dump_series_keys = ()
+
     def __init__(self, evolve_config: EvolveConfig = None, dump_mps: str=None, dump_dir: str=None, job_name: str=None):
         logger.info(f"Creating TDMPS job. dump_dir: {dump_dir}. job_name: {job_name}")
         if evolve_config is None:
@@ -39,6 +112,16 @@ class TdMpsJob(object):
         self._dump_mps = None
         self.dump_dir = dump_dir
         self.job_name = job_name
+        # write the dumped files in a background thread
+        self.async_dump = False
+        # only append the data of the new step to the result store ``job_name.steps``.
+        # See ``dump_series_keys`` and ``load_dump_steps``
+        self.dump_append = False
+        self._dumper = None
+        self._result_store = None
+        self._dumped_static = {}
+        # the number of rows of each time series that have been dumped
+        self._dumped_rows = None
         mps = self.init_mps()
         logger.info(f"Initial MPS: {str(mps)}")
         if mps is None:
@@ -156,6 +239,10 @@ class TdMpsJob(object):
                 dump_wall_time = datetime.now()
                 logger.info(f"Dumping time cost {dump_wall_time - evolution_wall_time}")
 
+        if self._dumper is not None:
+            self._dumper.wait()
+            logger.info(f"Dumping finished at {datetime.now()}")
+
         logger.info(f"{len(wall_times)-1} steps of evolution complete!")
         logger.info(
             "Normal termination. Time cost: %s" % (wall_times[-1] - wall_times[0])
@@ -181,8 +268,65 @@ class TdMpsJob(object):
     def dump_dict(self):
         if not self._defined_output_path:
             raise ValueError("Dump dir or job name not set")
-        d = self.get_dump_dict()
         os.makedirs(self.dump_dir, exist_ok=True)
+        d = self.get_dump_dict()
+
+        # dump_mps
+        mps_path = None
+        if self._dump_mps is not None:
+            if self._dump_mps == "all":
+                mps_path = os.path.join(self.dump_dir,
+                        self.job_name+"_mps_"+str(len(self.evolve_times)-1) + ".npz")
+            else:
+                mps_path = os.path.join(self.dump_dir,
+                        self.job_name+"_mps" + ".npz")
+
+        if self.dump_append:
+            args = (self._new_step_record(d), self.latest_mps, mps_path)
+            func = self._write_step_record
+        else:
+            # take a snapshot because the lists in the dict are appended in the next step
+            d = {k: np.array(v) for k, v in d.items()}
+            args = (d, self.latest_mps, mps_path)
+            func = self._write_dump_dict
+
+        if self.async_dump:
+            # `self.latest_mps` is not modified in place in the evolution,
+            # thus it is safe to dump it in the background
+            if self._dumper is None:
+                self._dumper = AsyncDumper()
+            self._dumper.submit(func, *args)
+        else:
+            func(*args)
+
+    def _new_step_record(self, d):
+        # split the dict into the new rows of the time series and the changed static data.
+        # Only the new rows are copied, so the cost does not grow with the number of steps.
+        # A new job overwrites the old store
+        new_store = self._dumped_rows is None
+        if new_store:
+            self._dumped_rows = {}
+        record_static = {}
+        record_series = {}
+        for k, v in d.items():
+            if k in self.dump_series_keys:
+                if np.isscalar(v) or (isinstance(v, np.ndarray) and v.ndim == 0):
+                    record_series[k] = np.array([v])
+                    continue
+                start = self._dumped_rows.get(k, 0)
+                if len(v) == start:
+                    continue
+                record_series[k] = np.array(v[start:])
+                self._dumped_rows[k] = len(v)
+            else:
+                v = np.array(v)
+                if k in self._dumped_static and _static_equal(self._dumped_static[k], v):
+                    continue
+                record_static[k] = v
+                self._dumped_static[k] = v
+        return record_static, record_series, new_store
+
+    def _write_dump_dict(self, d, mps, mps_path):
         file_path = os.path.join(self.dump_dir, self.job_name + ".npz")
         bak_path = file_path + ".bak"
         if os.path.exists(file_path):
@@ -196,16 +340,19 @@ class TdMpsJob(object):
         if os.path.exists(bak_path):
             os.remove(bak_path)
 
-        # dump_mps
-        if self._dump_mps is not None:
-            if self._dump_mps == "all":
-                mps_path = os.path.join(self.dump_dir,
-                        self.job_name+"_mps_"+str(len(self.evolve_times)-1) + ".npz")
-            else:
-                mps_path = os.path.join(self.dump_dir,
-                        self.job_name+"_mps" + ".npz")
-            self.latest_mps.dump(mps_path)
-            
+        if mps_path is not None:
+            mps.dump(mps_path)
+
+    def _write_step_record(self, record, mps, mps_path):
+        record_static, record_series, new_store = record
+        if new_store or self._result_store is None:
+            mode = "w" if new_store else "a"
+            directory = os.path.join(self.dump_dir, self.job_name + ".steps")
+            self._result_store = ResultStore(directory, mode)
+        self._result_store.append(record_series, record_static)
+
+        if mps_path is not None:
+            mps.dump(mps_path)
 
     def stop_evolve_criteria(self):
         return False
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from renormalizer.mps.gs import construct_mps_mpo, optimize_mps
+from renormalizer.tests.parameter import holstein_model
+from renormalizer.utils import SweepProfiler, EvolveConfig, EvolveMethod
+from renormalizer.utils import profiler as profiler_module
+from renormalizer.utils.profiler import profile_phase, profile_count, profile_flops, profile_bytes
+
+
+def test_disabled():
+    assert not profiler_module.profiling_enabled()
+    with profile_phase("foo", site=0) as phase:
+        profile_count("bar")
+        profile_flops(10)
+        profile_bytes(100)
+    assert phase is profiler_module._NULL_PHASE
+
+
+def test_nested():
+    with SweepProfiler() as outer:
+        with profile_phase("foo"):
+            profile_flops(10)
+            with SweepProfiler() as inner:
+                with profile_phase("bar", site=[1, 2]):
+                    profile_count("hop_vectors", 3)
+            # the outer profiler is restored
+            with profile_phase("bar", site=[1]):
+                profile_flops(5)
+                profile_bytes(64, [16, 16])
+    assert not profiler_module.profiling_enabled()
+    summary = inner.summary()
+    assert summary["bar"][(1, 2)]["counters"] == {"hop_vectors": 3}
+    summary = outer.summary()
+    assert summary["bar"][1]["flops"] == 5
+    assert summary["bar"][1]["peak_bytes"] == 96
+    # inclusive
+    assert summary["foo"][None]["flops"] == 15
+    assert summary["foo"][None]["peak_bytes"] == 96
+
+
+def test_sweep(tmp_path):
+    mps, mpo = construct_mps_mpo(holstein_model, 10, 1)
+    mps.optimize_config.procedure = [[10, 0.4], [20, 0]]
+    mps.optimize_config.method = "2site"
+    with SweepProfiler() as profiler:
+        optimize_mps(mps, mpo)
+        mps.evolve_config = EvolveConfig(EvolveMethod.tdvp_ps)
+        mps.evolve(mpo, 0.1)
+    summary = profiler.summary()
+    for name in ["environ", "qn_mask", "eigensolver", "svd", "propagate", "propagate_bond"]:
+        assert name in summary
+    eigensolver = summary["eigensolver"]
+    assert (0, 1) in eigensolver
+    assert all(item["flops"] > 0 for item in eigensolver.values())
+    assert all(item["peak_bytes"] > 0 for item in eigensolver.values())
+    assert 0 < profiler.counters["hop_vectors"]
+
+    fname = str(tmp_path / "profile.json")
+    profiler.dump_json(fname)
+    with open(fname) as fin:
+        data = json.load(fin)
+    assert len(data["phases"]) == len(profiler.records)
+    assert data["counters"]["hop_vectors"] == profiler.counters["hop_vectors"]
+
+    fname = str(tmp_path / "trace.json")
+    profiler.dump_chrome_trace(fname)
+    with open(fname) as fin:
+        events = json.load(fin)["traceEvents"]
+    assert len(events) == len(profiler.records)
+    assert {event["ph"] for event in events} == {"X"}
+    assert events == sorted(events, key=lambda e: e["ts"])
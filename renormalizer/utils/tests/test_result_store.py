@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+
+from renormalizer.utils.result_store import ResultStore, ResultStoreReader
+
+
+def test_result_store(tmpdir):
+    directory = os.path.join(tmpdir, "store")
+    store = ResultStore(directory, chunk_size=2)
+    reader = None
+    values = np.random.rand(5, 3) + 1j
+    for i in range(5):
+        store.append({"time": [i * 0.1], "values": values[i:i+1]}, {"nsteps": i + 1})
+        if reader is None:
+            reader = ResultStoreReader(directory)
+    # only the chunks written are visible
+    new_rows = reader.read_new()
+    assert len(new_rows["values"]) == 4
+    assert np.allclose(new_rows["values"], values[:4])
+    store.close()
+    new_rows = reader.read_new()
+    assert np.allclose(new_rows["values"], values[4:])
+    assert reader["nsteps"] == 5
+
+    # non-numerical static data is stored as JSON rather than pickled
+    store.append({}, {"info": {"model": [("a", 1)]}})
+    reader.refresh()
+    assert reader["info"] == {"model": [["a", 1]]}
+    with np.load(os.path.join(directory, "static.npz")) as f:
+        assert list(f.keys()) == ["nsteps"]
+
+    # uncommitted rows are discarded when the store is reopened
+    with open(os.path.join(directory, "series_1.bin"), "ab") as fout:
+        fout.write(b"\0" * 7)
+    store = ResultStore(directory, mode="a")
+    store.append({"time": [0.5], "values": values[:1]})
+    d = ResultStoreReader(directory).to_dict()
+    assert np.allclose(d["time"], np.arange(6) * 0.1)
+    assert np.allclose(d["values"], np.concatenate([values, values[:1]]))
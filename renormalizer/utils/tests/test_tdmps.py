@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import numpy as np
+import pytest
+
+from renormalizer.utils.tdmps import TdMpsJob, load_dump_steps
+
+
+class DummyMps:
+    def __init__(self, value):
+        self.value = value
+
+    def dump(self, path):
+        np.savez(path, value=self.value)
+
+
+class DummyJob(TdMpsJob):
+    dump_series_keys = ("time series", "values", "latest value")
+
+    def __init__(self, dump_dir):
+        self.values = []
+        super().__init__(dump_mps="one", dump_dir=dump_dir, job_name="dummy")
+
+    def init_mps(self):
+        return DummyMps(0)
+
+    def process_mps(self, mps):
+        self.values.append([mps.value, mps.value ** 2])
+
+    def evolve_single_step(self, evolve_dt):
+        return DummyMps(self.latest_mps.value + evolve_dt)
+
+    def get_dump_dict(self):
+        return {"time series": self.evolve_times, "values": self.values, "nsteps": len(self.evolve_times),
+                "latest value": self.values[-1][0], "info": {"dt": 1, "name": ("dummy", 1j)}}
+
+
+@pytest.mark.parametrize("async_dump", (True, False))
+@pytest.mark.parametrize("dump_append", (True, False))
+def test_dump(tmpdir, async_dump, dump_append):
+    job = DummyJob(str(tmpdir))
+    job.async_dump = async_dump
+    job.dump_append = dump_append
+    job.evolve(1, 10)
+    expected = job.get_dump_dict()
+    if dump_append:
+        d = load_dump_steps(os.path.join(tmpdir, "dummy.steps"))
+    else:
+        d = np.load(os.path.join(tmpdir, "dummy.npz"))
+    for k in ["time series", "values", "nsteps"]:
+        assert np.allclose(d[k], expected[k])
+    if dump_append:
+        # one row per dump
+        assert np.allclose(d["latest value"], np.arange(1, 11))
+        # stored without pickle
+        assert d["info"] == {"dt": 1, "name": ["dummy", [0, 1]]}
+    assert not os.path.exists(os.path.join(tmpdir, "dummy.npz.bak"))
+    assert np.load(os.path.join(tmpdir, "dummy_mps.npz"))["value"] == 10
+
+
+def test_dump_append_new_rows(tmpdir):
+    job = DummyJob(str(tmpdir))
+    job.dump_append = True
+    job.evolve(1, 3)
+    # only the rows of the new step are in the record
+    job.evolve_times.append(4)
+    job.values.append([4, 16])
+    record_static, record_series, new_store = job._new_step_record(job.get_dump_dict())
+    assert not new_store
+    assert np.allclose(record_series["time series"], [4])
+    assert np.allclose(record_series["values"], [[4, 16]])
+    assert np.allclose(record_series["latest value"], [4])
+    assert record_static == {"nsteps": 5}
@@ -10,10 +10,9 @@ import numpy as np
 import os
 
 
-def test_harmonic_potential():
-    w0 = np.load(os.path.join(cur_dir,"w0.npy"))
+def harmonic_model(w0, w_basis, nbas=20):
     nmodes = len(w0)
-    
+
     # construct the model
     ham_terms = []
     # kinetic
@@ -27,16 +26,23 @@ def test_harmonic_potential():
     
     basis = []
     for imode in range(nmodes):
-        basis.append(ba.BasisSHO(f"v_{imode}", w0[imode], 20))
-    
-    model = Model(basis, ham_terms)
+        basis.append(ba.BasisSHO(f"v_{imode}", w_basis[imode], nbas))
+
+    return Model(basis, ham_terms)
+
+
+def test_harmonic_potential():
+    w0 = np.load(os.path.join(cur_dir,"w0.npy"))
+    nmodes = len(w0)
+    model = harmonic_model(w0, w0)
     scf = Vscf(model)
     scf.kernel()
     for imode in range(nmodes):
         np.testing.assert_allclose(scf.e[imode]-np.sum(w0)/2, w0[imode]*np.arange(20), atol=1e-10)
 
 
-def test_1mr():
+@pytest.mark.parametrize("diis", [False, True])
+def test_1mr(diis):
     w0 = np.load(os.path.join(cur_dir,"w0.npy"))
     nmodes = len(w0)
     
@@ -68,7 +74,7 @@ def test_1mr():
     
     model = Model(basis, ham_terms)
     scf = Vscf(model)
-    scf.kernel()
+    assert scf.kernel(diis=diis)
     vscf_c_1mr = np.load(os.path.join(cur_dir, "vscf_c_1MR.npz"))
     vscf_e_1mr = np.load(os.path.join(cur_dir, "vscf_e_1MR.npz"))
 
@@ -82,3 +88,18 @@ def test_1mr():
             np.testing.assert_allclose(diff, 0, atol=1e-2)
         np.testing.assert_allclose(scf.e[imode][:n_states], vscf_e_1mr[f"arr_{imode}"][:n_states], atol=1e-4)
 
+
+
+def test_batch_kernel():
+    w0 = np.load(os.path.join(cur_dir,"w0.npy"))
+    nmodes = len(w0)
+    # the harmonic potential with scaled frequencies in the same basis
+    models = [harmonic_model(w0 * scale, w0) for scale in [0.9, 1, 1.1]]
+    e, c, converged = Vscf.batch_kernel(models)
+    assert np.all(converged)
+    for ib, model in enumerate(models):
+        scf = Vscf(model)
+        scf.kernel()
+        for imode in range(nmodes):
+            np.testing.assert_allclose(e[imode][ib], scf.e[imode], atol=1e-10)
+            np.testing.assert_allclose(np.abs(c[imode][ib][:, :4]), np.abs(scf.c[imode][:, :4]), atol=1e-6)
@@ -1,23 +1,23 @@
 
 import numpy as np
-import scipy
 import logging
 
-from renormalizer.mps.backend import xp, OE_BACKEND
-from renormalizer.mps.lib import Environ, cvec2cmat
+from renormalizer.model import Model
 from renormalizer.mps import Mpo, Mps
 from renormalizer.mps.svd_qn import get_qn_mask
-from renormalizer.mps.matrix import asnumpy, asxp
+from renormalizer.mps.matrix import asnumpy
 from renormalizer.mps.oe_contract_wrap import oe_contract
-from renormalizer.utils import CompressConfig, CompressCriteria
 
 logger = logging.getLogger(__name__)
 
 class Vscf():
     r"""
-        Vibrational Self-Consistent Field 
-        
+        Vibrational Self-Consistent Field
+
         The algorithm is like a DMRG sweep.
+        Because the wavefunction is a Hartree product (bond dimension 1),
+        the environments are vectors over the MPO bond and the local Hamiltonian
+        is contracted directly into the quantum number allowed space.
     """
 
 
@@ -35,89 +35,250 @@ class Vscf():
             self.mps = Mps.hartree_product_state(self.model, dict())
         else:
             self.mps = mps
-    
-    def kernel(self, nsweeps=100):
+
+    def kernel(self, nsweeps=100, conv_tol=1e-8, diis=False, diis_space=6):
+        r"""
+        Run the VSCF sweeps.
+
+        Parameters
+        ----------
+        nsweeps : int
+            The maximum number of sweeps.
+        conv_tol : float
+            A mode is converged if the largest change of its mean-field Hamiltonian
+            since the last diagonalization is smaller than ``conv_tol``.
+            Converged modes are not diagonalized again and
+            the VSCF is converged if all modes are converged in a sweep.
+        diis : bool
+            Whether to extrapolate the ground state modals with DIIS.
+            Usually helpful when the modes are strongly coupled.
+        diis_space : int
+            The number of the DIIS vectors.
+
+        Returns
+        -------
+        converged : bool
+            Whether the VSCF is converged.
+        """
         mps = self.mps
-        mpo = self.h_mpo
+        masks = _qn_masks(mps)
+        modals = [mps[i].array.reshape(1, -1) for i in range(len(mps))]
+        mo_list = _stack_mpos([self.h_mpo])
 
-        # the default hartree_product_state is both L-/R- canonical
-        if mps.is_left_canonical:
-            mps.ensure_right_canonical()
-            env = "R"
-        else:
-            mps.ensure_left_canonical()
-            env = "L"
-        environ = Environ(mps, mpo, env)
-
-        converged = [False,]*len(mps)
-        # DIIS algorithm may make this sweep converge more quickly
-        for isweep in range(nsweeps):
-            if isweep != 0:
-                latest_c = [x.copy() for x in self.c]
-                latest_e = [x.copy() for x in self.e]
-
-            logger.info(f"isweep:{isweep}")
-            for imps in mps.iter_idx_list(full=True):
-                if mps.to_right:
-                    lmethod, rmethod = "System", "Enviro"
+        e, c, converged = _vscf_sweeps(mo_list, masks, modals, nsweeps, conv_tol,
+                                       diis_space if diis else 0)
+        self.e = [x[0] for x in e]
+        self.c = [x[0] for x in c]
+        # the converged Hartree product
+        for imps in range(len(mps)):
+            mps[imps] = self.c[imps][:, 0].reshape(1, -1, 1)
+        return bool(converged[0])
+
+    @classmethod
+    def batch_kernel(cls, hams, model=None, nsweeps=100, conv_tol=1e-8, diis=False, diis_space=6):
+        r"""
+        Run VSCF for a batch of Hamiltonians sharing the same basis,
+        such as the PES at many geometries. The sweeps of all Hamiltonians are
+        performed together with stacked tensors and batched diagonalizations.
+
+        Parameters
+        ----------
+        hams : list
+            The Hamiltonians as :class:`~renormalizer.model.Model` or :class:`~renormalizer.mps.Mpo`.
+        model : :class:`~renormalizer.model.Model`
+            The model that defines the basis and the initial Hartree product state.
+            Could be omitted if the first element of ``hams`` is a model.
+        nsweeps, conv_tol, diis, diis_space :
+            See :meth:`kernel`.
+
+        Returns
+        -------
+        e : list of np.ndarray
+            The modal energies of each mode with shape ``(nbatch, nstates)``.
+        c : list of np.ndarray
+            The modal coefficients of each mode with shape ``(nbatch, nbas, nstates)``.
+        converged : np.ndarray
+            Whether the VSCF of each Hamiltonian is converged.
+        """
+        if model is None:
+            model = hams[0]
+            assert isinstance(model, Model)
+        mpos = []
+        for ham in hams:
+            if isinstance(ham, Model):
+                if "h_mpo" in ham.mpos.keys():
+                    ham = ham.mpos["h_mpo"]
                 else:
-                    lmethod, rmethod = "Enviro", "System"
-                
-                lidx = imps - 1
-                cidx = [imps]
-                ridx = imps + 1
-                
-                logger.debug(f"optimize site: {cidx}")
-                
-                ltensor = environ.GetLR("L", lidx, mps, mpo, itensor=None, method=lmethod)
-                rtensor = environ.GetLR("R", ridx, mps, mpo, itensor=None, method=rmethod)
-                
-                # get the quantum number pattern
-                qnbigl, qnbigr, qnmat = mps._get_big_qn(cidx)
-                qn_mask = get_qn_mask(qnmat, mps.qntot)
-
-                # center mo
-                cmo = [asxp(mpo[idx]) for idx in cidx]
-
-                # S-a   l-S
-                #     d
-                # O-b-O-f-O
-                #     e
-                # S-c   k-S
-                ham = oe_contract(
-                    "abc,bdef,lfk->adlcek",
-                    ltensor, cmo[0], rtensor,
-                    backend=OE_BACKEND
-                )
-                ham = ham[:, :, :, qn_mask][qn_mask, :]
-                
-                w, v = scipy.linalg.eigh(asnumpy(ham))
-                # update modal energy
-                self.e[imps] = w
-
-                cstruct = cvec2cmat(v, qn_mask, nroots=len(w))
-                mps.compress_config = CompressConfig(CompressCriteria.fixed,
-                        max_bonddim=1)
-                mps._update_mps(cstruct[0], cidx, qnbigl, qnbigr, 0)
-
-                for cs in cstruct:
-                    assert cs.shape == mps[imps].shape
-                self.c[imps] = np.stack([x.ravel() for x in cstruct], axis=-1)               
-                
-                # check convergence       
-                if isweep != 0:
-                    converged[imps] = np.allclose(self.c[imps], latest_c[imps]) \
-                        and np.allclose(self.e[imps], latest_e[imps])
-            if np.all(converged):
-                logger.info("vscf is converged!")
-                break
-
-            mps._switch_direction()
-            
-                    
-            
-
-
-        
+                    ham = Mpo(ham, algo="Hopcroft-Karp")
+            mpos.append(ham)
+        mps = Mps.hartree_product_state(model, dict())
+        masks = _qn_masks(mps)
+        modals = [np.repeat(mps[i].array.reshape(1, -1), len(mpos), axis=0) for i in range(len(mps))]
+        mo_list = _stack_mpos(mpos)
+        return _vscf_sweeps(mo_list, masks, modals, nsweeps, conv_tol, diis_space if diis else 0)
+
+
+def _qn_masks(mps):
+    # the quantum number allowed local states of each site.
+    # The bond dimension is 1, so the mask does not change during the sweeps
+    masks = []
+    for imps in range(len(mps)):
+        mps.move_qnidx(imps)
+        _, _, qnmat = mps._get_big_qn([imps])
+        masks.append(get_qn_mask(qnmat, mps.qntot).reshape(-1))
+    return masks
+
+
+def _stack_mpos(mpos):
+    # stack the site tensors of the MPOs with a leading batch index.
+    # The virtual bonds are padded with zeros to the largest bond dimension, which is exact
+    mo_list = []
+    for isite in range(len(mpos[0])):
+        arrays = [asnumpy(mpo[isite].array) for mpo in mpos]
+        shape = np.max([a.shape for a in arrays], axis=0)
+        stacked = np.zeros((len(arrays),) + tuple(shape), dtype=np.result_type(*arrays))
+        for ib, a in enumerate(arrays):
+            stacked[ib, :a.shape[0], :, :, :a.shape[3]] = a
+        mo_list.append(stacked)
+    return mo_list
+
+
+def _environ_step(env, mo, modal, to_right):
+    #     d
+    # Z-b-O-f   (to the right)
+    #     e
+    if to_right:
+        return oe_contract("zb,zd,zbdef,ze->zf", env, modal.conj(), mo, modal, backend="numpy")
+    else:
+        return oe_contract("zf,zd,zbdef,ze->zb", env, modal.conj(), mo, modal, backend="numpy")
+
+
+def _vscf_sweeps(mo_list, masks, modals, nsweeps, conv_tol, diis_space):
+    # The sweeps for a batch of Hamiltonians.
+    # mo_list: site tensors with shape (nbatch, l, d, d, r).
+    # masks: quantum number masks of each site with shape (d,).
+    # modals: the initial ground state modals of each site with shape (nbatch, d).
+    nsite = len(mo_list)
+    nbatch = mo_list[0].shape[0]
+    dtype = np.result_type(*mo_list, *modals)
+    modals = [m.astype(dtype) for m in modals]
+
+    e = [np.zeros((nbatch, m.sum())) for m in masks]
+    c = [np.zeros((nbatch, len(m), m.sum()), dtype=dtype) for m in masks]
+    # the mean-field Hamiltonian at the last diagonalization of each site
+    h_last = [None] * nsite
+
+    l_env = [np.ones((nbatch, 1), dtype=dtype)] + [None] * nsite
+    r_env = [None] * nsite + [np.ones((nbatch, 1), dtype=dtype)]
+    for imps in reversed(range(nsite)):
+        r_env[imps] = _environ_step(r_env[imps+1], mo_list[imps], modals[imps], False)
+
+    diis = _Diis(diis_space) if diis_space else None
+    converged = np.zeros(nbatch, dtype=bool)
+    for isweep in range(nsweeps):
+        logger.info(f"isweep:{isweep}")
+        to_right = isweep % 2 == 0
+        if to_right:
+            modals_old = [m.copy() for m in modals]
+        nupdated = np.zeros(nbatch, dtype=int)
+        for imps in (range(nsite) if to_right else reversed(range(nsite))):
+            mask_idx = np.nonzero(masks[imps])[0]
+            # S-a   l-S
+            #     d
+            # O-b-O-f-O
+            #     e
+            # S-c   k-S
+            # with a, c, l, k of dimension 1
+            h = oe_contract("zb,zbdef,zf->zde", l_env[imps], mo_list[imps], r_env[imps+1], backend="numpy")
+            h = h[:, mask_idx][:, :, mask_idx]
+            if h_last[imps] is None:
+                todo = np.arange(nbatch)
+            else:
+                diff = np.abs(h - h_last[imps]).reshape(nbatch, -1).max(axis=1)
+                todo = np.nonzero(conv_tol < diff)[0]
+            logger.debug(f"optimize site: {imps}, number of unconverged Hamiltonians: {len(todo)}")
+
+            if len(todo) != 0:
+                _update_modal(h, todo, imps, mask_idx, modals, e, c, h_last)
+                nupdated[todo] += 1
+
+            if to_right:
+                l_env[imps+1] = _environ_step(l_env[imps], mo_list[imps], modals[imps], True)
+            else:
+                r_env[imps] = _environ_step(r_env[imps+1], mo_list[imps], modals[imps], False)
+
+        converged = nupdated == 0
+        if np.all(converged):
+            logger.info("vscf is converged!")
+            break
+
+        # DIIS extrapolation after each round trip (a left-to-right and a right-to-left sweep).
+        # The first round trip is skipped because it usually moves far away from the initial guess
+        if diis is not None and not to_right and 1 < isweep:
+            x = np.concatenate(modals, axis=1)
+            err = x - np.concatenate(modals_old, axis=1)
+            x_new = diis.update(x, err)
+            x_new[converged] = x[converged]
+            modals = np.split(x_new, np.cumsum([len(m) for m in masks])[:-1], axis=1)
+            modals = [m / np.linalg.norm(m, axis=1, keepdims=True) for m in modals]
+            # The energies and the coefficients in the mean field of the extrapolated modals.
+            # The modals are replaced by the ground states, so that the returned values
+            # are consistent even if all modes are skipped in the next sweep
+            todo = np.nonzero(~converged)[0]
+            for imps in reversed(range(nsite)):
+                r_env[imps] = _environ_step(r_env[imps+1], mo_list[imps], modals[imps], False)
+            for imps in range(nsite):
+                mask_idx = np.nonzero(masks[imps])[0]
+                h = oe_contract("zb,zbdef,zf->zde", l_env[imps], mo_list[imps], r_env[imps+1], backend="numpy")
+                h = h[:, mask_idx][:, :, mask_idx]
+                l_env[imps+1] = _environ_step(l_env[imps], mo_list[imps], modals[imps], True)
+                _update_modal(h, todo, imps, mask_idx, modals, e, c, h_last)
+            # the environments for the next sweep
+            for imps in reversed(range(nsite)):
+                r_env[imps] = _environ_step(r_env[imps+1], mo_list[imps], modals[imps], False)
+    else:
+        logger.warning(f"vscf is not converged for {np.sum(~converged)} Hamiltonians")
+
+    return e, c, converged
+
+
+def _update_modal(h, todo, imps, mask_idx, modals, e, c, h_last):
+    # diagonalize the mean-field Hamiltonians `h` of site `imps` for the batch indices `todo`
+    # and update the modals, the energies and the coefficients in-place
+    w, v = np.linalg.eigh(h[todo])
+    # keep the phase of the ground state modal
+    overlap = np.einsum("zd,zd->z", modals[imps][todo][:, mask_idx].conj(), v[:, :, 0])
+    v[:, :, 0] *= np.where(overlap.real < 0, -1, 1)[:, None]
+    e[imps][todo] = w
+    c[imps][todo[:, None], mask_idx] = v
+    modals[imps][todo] = c[imps][todo, :, 0]
+    if h_last[imps] is None:
+        h_last[imps] = h.copy()
+    else:
+        h_last[imps][todo] = h[todo]
+
 
+class _Diis:
+    # Pulay's DIIS extrapolation for a batch of vectors
+    def __init__(self, space):
+        self.space = space
+        self.xs = []
+        self.errs = []
 
+    def update(self, x, err):
+        self.xs.append(x)
+        self.errs.append(err)
+        if self.space < len(self.xs):
+            self.xs.pop(0)
+            self.errs.pop(0)
+        n = len(self.xs)
+        if n < 2:
+            return x
+        errs = np.stack(self.errs, axis=1)
+        b = np.zeros((len(x), n+1, n+1))
+        b[:, :n, :n] = np.einsum("zid,zjd->zij", errs.conj(), errs).real
+        b[:, n, :n] = b[:, :n, n] = -1
+        rhs = np.zeros(n+1)
+        rhs[n] = -1
+        coef = np.einsum("zij,j->zi", np.linalg.pinv(b), rhs)[:, :n]
+        return np.einsum("zi,zid->zd", coef, np.stack(self.xs, axis=1))
@@ -105,6 +105,15 @@ class VibronicModelDynamics(TdMpsJob):
             self.autocorr_array.append(autocorr)
             self.autocorr_time.append(self.evolve_times[-1] + self.evolve_times[-1])
 
+    dump_series_keys = (
+        "time series",
+        "electron occupations array",
+        "autocorrelation function",
+        "autocorrelation time",
+        "energy",
+        "edof_rdm",
+    )
+
     def get_dump_dict(self):
         """
         :return: return a (ordered) dict to dump as json or npz